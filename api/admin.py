@@ -1,7 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
-from django.db.models import Count
 from .models import TelegramUser, Channel, Poll, Region, District, Candidate, Vote
 from django.urls import path
 from django.http import JsonResponse, HttpResponseRedirect
@@ -177,9 +176,7 @@ class PollAdmin(admin.ModelAdmin):
     
     def get_candidates_stats(self, obj):
         """Nomzodlarning ovoz statistikasini ko'rsatish"""
-        candidates = obj.candidates.annotate(
-            votes_count=Count('votes')
-        ).order_by('-votes_count').values('id', 'full_name', 'votes_count')
+        candidates = obj.candidates.order_by('-vote_count').values('id', 'full_name', 'vote_count')
         
         if not candidates.exists():
             return 'Nomzodlar mavjud emas'
@@ -189,7 +186,7 @@ class PollAdmin(admin.ModelAdmin):
         total = obj.total_votes if obj.total_votes > 0 else 1
         
         for candidate in candidates:
-            votes_count = candidate['votes_count']
+            votes_count = candidate['vote_count']
             percentage = (votes_count / total * 100) if total > 0 else 0
             # Color code based on percentage
             if percentage > 50:
@@ -293,7 +290,7 @@ class CandidateAdmin(admin.ModelAdmin):
     
     def get_vote_count_display(self, obj):
         """Ovozlar sonini rang bilan ko'rsatish"""
-        vote_count = obj.votes.count()
+        vote_count = obj.vote_count
         if vote_count == 0:
             color = '#999'
         elif vote_count < 5:
@@ -310,24 +307,15 @@ class CandidateAdmin(admin.ModelAdmin):
         if not obj.poll:
             return '-'
         
-        # Use values() to avoid property conflicts when iterating
-        candidates_with_votes = list(obj.poll.candidates.annotate(
-            votes_count=Count('votes')
-        ).order_by('-votes_count').values('id', 'votes_count'))
-        
-        rank = 1
-        for candidate_data in candidates_with_votes:
-            if candidate_data['id'] == obj.id:
-                if rank == 1:
-                    return format_html('<span style="color: gold; font-weight: bold;">🥇 {}</span>', rank)
-                elif rank == 2:
-                    return format_html('<span style="color: silver; font-weight: bold;">🥈 {}</span>', rank)
-                elif rank == 3:
-                    return format_html('<span style="color: #CD7F32; font-weight: bold;">🥉 {}</span>', rank)
-                else:
-                    return format_html('<span>{}</span>', rank)
-            rank += 1
-        return '-'
+        # Rank = 1 + candidates of the same poll with more votes (one COUNT on the counter column)
+        rank = obj.poll.candidates.filter(vote_count__gt=obj.vote_count).count() + 1
+        if rank == 1:
+            return format_html('<span style="color: gold; font-weight: bold;">🥇 {}</span>', rank)
+        elif rank == 2:
+            return format_html('<span style="color: silver; font-weight: bold;">🥈 {}</span>', rank)
+        elif rank == 3:
+            return format_html('<span style="color: #CD7F32; font-weight: bold;">🥉 {}</span>', rank)
+        return format_html('<span>{}</span>', rank)
     get_rank.short_description = 'Rang'
 
     def get_urls(self):
@@ -351,7 +339,8 @@ class CandidateAdmin(admin.ModelAdmin):
 
     def get_photo_preview(self, obj):
         if obj.photo:
-            return format_html('<img src="{}" width="100" height="100" style="object-fit: cover; border-radius: 8px;" />', obj.photo.url)
+            preview = obj.photo_thumb if obj.photo_thumb and obj.photo_variants_source == obj.photo.name else obj.photo
+            return format_html('<img src="{}" width="100" height="100" style="object-fit: cover; border-radius: 8px;" />', preview.url)
         return "Rasm yo'q"
     get_photo_preview.short_description = 'Rasm ko\'rinishi'
 
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from . import catalog, counters, snapshots
+        catalog.connect_signals()
+        counters.connect_signals()
+        snapshots.connect_signals()
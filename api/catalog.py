@@ -0,0 +1,225 @@
+"""In-process catalog of the poll -> region -> district -> candidate tree.
+
+The bot walks this hierarchy on every navigation step, but it practically
+never changes during a vote. The catalog is loaded with one query per
+level and kept in memory until it is invalidated:
+
+* in this process by post_save/post_delete of Poll, Region, District and
+  Candidate (connected in ApiConfig.ready);
+* in other processes through the 'catalog' CacheVersion row, which every
+  change bumps and which is re-read at most every
+  CATALOG_VERSION_CHECK_INTERVAL seconds.
+
+Only structure is cached; vote counts stay live (see attach_vote_counts).
+Payloads have the same shape as the bot-facing API responses, so both
+APIClient modes and the viewsets' compact responses are served from here.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+CATALOG_KEY = 'catalog'
+
+
+def _is_open(poll: dict) -> bool:
+    """Poll.is_open() ning kesh uchun nusxasi"""
+    if not poll['is_active']:
+        return False
+    now = timezone.now()
+    if poll['start_date'] and now < poll['start_date']:
+        return False
+    if poll['end_date'] and now > poll['end_date']:
+        return False
+    return True
+
+
+class Catalog:
+    """Bir versiyadagi katalog (o'zgarmas; yangilanganda butunlay almashtiriladi)"""
+
+    def __init__(self, version: int):
+        self.version = version
+        self.polls = []
+        self.regions_by_poll = {}
+        self.districts_by_region = {}
+        self.candidates_by_district = {}
+        self.candidates = {}
+        # poll_id -> poll row (dates and is_active): the open/closed schedule
+        self.schedule = {}
+
+    @classmethod
+    def load(cls, version: int) -> 'Catalog':
+        from .models import Poll, Region, District, Candidate
+
+        catalog = cls(version)
+        catalog.polls = list(Poll.objects.filter(is_active=True).values(
+            'id', 'title', 'start_date', 'end_date', 'is_active'
+        ))
+        catalog.schedule = {poll['id']: poll for poll in catalog.polls}
+        for region in Region.objects.filter(is_active=True).values('id', 'name', 'poll_id'):
+            catalog.regions_by_poll.setdefault(region['poll_id'], []).append(
+                {'id': region['id'], 'name': region['name']}
+            )
+        for district in District.objects.filter(is_active=True).values('id', 'name', 'region_id'):
+            catalog.districts_by_region.setdefault(district['region_id'], []).append(
+                {'id': district['id'], 'name': district['name']}
+            )
+        for c in Candidate.objects.filter(is_active=True).only(
+            'id', 'poll_id', 'district_id', 'full_name', 'position', 'bio', 'photo',
+            'photo_telegram', 'photo_variants_source', 'photo_file_id', 'photo_file_version',
+        ):
+            catalog.candidates[c.id] = {
+                'id': c.id, 'full_name': c.full_name, 'position': c.position,
+                'bio': c.bio, 'photo': c.photo.url if c.photo else None,
+                'photo_telegram': c.telegram_photo.url if c.photo else None,
+                'photo_file_id': c.telegram_photo_file_id,
+                'poll_id': c.poll_id, 'district_id': c.district_id,
+            }
+            if c.district_id:
+                catalog.candidates_by_district.setdefault(c.district_id, []).append(
+                    {'id': c.id, 'full_name': c.full_name, 'position': c.position}
+                )
+        return catalog
+
+    def poll_list(self) -> list:
+        return [{'id': p['id'], 'title': p['title'], 'is_open': _is_open(p)} for p in self.polls]
+
+    def poll_is_open(self, poll_id) -> bool:
+        """So'rovnoma hozir ochiqmi (faol bo'lmagan yoki topilmagan - yopiq)"""
+        poll = self.schedule.get(int(poll_id))
+        return poll is not None and _is_open(poll)
+
+    def regions(self, poll_id) -> list:
+        return list(self.regions_by_poll.get(int(poll_id), []))
+
+    def districts(self, region_id) -> list:
+        return list(self.districts_by_region.get(int(region_id), []))
+
+    def district_candidates(self, district_id) -> list:
+        return [dict(c) for c in self.candidates_by_district.get(int(district_id), [])]
+
+    def candidate(self, candidate_id):
+        candidate = self.candidates.get(int(candidate_id))
+        if candidate is None:
+            return None
+        return {key: candidate[key] for key in ('id', 'full_name', 'position', 'bio', 'photo', 'photo_telegram', 'photo_file_id')}
+
+
+def attach_vote_counts(candidates: list) -> list:
+    """Nomzodlar ro'yxatiga joriy ovozlar sonini qo'shish (hisoblagich ustuni, bitta so'rov)"""
+    from .counters import pending_deltas
+    from .models import Candidate
+
+    ids = [c['id'] for c in candidates]
+    counts = dict(Candidate.objects.filter(id__in=ids).values_list('id', 'vote_count'))
+    pending = pending_deltas('candidate', ids)
+    for candidate in candidates:
+        candidate['vote_count'] = counts.get(candidate['id'], 0) + pending.get(candidate['id'], 0)
+    return candidates
+
+
+_catalog = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _stored_version() -> int:
+    from .models import CacheVersion
+
+    version = CacheVersion.objects.filter(key=CATALOG_KEY).values_list('version', flat=True).first()
+    return version or 0
+
+
+def get_catalog() -> Catalog:
+    """Joriy katalog; boshqa jarayonlardagi o'zgarishlar versiya orqali tekshiriladi"""
+    global _catalog, _checked_at
+
+    catalog = _catalog
+    if catalog is not None and time.monotonic() - _checked_at < settings.CATALOG_VERSION_CHECK_INTERVAL:
+        return catalog
+
+    with _lock:
+        catalog = _catalog
+        if catalog is not None and time.monotonic() - _checked_at < settings.CATALOG_VERSION_CHECK_INTERVAL:
+            return catalog
+        # Read the stamp before the data: a change committed in between only
+        # causes one extra reload, never a stale catalog marked as current
+        version = _stored_version()
+        if catalog is None or catalog.version != version:
+            catalog = Catalog.load(version)
+            _catalog = catalog
+        _checked_at = time.monotonic()
+        return catalog
+
+
+def cached_version():
+    """Xotiradagi katalog versiyasi (bazaga murojaatsiz); tekshiruv muddati o'tgan bo'lsa None"""
+    catalog = _catalog
+    if catalog is not None and time.monotonic() - _checked_at < settings.CATALOG_VERSION_CHECK_INTERVAL:
+        return catalog.version
+    return None
+
+
+def current_version() -> int:
+    return get_catalog().version
+
+
+def patch_photo_file_id(candidate_id, file_id) -> None:
+    """Xotiradagi katalogda nomzodning file_id sini yangilash (versiya o'zgarmaydi).
+
+    Only this process learns it right away; other processes pick it up
+    with their next reload. A file_id is a cache of an upload, not catalog
+    structure, so it is not worth dropping every cache for.
+    """
+    catalog = _catalog
+    candidate = catalog.candidates.get(int(candidate_id)) if catalog is not None else None
+    if candidate is not None:
+        candidate['photo_file_id'] = file_id
+
+
+def _drop_local() -> None:
+    global _catalog
+    _catalog = None
+
+
+def _bump_stored_version() -> None:
+    from .models import CacheVersion
+
+    if CacheVersion.objects.filter(key=CATALOG_KEY).update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic():
+            CacheVersion.objects.create(key=CATALOG_KEY, version=1)
+    except IntegrityError:
+        CacheVersion.objects.filter(key=CATALOG_KEY).update(version=F('version') + 1)
+
+
+def _after_commit() -> None:
+    _bump_stored_version()
+    _drop_local()
+
+
+def invalidate_catalog() -> None:
+    """Katalogni barcha jarayonlarda eskirgan deb belgilash"""
+    # Dropped right away for this thread's transaction and again after commit,
+    # so no other thread keeps a copy loaded before the change was visible
+    _drop_local()
+    transaction.on_commit(_after_commit)
+
+
+def _catalog_changed(sender, **kwargs) -> None:
+    if kwargs.get('raw'):
+        return
+    invalidate_catalog()
+
+
+def connect_signals() -> None:
+    from .models import Poll, Region, District, Candidate
+
+    for model in (Poll, Region, District, Candidate):
+        post_save.connect(_catalog_changed, sender=model, dispatch_uid=f'catalog_save_{model.__name__}')
+        post_delete.connect(_catalog_changed, sender=model, dispatch_uid=f'catalog_delete_{model.__name__}')
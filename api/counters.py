@@ -0,0 +1,253 @@
+"""Denormalized vote counters.
+
+Candidate.vote_count and the total_votes of District, Region and Poll are
+maintained together with every Vote insert and delete, in the same
+transaction as the vote row. Inserts go through Vote.save; deletes are
+counted with one grouped query per delete call (Vote.delete,
+VoteQuerySet.delete, and the pre_delete receivers of the models whose
+deletion cascades to votes) so Vote itself has no delete signal
+receivers and cascades stay fast deletes that never load the vote rows.
+A candidate moved to another district (or a district to another region)
+takes its votes along (move_counts, from Candidate.save / District.save).
+reconcile_counts() rebuilds all of them from the Vote table.
+
+With VOTE_COUNTER_SHARDS > 1 a vote does not touch those columns at all:
+it adds its delta to one of N VoteCounterShard rows per counter, picked at
+random, so concurrent votes for the same (hot) candidate rarely wait on the
+same row lock. Readers that need exact numbers add the pending shard deltas
+(pending_deltas / with_pending); compact_counters() periodically folds the
+shards back into the columns.
+"""
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_delete
+from django.dispatch import Signal
+
+# Counter kind -> (model name, counter column)
+COUNTERS = {
+    'candidate': ('Candidate', 'vote_count'),
+    'district': ('District', 'total_votes'),
+    'region': ('Region', 'total_votes'),
+    'poll': ('Poll', 'total_votes'),
+}
+
+# Model whose deletion cascades to votes -> Vote lookup. A deleted Poll takes
+# all of its counters with it, so it needs no adjustment.
+CASCADE_LOOKUPS = {
+    'Candidate': 'candidate',
+    'District': 'candidate__district',
+    'Region': 'candidate__district__region',
+    'TelegramUser': 'user',
+}
+
+# Sent once per delete call before votes are deleted: votes (queryset), poll_ids (set)
+votes_deleting = Signal()
+
+
+def _counter_model(kind):
+    from django.apps import apps
+
+    model_name, field = COUNTERS[kind]
+    return apps.get_model('api', model_name), field
+
+
+def shards_enabled() -> bool:
+    return settings.VOTE_COUNTER_SHARDS > 1
+
+
+def _add_to_shard(kind, object_id, slot, delta) -> None:
+    from .models import VoteCounterShard
+
+    shard = VoteCounterShard.objects.filter(kind=kind, object_id=object_id, shard=slot)
+    if shard.update(delta=F('delta') + delta):
+        return
+    try:
+        with transaction.atomic():
+            VoteCounterShard.objects.create(kind=kind, object_id=object_id, shard=slot, delta=delta)
+    except IntegrityError:
+        # Created concurrently by another vote
+        shard.update(delta=F('delta') + delta)
+
+
+def change_counts(candidate_id, poll_id, delta: int) -> None:
+    """Nomzod, tuman, viloyat va so'rovnoma hisoblagichlarini delta ga o'zgartirish"""
+    change_counts_many({(candidate_id, poll_id): delta})
+
+
+def change_counts_many(deltas: dict) -> None:
+    """Bir nechta ovoz uchun: {(candidate_id, poll_id): delta}
+
+    Must run inside the transaction that writes the votes. Rows are always
+    updated in the same order (candidates, districts, regions, polls, each
+    by id) so concurrent writers can not deadlock on each other's counter
+    rows.
+    """
+    from .models import Candidate
+
+    locations = {
+        row['id']: row for row in Candidate.objects.filter(
+            pk__in={candidate_id for candidate_id, _ in deltas}
+        ).values('id', 'district_id', 'district__region_id')
+    }
+    totals = {kind: defaultdict(int) for kind in COUNTERS}
+    for (candidate_id, poll_id), delta in deltas.items():
+        totals['candidate'][candidate_id] += delta
+        totals['poll'][poll_id] += delta
+        location = locations.get(candidate_id)
+        if location and location['district_id']:
+            totals['district'][location['district_id']] += delta
+            totals['region'][location['district__region_id']] += delta
+
+    slot = random.randrange(settings.VOTE_COUNTER_SHARDS) if shards_enabled() else None
+    for kind in COUNTERS:
+        model, field = _counter_model(kind)
+        for object_id, delta in sorted(totals[kind].items()):
+            if not delta:
+                continue
+            if slot is not None:
+                _add_to_shard(kind, object_id, slot, delta)
+            else:
+                model.objects.filter(pk=object_id).update(**{field: F(field) + delta})
+
+
+def move_counts(kind, old_id, new_id, count: int) -> None:
+    """count ta ovozni bir hisoblagichdan boshqasiga ko'chirish (tuman yoki viloyat o'zgarganda)
+
+    Must run inside the transaction that changes the foreign key.
+    """
+    if not count or old_id == new_id:
+        return
+    model, field = _counter_model(kind)
+    slot = random.randrange(settings.VOTE_COUNTER_SHARDS) if shards_enabled() else None
+    deltas = {object_id: delta for object_id, delta in ((old_id, -count), (new_id, count)) if object_id}
+    for object_id, delta in sorted(deltas.items()):
+        if slot is not None:
+            _add_to_shard(kind, object_id, slot, delta)
+        else:
+            model.objects.filter(pk=object_id).update(**{field: F(field) + delta})
+
+
+def pending_deltas(kind, object_ids) -> dict:
+    """Hali ustunga qo'shilmagan shard qiymatlari: {object_id: delta}"""
+    if not shards_enabled():
+        return {}
+    from .models import VoteCounterShard
+
+    return dict(
+        VoteCounterShard.objects.filter(kind=kind, object_id__in=list(object_ids))
+        .values('object_id').annotate(total=Sum('delta')).values_list('object_id', 'total')
+    )
+
+
+def with_pending(kind, rows, field, id_key='id'):
+    """Lug'atlar ro'yxatidagi hisoblagich maydoniga kutilayotgan shard qiymatlarini qo'shish"""
+    pending = pending_deltas(kind, (row[id_key] for row in rows))
+    for row in rows:
+        row[field] = row[field] + pending.get(row[id_key], 0)
+    return rows
+
+
+def compact_counters() -> int:
+    """Shard qiymatlarini hisoblagich ustunlariga o'tkazish; o'tkazilgan hisoblagichlar sonini qaytaradi.
+
+    Exactly the amount read is subtracted from every shard, so votes that
+    land on a shard while compaction runs are kept for the next round.
+    """
+    from .models import VoteCounterShard
+
+    compacted = 0
+    with transaction.atomic():
+        shards = list(VoteCounterShard.objects.exclude(delta=0).only('id', 'kind', 'object_id', 'delta'))
+        totals = defaultdict(int)
+        for shard in shards:
+            totals[(shard.kind, shard.object_id)] += shard.delta
+            shard.delta = F('delta') - shard.delta
+        # Same lock order as change_counts: counter kinds in COUNTERS order
+        gone = []
+        for kind in COUNTERS:
+            model, field = _counter_model(kind)
+            for (shard_kind, object_id), total in sorted(totals.items()):
+                if shard_kind != kind or not total:
+                    continue
+                if model.objects.filter(pk=object_id).update(**{field: F(field) + total}):
+                    compacted += 1
+                else:
+                    gone.append((kind, object_id))
+        VoteCounterShard.objects.bulk_update(shards, ['delta'], batch_size=500)
+        # Shards of deleted candidates/polls have nothing to fold into
+        for kind, object_id in gone:
+            VoteCounterShard.objects.filter(kind=kind, object_id=object_id).delete()
+    return compacted
+
+
+def before_votes_delete(votes) -> None:
+    """O'chirilayotgan ovozlar uchun hisoblagichlarni kamaytirish (bitta guruhlangan so'rov)"""
+    rows = votes.order_by().values('candidate_id', 'poll_id').annotate(total=Count('id'))
+    deltas = {(row['candidate_id'], row['poll_id']): -row['total'] for row in rows}
+    if not deltas:
+        return
+    change_counts_many(deltas)
+    votes_deleting.send(sender=votes.model, votes=votes, poll_ids={poll_id for _, poll_id in deltas})
+
+
+def _parent_deleted(sender, instance, origin=None, **kwargs) -> None:
+    from .models import Vote
+
+    lookup = CASCADE_LOOKUPS[sender.__name__]
+    # Only the objects the delete was called on: rows cascaded from them
+    # (e.g. candidates of a deleted district) are covered by their votes
+    if isinstance(origin, QuerySet):
+        if origin.model is not sender or getattr(origin, '_votes_counted', False):
+            return
+        # pre_delete is sent per row; the whole queryset is counted at once
+        origin._votes_counted = True
+        before_votes_delete(Vote.objects.filter(**{f'{lookup}__in': origin.values('pk')}))
+    elif origin is instance:
+        before_votes_delete(Vote.objects.filter(**{lookup: instance}))
+
+
+def connect_signals() -> None:
+    from django.apps import apps
+
+    for model_name in CASCADE_LOOKUPS:
+        pre_delete.connect(
+            _parent_deleted, sender=apps.get_model('api', model_name),
+            dispatch_uid=f'vote_counters_cascade_{model_name}'
+        )
+
+
+def _count_of(vote_model, lookup):
+    return Coalesce(
+        Subquery(
+            vote_model.objects.filter(**{lookup: OuterRef('pk')})
+            .order_by().values(lookup).annotate(total=Count('id')).values('total')
+        ),
+        Value(0),
+    )
+
+
+def reconcile_counts() -> dict:
+    """Barcha hisoblagichlarni Vote jadvalidan qayta hisoblash (har bir jadval uchun bitta UPDATE)
+
+    The shard rows are locked before the recount and only those are deleted
+    afterwards: a vote that is still writing its shard waits for the lock and
+    then lands on a new row, so it is neither counted twice nor lost.
+    """
+    from .models import Poll, Region, District, Candidate, Vote, VoteCounterShard
+
+    with transaction.atomic():
+        shard_ids = list(VoteCounterShard.objects.select_for_update().values_list('id', flat=True))
+        updated = {
+            'candidates': Candidate.objects.update(vote_count=_count_of(Vote, 'candidate')),
+            'districts': District.objects.update(total_votes=_count_of(Vote, 'candidate__district')),
+            'regions': Region.objects.update(total_votes=_count_of(Vote, 'candidate__district__region')),
+            'polls': Poll.objects.update(total_votes=_count_of(Vote, 'poll')),
+        }
+        # The columns now hold the full count; the locked shard deltas are already included
+        VoteCounterShard.objects.filter(id__in=shard_ids).delete()
+    return updated
@@ -0,0 +1,101 @@
+"""Global statistics (/api/statistics/) computed in a few passes and cached.
+
+Users are counted in one pass over TelegramUser and votes in one pass over
+Vote (total and distinct voters together); region totals and the top
+candidates come from the denormalized counters. The result is cached for
+STATISTICS_CACHE_TTL seconds. When it expires one caller recomputes it
+under a cache lock while the others keep serving the previous copy, so an
+expiry under load does not start the same aggregates in every worker.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .counters import with_pending
+from .models import TelegramUser, Region, Candidate, Vote
+
+CACHE_KEY = 'api:global_statistics'
+LOCK_KEY = 'api:global_statistics:lock'
+# The previous copy is kept this many TTLs to be served during a recompute
+STALE_FACTOR = 10
+LOCK_TIMEOUT = 60
+# How long a caller with nothing to serve waits for another recompute
+WAIT_FOR_RECOMPUTE = 5
+
+
+def compute_statistics() -> dict:
+    users = TelegramUser.objects.aggregate(
+        total=Count('id'),
+        subscribed=Count('id', filter=Q(is_subscribed=True)),
+    )
+    votes = Vote.objects.aggregate(total=Count('id'), voters=Count('user_id', distinct=True))
+
+    # Viloyatlar bo'yicha statistika
+    regions = with_pending('region', list(
+        Region.objects.filter(is_active=True).values('id', 'name', 'total_votes')
+    ), 'total_votes')
+    regions_stats = sorted(
+        ({'id': r['id'], 'name': r['name'], 'vote_count': r['total_votes']} for r in regions),
+        key=lambda r: -r['vote_count']
+    )
+
+    # Top nomzodlar
+    top_candidates = with_pending('candidate', list(
+        Candidate.objects.filter(is_active=True).order_by('-vote_count').values(
+            'id', 'full_name', 'vote_count', 'district__name', 'district__region__name'
+        )[:10]
+    ), 'vote_count')
+    top_candidates.sort(key=lambda c: -c['vote_count'])
+
+    return {
+        'total_users': users['total'],
+        'total_votes': votes['total'],
+        'subscribed_users': users['subscribed'],
+        'voted_users': votes['voters'],
+        'regions': regions_stats,
+        'top_candidates': [{
+            'id': c['id'],
+            'name': c['full_name'],
+            'district': c['district__name'],
+            'region': c['district__region__name'],
+            'votes': c['vote_count'],
+        } for c in top_candidates],
+        'generated_at': timezone.now().isoformat(),
+    }
+
+
+def _store(data) -> None:
+    ttl = settings.STATISTICS_CACHE_TTL
+    cache.set(CACHE_KEY, {'data': data, 'fresh_until': time.time() + ttl}, timeout=ttl * STALE_FACTOR)
+
+
+def get_statistics() -> dict:
+    """Keshdagi statistika; muddati o'tgan bo'lsa faqat bitta chaqiruvchi qayta hisoblaydi"""
+    if settings.STATISTICS_CACHE_TTL <= 0:
+        return compute_statistics()
+
+    cached = cache.get(CACHE_KEY)
+    if cached and cached['fresh_until'] > time.time():
+        return cached['data']
+
+    if cache.add(LOCK_KEY, 1, timeout=LOCK_TIMEOUT):
+        try:
+            data = compute_statistics()
+            _store(data)
+            return data
+        finally:
+            cache.delete(LOCK_KEY)
+
+    # Someone else is recomputing: serve the previous copy or wait for the new one
+    if cached:
+        return cached['data']
+    deadline = time.monotonic() + WAIT_FOR_RECOMPUTE
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        cached = cache.get(CACHE_KEY)
+        if cached:
+            return cached['data']
+    return compute_statistics()
@@ -0,0 +1,121 @@
+"""Idempotency keys: a replayed request gets the stored result instead of running again.
+
+Keys live in the IdempotencyKey table for IDEMPOTENCY_KEY_TTL seconds, so
+they are shared by every process (webhook workers, bot, REST API). run_once
+reserves the key (a row without a result) before running the action, so
+concurrent retries wait for the first caller's result instead of racing it.
+Expired rows are purged opportunistically from claim().
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+# A reservation whose owner died is taken over after this many seconds
+PENDING_LEASE = 60
+# How long a concurrent retry waits for the owner's result
+WAIT_TIMEOUT = 10
+WAIT_INTERVAL = 0.05
+# Expired keys are deleted at most this often per process
+PURGE_INTERVAL = 3600
+
+_last_purge = 0.0
+
+
+class InProgress(Exception):
+    """Shu kalit bilan so'rov hali bajarilmoqda"""
+
+
+def _expires_at(ttl=None):
+    return timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL if ttl is None else ttl)
+
+
+def _maybe_purge() -> None:
+    global _last_purge
+    now = time.monotonic()
+    if now - _last_purge < PURGE_INTERVAL:
+        return
+    _last_purge = now
+    purge_expired()
+
+
+def stored_result(key):
+    """Kalit bo'yicha saqlangan natija (yo'q yoki muddati o'tgan bo'lsa None)"""
+    return IdempotencyKey.objects.filter(key=key, expires_at__gt=timezone.now()).values_list(
+        'result', flat=True
+    ).first()
+
+
+def claim(key, result=None, ttl=None) -> bool:
+    """Kalitni band qilish: birinchi marta bo'lsa True, takror bo'lsa False"""
+    _maybe_purge()
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(key=key, result=result, expires_at=_expires_at(ttl))
+        return True
+    except IntegrityError:
+        # An expired key counts as new
+        return bool(IdempotencyKey.objects.filter(key=key, expires_at__lte=timezone.now()).update(
+            result=result, expires_at=_expires_at(ttl)
+        ))
+
+
+def release(key) -> None:
+    """Kalitni bo'shatish (ish bajarilmay qolganda: keyingi urinish qayta ishlansin)"""
+    IdempotencyKey.objects.filter(key=key).delete()
+
+
+def _wait_for_result(key):
+    """Band qilingan kalit natijasini kutish; kalit bo'shatilsa None"""
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while True:
+        row = IdempotencyKey.objects.filter(key=key, expires_at__gt=timezone.now()).values('result').first()
+        if row is None:
+            return None
+        if row['result'] is not None:
+            return row['result']
+        if time.monotonic() >= deadline:
+            raise InProgress(key)
+        time.sleep(WAIT_INTERVAL)
+
+
+def run_once(key, action, store=None):
+    """action() ni kalit bo'yicha bir marta bajarish; takrorida birinchi natija qaytariladi
+
+    The key is reserved before action() runs; a concurrent call with the same
+    key polls for the stored result and raises InProgress if it does not
+    arrive within WAIT_TIMEOUT. If store(result) is false (e.g. the outcome is
+    still pending) the key is released instead of storing the result.
+    """
+    if not key:
+        return action()
+    while True:
+        result = stored_result(key)
+        if result is not None:
+            return result
+        if claim(key, ttl=PENDING_LEASE):
+            break
+        result = _wait_for_result(key)
+        if result is not None:
+            return result
+        # The owner failed and released the key (or its lease ran out): claim again
+
+    try:
+        result = action()
+    except Exception:
+        release(key)
+        raise
+    if store is None or store(result):
+        IdempotencyKey.objects.filter(key=key).update(result=result, expires_at=_expires_at())
+    else:
+        release(key)
+    return result
+
+
+def purge_expired() -> int:
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
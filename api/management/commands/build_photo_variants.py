@@ -0,0 +1,68 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+
+from api.catalog import invalidate_catalog
+from api.models import Candidate
+from api.photos import read_photo, render_variants, save_variants
+
+
+class Command(BaseCommand):
+    help = "Nomzod rasmlari uchun Telegram va admin variantlarini yaratish (mavjud rasmlar uchun)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help="Rasmlarni qayta kodlovchi jarayonlar soni"
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Variantlari bor rasmlarni ham qayta yaratish"
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError("--workers kamida 1 bo'lishi kerak")
+
+        candidates = Candidate.objects.exclude(Q(photo='') | Q(photo__isnull=True))
+        if not options['force']:
+            candidates = candidates.exclude(photo_variants_source=F('photo'))
+        candidates = list(candidates)
+        if not candidates:
+            self.stdout.write("Barcha rasmlar uchun variantlar mavjud.")
+            return
+
+        done = failed = 0
+        # Decoding/resizing is CPU bound: only the pure Pillow step runs in the pool,
+        # storage reads and writes stay in this process. Originals are read chunk by
+        # chunk so a large backfill does not hold every photo in memory at once.
+        chunk_size = options['workers'] * 4
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for start in range(0, len(candidates), chunk_size):
+                futures = {}
+                for candidate in candidates[start:start + chunk_size]:
+                    try:
+                        futures[pool.submit(
+                            render_variants, read_photo(candidate),
+                            settings.PHOTO_TELEGRAM_MAX_SIDE, settings.PHOTO_THUMB_MAX_SIDE
+                        )] = candidate
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f"{candidate.pk} ({candidate.photo.name}): {e}")
+
+                for future in as_completed(futures):
+                    candidate = futures[future]
+                    try:
+                        save_variants(candidate, future.result())
+                        done += 1
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f"{candidate.pk} ({candidate.photo.name}): {e}")
+
+        if done:
+            # Once for the whole run rather than per candidate
+            invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS(f"Variantlar yaratildi: {done}, xatolik: {failed}"))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from api.counters import compact_counters
+
+
+class Command(BaseCommand):
+    help = "Hisoblagich bo'laklarini (VOTE_COUNTER_SHARDS) nomzod/tuman/viloyat/so'rovnoma ustunlariga o'tkazish"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help="Har N sekundda takrorlash (0 - bir marta ishlab to'xtash)"
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval < 0:
+            raise CommandError("--interval manfiy bo'lishi mumkin emas")
+
+        while True:
+            compacted = compact_counters()
+            if compacted or not interval:
+                self.stdout.write(f"Hisoblagichlar yangilandi: {compacted}")
+            if not interval:
+                return
+            close_old_connections()
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from api.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Muddati o'tgan idempotentlik kalitlarini o'chirish"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"O'chirildi: {purge_expired()}")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.counters import reconcile_counts
+
+
+class Command(BaseCommand):
+    help = "Ovoz hisoblagichlarini (nomzod, tuman, viloyat, so'rovnoma) Vote jadvalidan qayta hisoblash"
+
+    def handle(self, *args, **options):
+        updated = reconcile_counts()
+        self.stdout.write(self.style.SUCCESS(
+            "Hisoblagichlar qayta hisoblandi: " + ", ".join(f"{name}={count}" for name, count in updated.items())
+        ))
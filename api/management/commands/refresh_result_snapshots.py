@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from api.models import Poll
+from api.snapshots import refresh_snapshot
+
+
+class Command(BaseCommand):
+    help = "So'rovnoma natijalari nusxalarini yangilash (--full - Vote jadvalidan noldan qayta hisoblash)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=int, action='append', help="Faqat shu so'rovnoma (bir necha marta berish mumkin)")
+        parser.add_argument('--full', action='store_true', help="Nusxani noldan qayta hisoblash (tuzatish uchun)")
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help="Har N sekundda takrorlash (0 - bir marta ishlab to'xtash)"
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval < 0:
+            raise CommandError("--interval manfiy bo'lishi mumkin emas")
+
+        full = options['full']
+        while True:
+            poll_ids = options['poll'] or list(Poll.objects.filter(is_active=True).values_list('id', flat=True))
+            for poll_id in poll_ids:
+                snapshot = refresh_snapshot(poll_id, full=full)
+                if not interval:
+                    self.stdout.write(f"#{poll_id}: {snapshot.total_votes} ovoz (oxirgi ovoz ID {snapshot.last_vote_id})")
+            if not interval:
+                return
+            # Only the first round is a full rebuild
+            full = False
+            close_old_connections()
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                return
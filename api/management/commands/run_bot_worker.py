@@ -0,0 +1,60 @@
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.config import WEBHOOK_QUEUE_CONCURRENCY
+
+
+class Command(BaseCommand):
+    help = "Webhook navbatidagi (WEBHOOK_MODE=queue) Telegram update'larini qayta ishlash"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=WEBHOOK_QUEUE_CONCURRENCY,
+            help="Parallel yo'laklar soni (bitta foydalanuvchi update'lari doim bitta yo'lakda)"
+        )
+        parser.add_argument(
+            '--shard', default='0/1',
+            help="Bir nechta worker jarayoni uchun: INDEX/COUNT, masalan 0/2 va 1/2"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            shard_index, shard_count = (int(part) for part in options['shard'].split('/'))
+        except ValueError:
+            raise CommandError("--shard INDEX/COUNT ko'rinishida bo'lishi kerak, masalan 0/2")
+        if not 0 <= shard_index < shard_count:
+            raise CommandError("--shard: INDEX 0 va COUNT-1 oralig'ida bo'lishi kerak")
+        if options['concurrency'] < 1:
+            raise CommandError("--concurrency kamida 1 bo'lishi kerak")
+
+        asyncio.run(self._run(options['concurrency'], shard_index, shard_count))
+
+    async def _run(self, concurrency, shard_index, shard_count):
+        from bot.bot import create_application
+        from bot.update_queue import QueueWorker
+
+        application = create_application()
+        await application.initialize()
+        await application.start()
+
+        worker = QueueWorker(
+            application, concurrency=concurrency,
+            shard_index=shard_index, shard_count=shard_count,
+        )
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, worker.stop)
+
+        self.stdout.write(
+            f"Bot worker started: concurrency={concurrency}, shard={shard_index}/{shard_count}"
+        )
+        try:
+            await worker.run()
+        finally:
+            await application.stop()
+            await application.shutdown()
+        self.stdout.write(self.style.SUCCESS(
+            f"Bot worker stopped: processed={worker.processed}, failed={worker.failed}"
+        ))
@@ -0,0 +1,144 @@
+import random
+import time
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.catalog import invalidate_catalog
+from api.counters import reconcile_counts
+from api.models import Poll, Region, District, Candidate, TelegramUser, Vote
+
+# Seeded rows are recognised by these, so --clear never touches real data
+SCALE_POLL_PREFIX = 'Scale test'
+SCALE_USER_BASE = 700_000_000
+
+
+class Command(BaseCommand):
+    help = "Sinov uchun katta hajmdagi sun'iy ma'lumotlar (so'rovnomalar, foydalanuvchilar, ovozlar) yaratish"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--polls', type=int, default=1)
+        parser.add_argument('--regions', type=int, default=14, help="Har bir so'rovnomadagi viloyatlar")
+        parser.add_argument('--districts', type=int, default=200, help="Har bir so'rovnomadagi tumanlar")
+        parser.add_argument('--candidates', type=int, default=5000, help="Har bir so'rovnomadagi nomzodlar")
+        parser.add_argument('--users', type=int, default=1_000_000)
+        parser.add_argument('--votes', type=int, default=1_000_000, help="Har bir so'rovnomadagi ovozlar (<= --users)")
+        parser.add_argument(
+            '--skew', type=float, default=1.0,
+            help="Ovozlar taqsimoti: k-o'rindagi nomzod ~ 1/k^skew (0 - bir tekis)"
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--chunk', type=int, default=10_000, help="bulk_create bo'lagi")
+        parser.add_argument('--clear', action='store_true', help="Avval yaratilgan sinov ma'lumotlarini o'chirish")
+
+    def handle(self, *args, **options):
+        if options['votes'] > options['users']:
+            raise CommandError("--votes --users dan oshmasligi kerak (bitta foydalanuvchi - bitta ovoz)")
+        if min(options['regions'], options['districts'], options['candidates'], options['chunk']) < 1:
+            raise CommandError("--regions, --districts, --candidates va --chunk kamida 1 bo'lishi kerak")
+
+        self.rng = random.Random(options['seed'])
+        self.chunk = options['chunk']
+        self.started = time.monotonic()
+
+        if options['clear']:
+            self.clear()
+        self.seed_users(options['users'])
+        for number in range(1, options['polls'] + 1):
+            poll, candidate_ids = self.seed_tree(number, options)
+            self.seed_votes(poll, candidate_ids, options)
+
+        self.progress("Hisoblagichlar", 0, 0)
+        with transaction.atomic():
+            reconcile_counts()
+        # bulk_create sends no signals
+        invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS(f"Tayyor ({time.monotonic() - self.started:.1f}s)"))
+
+    def progress(self, label, done, total):
+        elapsed = time.monotonic() - self.started
+        suffix = f": {done}/{total}" if total else ""
+        self.stdout.write(f"[{elapsed:7.1f}s] {label}{suffix}")
+
+    def bulk(self, label, model, rows, total, **kwargs):
+        """rows generatoridan chunk-chunk bulk_create, har bo'lakdan keyin progress"""
+        done = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.chunk:
+                with transaction.atomic():
+                    model.objects.bulk_create(batch, batch_size=self.chunk, **kwargs)
+                done += len(batch)
+                batch = []
+                self.progress(label, done, total)
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=self.chunk, **kwargs)
+            done += len(batch)
+            self.progress(label, done, total)
+
+    def clear(self):
+        polls = Poll.objects.filter(title__startswith=SCALE_POLL_PREFIX)
+        self.progress(f"O'chirilmoqda: {polls.count()} ta so'rovnoma", 0, 0)
+        # Votes first, in one statement, instead of the cascade collector
+        Vote.objects.filter(poll__in=polls)._raw_delete(Vote.objects.db)
+        polls.delete()
+        TelegramUser.objects.filter(
+            telegram_id__gte=SCALE_USER_BASE, telegram_id__lt=SCALE_USER_BASE + 100_000_000
+        )._raw_delete(TelegramUser.objects.db)
+
+    def seed_users(self, count):
+        self.bulk("Foydalanuvchilar", TelegramUser, (
+            TelegramUser(telegram_id=SCALE_USER_BASE + i, full_name=f"Scale user {i}", is_subscribed=True)
+            for i in range(count)
+        ), count, ignore_conflicts=True)
+
+    def seed_tree(self, number, options):
+        poll = Poll.objects.create(title=f"{SCALE_POLL_PREFIX} #{number}")
+        Region.objects.bulk_create([
+            Region(poll=poll, name=f"Viloyat {i + 1}", order=i) for i in range(options['regions'])
+        ])
+        regions = list(Region.objects.filter(poll=poll).order_by('order'))
+        District.objects.bulk_create([
+            District(region=regions[i % len(regions)], name=f"Tuman {i + 1}", order=i)
+            for i in range(options['districts'])
+        ], batch_size=self.chunk)
+        districts = list(District.objects.filter(region__poll=poll).values_list('id', flat=True))
+        self.bulk("Nomzodlar", Candidate, (
+            Candidate(poll=poll, district_id=districts[i % len(districts)], full_name=f"Nomzod {i + 1}", order=i)
+            for i in range(options['candidates'])
+        ), options['candidates'])
+        candidate_ids = list(Candidate.objects.filter(poll=poll).values_list('id', flat=True))
+        # Popularity rank is independent of district
+        self.rng.shuffle(candidate_ids)
+        return poll, candidate_ids
+
+    def seed_votes(self, poll, candidate_ids, options):
+        weights = [1 / (rank + 1) ** options['skew'] for rank in range(len(candidate_ids))]
+        cum_weights = list(accumulate(weights))
+        users, needed = options['users'], options['votes']
+
+        def votes():
+            # Users are streamed in chunks of --chunk in id order; each one votes with
+            # probability needed/remaining (selection sampling), so exactly --votes
+            # uniformly chosen voters come out without holding all users in memory
+            nonlocal needed
+            for start in range(0, users, self.chunk):
+                stop = min(start + self.chunk, users)
+                user_ids = dict(TelegramUser.objects.filter(
+                    telegram_id__gte=SCALE_USER_BASE + start, telegram_id__lt=SCALE_USER_BASE + stop
+                ).values_list('telegram_id', 'id'))
+                voters = []
+                for i in range(start, stop):
+                    if self.rng.random() * (users - i) < needed:
+                        voters.append(user_ids[SCALE_USER_BASE + i])
+                        needed -= 1
+                # Insert order is not the user order
+                self.rng.shuffle(voters)
+                chosen = self.rng.choices(candidate_ids, cum_weights=cum_weights, k=len(voters))
+                for user_id, candidate_id in zip(voters, chosen):
+                    yield Vote(poll=poll, candidate_id=candidate_id, user_id=user_id)
+
+        self.bulk(f"Ovozlar ({poll.title})", Vote, votes(), options['votes'])
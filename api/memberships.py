@@ -0,0 +1,68 @@
+"""Local channel membership index shared by the REST views and APIClient INTERNAL mode."""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Channel, ChannelMembership
+
+
+def _match_channels(chat_id=None, chat_username=None):
+    """Telegram chat id/username bo'yicha Channel yozuvlari"""
+    lookup = Q()
+    if chat_id is not None:
+        lookup |= Q(channel_id=str(chat_id))
+    if chat_username:
+        username = str(chat_username).lstrip('@')
+        lookup |= Q(channel_id=f"@{username}") | Q(channel_username__iexact=username) | Q(channel_username__iexact=f"@{username}")
+    if not lookup:
+        return Channel.objects.none()
+    return Channel.objects.filter(lookup)
+
+
+def lookup_memberships(telegram_id, channel_ids):
+    """Indeksdagi yangi (eskirmagan) yozuvlar: {channel_id: is_member}"""
+    fresh_after = timezone.now() - timedelta(seconds=settings.MEMBERSHIP_INDEX_TTL)
+    rows = ChannelMembership.objects.filter(
+        telegram_id=telegram_id,
+        channel__channel_id__in=[str(c) for c in channel_ids],
+        updated_at__gte=fresh_after,
+    ).values_list('channel__channel_id', 'status')
+    return {
+        channel_id: status not in ChannelMembership.NOT_MEMBER_STATUSES
+        for channel_id, status in rows
+    }
+
+
+def record_memberships(entries):
+    """A'zolik holatlarini indeksga yozish.
+
+    entries: [{'telegram_id', 'status', 'chat_id' and/or 'chat_username'}]
+    Faqat majburiy kanallar (Channel jadvalidagi) uchun yoziladi.
+    """
+    now = timezone.now()
+    objs = {}
+    for entry in entries:
+        for channel_pk in _match_channels(entry.get('chat_id'), entry.get('chat_username')).values_list('pk', flat=True):
+            objs[(channel_pk, int(entry['telegram_id']))] = ChannelMembership(
+                channel_id=channel_pk, telegram_id=int(entry['telegram_id']),
+                status=entry['status'], updated_at=now,
+            )
+    if not objs:
+        return 0
+
+    kwargs = {'update_conflicts': True, 'update_fields': ['status', 'updated_at']}
+    if connection.features.supports_update_conflicts_with_target:
+        kwargs['unique_fields'] = ['telegram_id', 'channel']
+    ChannelMembership.objects.bulk_create(list(objs.values()), **kwargs)
+    return len(objs)
+
+
+def reset_channel(chat_id=None, chat_username=None):
+    """Bot kanalda admin bo'lmay qolganda: kanal indeksini tozalash (update'lar endi kelmaydi)"""
+    deleted, _ = ChannelMembership.objects.filter(
+        channel__in=_match_channels(chat_id, chat_username)
+    ).delete()
+    return deleted
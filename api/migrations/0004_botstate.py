@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:30
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_candidate_poll'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='channel',
+            name='channel_username',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='Kanal username (@siz)'),
+        ),
+        migrations.CreateModel(
+            name='BotState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'Foydalanuvchi'), ('chat', 'Chat'), ('bot', 'Bot'), ('conversation', 'Suhbat holati')], max_length=20, verbose_name='Turi')),
+                ('key', models.CharField(max_length=255, verbose_name='Kalit')),
+                ('data', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name="Ma'lumot")),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Yangilangan vaqt')),
+            ],
+            options={
+                'verbose_name': 'Bot holati',
+                'verbose_name_plural': 'Bot holatlari',
+                'unique_together': {('kind', 'key')},
+            },
+        ),
+    ]
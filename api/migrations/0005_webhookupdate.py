@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_botstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('update_id', models.BigIntegerField(unique=True, verbose_name='Update ID')),
+                ('user_key', models.BigIntegerField(default=0, verbose_name='Foydalanuvchi kaliti')),
+                ('payload', models.JSONField(verbose_name='Update')),
+                ('status', models.CharField(choices=[('pending', 'Navbatda'), ('processing', 'Qayta ishlanmoqda'), ('done', 'Bajarildi'), ('failed', 'Xatolik')], default='pending', max_length=20, verbose_name='Holat')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Urinishlar')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Xatolik')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Qabul qilingan vaqt')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Qayta ishlangan vaqt')),
+            ],
+            options={
+                'verbose_name': 'Webhook update',
+                'verbose_name_plural': "Webhook update'lar",
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='api_webhookupdate_queue_idx')],
+            },
+        ),
+    ]
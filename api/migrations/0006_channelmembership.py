@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_webhookupdate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChannelMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('telegram_id', models.BigIntegerField(verbose_name='Telegram ID')),
+                ('status', models.CharField(max_length=20, verbose_name='Holat')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Yangilangan vaqt')),
+                ('channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='api.channel', verbose_name='Kanal')),
+            ],
+            options={
+                'verbose_name': "Kanal a'zoligi",
+                'verbose_name_plural': "Kanal a'zoliklari",
+                'unique_together': {('telegram_id', 'channel')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_channelmembership'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='candidate',
+            name='photo_file_id',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, verbose_name='Telegram file_id'),
+        ),
+        migrations.AddField(
+            model_name='candidate',
+            name='photo_file_version',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, verbose_name='file_id rasm versiyasi'),
+        ),
+    ]
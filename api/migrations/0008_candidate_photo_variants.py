@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_candidate_photo_file_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='candidate',
+            name='photo_telegram',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='candidates/telegram/', verbose_name='Telegram uchun rasm'),
+        ),
+        migrations.AddField(
+            model_name='candidate',
+            name='photo_thumb',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='candidates/thumbs/', verbose_name='Kichik rasm'),
+        ),
+        migrations.AddField(
+            model_name='candidate',
+            name='photo_variants_source',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, verbose_name='Variantlar manbasi'),
+        ),
+    ]
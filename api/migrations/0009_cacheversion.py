@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_candidate_photo_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='Kalit')),
+                ('version', models.BigIntegerField(default=0, verbose_name='Versiya')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Yangilangan vaqt')),
+            ],
+            options={
+                'verbose_name': 'Kesh versiyasi',
+                'verbose_name_plural': 'Kesh versiyalari',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_cacheversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='invite_link',
+            field=models.CharField(blank=True, help_text='Yopiq kanallar uchun bot yaratgan havola (avtomatik saqlanadi)', max_length=255, null=True, verbose_name='Taklif havolasi'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:44
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    """Mavjud ovozlardan hisoblagichlarni to'ldirish"""
+    Vote = apps.get_model('api', 'Vote')
+
+    def count_of(lookup):
+        return Coalesce(Subquery(
+            Vote.objects.filter(**{lookup: OuterRef('pk')})
+            .order_by().values(lookup).annotate(total=Count('id')).values('total')
+        ), Value(0))
+
+    apps.get_model('api', 'Candidate').objects.update(vote_count=count_of('candidate'))
+    apps.get_model('api', 'District').objects.update(total_votes=count_of('candidate__district'))
+    apps.get_model('api', 'Region').objects.update(total_votes=count_of('candidate__district__region'))
+    apps.get_model('api', 'Poll').objects.update(total_votes=count_of('poll'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_channel_invite_link'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='candidate',
+            name='vote_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Ovozlar soni'),
+        ),
+        migrations.AddField(
+            model_name='district',
+            name='total_votes',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Jami ovozlar'),
+        ),
+        migrations.AddField(
+            model_name='poll',
+            name='total_votes',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Jami ovozlar'),
+        ),
+        migrations.AddField(
+            model_name='region',
+            name='total_votes',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Jami ovozlar'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
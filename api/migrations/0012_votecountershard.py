@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_vote_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20, verbose_name='Hisoblagich turi')),
+                ('object_id', models.PositiveIntegerField(verbose_name='Obyekt ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name="Bo'lak")),
+                ('delta', models.IntegerField(default=0, verbose_name="Qo'shilmagan qiymat")),
+            ],
+            options={
+                'verbose_name': "Hisoblagich bo'lagi",
+                'verbose_name_plural': "Hisoblagich bo'laklari",
+                'unique_together': {('kind', 'object_id', 'shard')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_votecountershard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='Kalit')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='Natija')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Amal qilish muddati')),
+            ],
+            options={
+                'verbose_name': 'Idempotentlik kaliti',
+                'verbose_name_plural': 'Idempotentlik kalitlari',
+            },
+        ),
+    ]
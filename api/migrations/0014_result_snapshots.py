@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollResultSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_vote_id', models.BigIntegerField(default=0, verbose_name="Oxirgi qo'shilgan ovoz ID")),
+                ('total_votes', models.PositiveIntegerField(default=0, verbose_name='Jami ovozlar')),
+                ('needs_rebuild', models.BooleanField(default=False, verbose_name="To'liq qayta hisoblash kerak")),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True, verbose_name='Yangilangan vaqt')),
+                ('poll', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='result_snapshot', to='api.poll', verbose_name="So'rovnoma")),
+            ],
+            options={
+                'verbose_name': 'Natijalar nusxasi',
+                'verbose_name_plural': 'Natijalar nusxalari',
+            },
+        ),
+        migrations.CreateModel(
+            name='ResultSnapshotEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('candidate', 'Nomzod'), ('district', 'Tuman'), ('region', 'Viloyat')], max_length=20, verbose_name='Turi')),
+                ('object_id', models.PositiveIntegerField(verbose_name='Obyekt ID')),
+                ('district_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='Tuman ID')),
+                ('votes', models.PositiveIntegerField(default=0, verbose_name='Ovozlar')),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='api.pollresultsnapshot', verbose_name='Nusxa')),
+            ],
+            options={
+                'verbose_name': 'Natija',
+                'verbose_name_plural': 'Natijalar',
+                'indexes': [models.Index(fields=['snapshot', 'kind', '-votes'], name='api_snapshot_rank_idx')],
+                'unique_together': {('snapshot', 'kind', 'object_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_result_snapshots'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='candidate',
+            name='vote_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Ovozlar soni'),
+        ),
+        migrations.AlterField(
+            model_name='district',
+            name='total_votes',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Jami ovozlar'),
+        ),
+        migrations.AlterField(
+            model_name='poll',
+            name='total_votes',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Jami ovozlar'),
+        ),
+        migrations.AlterField(
+            model_name='region',
+            name='total_votes',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Jami ovozlar'),
+        ),
+    ]
@@ -1,7 +1,18 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 
 
+def _skip_counter(instance, counter, kwargs) -> None:
+    """To'liq save() hisoblagich ustunini eski qiymat bilan qayta yozmasin (u faqat F() bilan o'zgaradi)"""
+    if instance._state.adding or kwargs.get('update_fields') is not None:
+        return
+    kwargs['update_fields'] = [
+        f.name for f in instance._meta.concrete_fields if not f.primary_key and f.name != counter
+    ]
+
+
 class TelegramUser(models.Model):
     """Telegram foydalanuvchilari"""
     telegram_id = models.BigIntegerField(unique=True, verbose_name="Telegram ID")
@@ -34,6 +45,8 @@ class Channel(models.Model):
     channel_id = models.CharField(max_length=255, unique=True, verbose_name="Kanal ID")
     channel_username = models.CharField(max_length=255, blank=True, null=True, verbose_name="Kanal username (@siz)")
     title = models.CharField(max_length=255, verbose_name="Kanal nomi")
+    invite_link = models.CharField(max_length=255, blank=True, null=True, verbose_name="Taklif havolasi",
+                                   help_text="Yopiq kanallar uchun bot yaratgan havola (avtomatik saqlanadi)")
     description = models.TextField(blank=True, null=True, verbose_name="Tavsif")
     is_active = models.BooleanField(default=True, verbose_name="Faolmi")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Qo'shilgan vaqt")
@@ -47,6 +60,28 @@ class Channel(models.Model):
         return f"{self.title} (@{self.channel_username})"
 
 
+class ChannelMembership(models.Model):
+    """Foydalanuvchining majburiy kanaldagi a'zolik holati (chat_member update'lari bilan yangilanadi)"""
+    NOT_MEMBER_STATUSES = ('left', 'kicked', 'left_member')
+
+    channel = models.ForeignKey(Channel, on_delete=models.CASCADE, related_name='memberships', verbose_name="Kanal")
+    telegram_id = models.BigIntegerField(verbose_name="Telegram ID")
+    status = models.CharField(max_length=20, verbose_name="Holat")
+    updated_at = models.DateTimeField(default=timezone.now, verbose_name="Yangilangan vaqt")
+
+    class Meta:
+        verbose_name = "Kanal a'zoligi"
+        verbose_name_plural = "Kanal a'zoliklari"
+        unique_together = ['telegram_id', 'channel']
+
+    def __str__(self):
+        return f"{self.telegram_id} @ {self.channel.title}: {self.status}"
+
+    @property
+    def is_member(self):
+        return self.status not in self.NOT_MEMBER_STATUSES
+
+
 class Poll(models.Model):
     """So'rovnomalar"""
     title = models.CharField(max_length=255, verbose_name="So'rovnoma nomi")
@@ -55,6 +90,7 @@ class Poll(models.Model):
     end_date = models.DateTimeField(blank=True, null=True, verbose_name="Tugash sanasi")
     is_active = models.BooleanField(default=True, verbose_name="Faolmi")
     order = models.IntegerField(default=0, verbose_name="Tartib raqami")
+    total_votes = models.IntegerField(default=0, editable=False, verbose_name="Jami ovozlar")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Yaratilgan vaqt")
 
     class Meta:
@@ -64,16 +100,15 @@ class Poll(models.Model):
 
     def __str__(self):
         return self.title
-    
-    @property
-    def total_votes(self):
-        """Polldagi jami ovozlar"""
-        return self.votes.count()
+
+    def save(self, *args, **kwargs):
+        _skip_counter(self, 'total_votes', kwargs)
+        super().save(*args, **kwargs)
     
     @property
     def total_participants(self):
-        """Pollda ishtirok etgan foydalanuvchilar soni"""
-        return self.votes.values('user').distinct().count()
+        """Pollda ishtirok etgan foydalanuvchilar soni (har bir foydalanuvchi bitta ovoz beradi)"""
+        return self.total_votes
     
     def is_open(self):
         """Poll ochiqmi?"""
@@ -94,6 +129,7 @@ class Region(models.Model):
     description = models.TextField(blank=True, null=True, verbose_name="Tavsif")
     is_active = models.BooleanField(default=True, verbose_name="Faolmi")
     order = models.IntegerField(default=0, verbose_name="Tartib raqami")
+    total_votes = models.IntegerField(default=0, editable=False, verbose_name="Jami ovozlar")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Yaratilgan vaqt")
 
     class Meta:
@@ -105,10 +141,9 @@ class Region(models.Model):
     def __str__(self):
         return f"{self.name} ({self.poll.title})"
 
-    @property
-    def total_votes(self):
-        """Viloyatdagi jami ovozlar"""
-        return Vote.objects.filter(candidate__district__region=self).count()
+    def save(self, *args, **kwargs):
+        _skip_counter(self, 'total_votes', kwargs)
+        super().save(*args, **kwargs)
 
 
 class District(models.Model):
@@ -118,6 +153,7 @@ class District(models.Model):
     description = models.TextField(blank=True, null=True, verbose_name="Tavsif")
     is_active = models.BooleanField(default=True, verbose_name="Faolmi")
     order = models.IntegerField(default=0, verbose_name="Tartib raqami")
+    total_votes = models.IntegerField(default=0, editable=False, verbose_name="Jami ovozlar")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Yaratilgan vaqt")
 
     class Meta:
@@ -129,10 +165,20 @@ class District(models.Model):
     def __str__(self):
         return f"{self.name} ({self.region.name})"
 
-    @property
-    def total_votes(self):
-        """Tumandagi jami ovozlar"""
-        return Vote.objects.filter(candidate__district=self).count()
+    def save(self, *args, **kwargs):
+        from .counters import move_counts
+
+        _skip_counter(self, 'total_votes', kwargs)
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding and (update_fields is None or 'region' in update_fields):
+                previous = District.objects.select_for_update().filter(pk=self.pk).values('region_id').first()
+            super().save(*args, **kwargs)
+            if previous and previous['region_id'] != self.region_id:
+                # District moved to another region: its votes move along
+                count = Vote.objects.filter(candidate__district_id=self.pk).count()
+                move_counts('region', previous['region_id'], self.region_id, count)
 
 
 class Candidate(models.Model):
@@ -142,10 +188,18 @@ class Candidate(models.Model):
     district = models.ForeignKey(District, on_delete=models.CASCADE, related_name='candidates', verbose_name="Tuman", null=True, blank=True)
     full_name = models.CharField(max_length=255, verbose_name="To'liq ism")
     photo = models.ImageField(upload_to='candidates/', blank=True, null=True, verbose_name="Rasm")
+    # Re-encoded variants derived from photo (see api/photos.py)
+    photo_telegram = models.ImageField(upload_to='candidates/telegram/', blank=True, null=True, editable=False, verbose_name="Telegram uchun rasm")
+    photo_thumb = models.ImageField(upload_to='candidates/thumbs/', blank=True, null=True, editable=False, verbose_name="Kichik rasm")
+    photo_variants_source = models.CharField(max_length=255, blank=True, null=True, editable=False, verbose_name="Variantlar manbasi")
+    # Telegram file_id of the uploaded photo and the photo file it belongs to
+    photo_file_id = models.CharField(max_length=255, blank=True, null=True, editable=False, verbose_name="Telegram file_id")
+    photo_file_version = models.CharField(max_length=255, blank=True, null=True, editable=False, verbose_name="file_id rasm versiyasi")
     bio = models.TextField(blank=True, null=True, verbose_name="Biografiya")
     position = models.CharField(max_length=255, blank=True, null=True, verbose_name="Lavozim")
     is_active = models.BooleanField(default=True, verbose_name="Faolmi")
     order = models.IntegerField(default=0, verbose_name="Tartib raqami")
+    vote_count = models.IntegerField(default=0, editable=False, verbose_name="Ovozlar soni")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Qo'shilgan vaqt")
 
     class Meta:
@@ -158,11 +212,6 @@ class Candidate(models.Model):
             return f"{self.full_name} - {self.district.name}"
         return f"{self.full_name} ({self.poll.title})"
 
-    @property
-    def vote_count(self):
-        """Nomzod uchun berilgan ovozlar soni"""
-        return self.votes.count()
-
     def clean(self):
         """Ensure candidate's district (if provided) belongs to the same poll."""
         from django.core.exceptions import ValidationError
@@ -170,10 +219,86 @@ class Candidate(models.Model):
         if self.district and self.district.region.poll_id != self.poll_id:
             raise ValidationError("Agar tuman ko'rsatilsa, u ko'rsatilgan so'rovnomaga tegishli bo'lishi kerak.")
 
+    @property
+    def telegram_photo_file_id(self):
+        """Joriy rasm uchun saqlangan Telegram file_id (rasm o'zgargan bo'lsa None)"""
+        if self.photo and self.photo_file_id and self.photo_file_version == self.photo.name:
+            return self.photo_file_id
+        return None
+
+    @property
+    def telegram_photo(self):
+        """Botga yuboriladigan rasm: Telegram varianti, bo'lmasa asl rasm"""
+        if self.photo_telegram and self.photo_variants_source == self.photo.name:
+            return self.photo_telegram
+        return self.photo
+
+    def remember_photo_file_id(self, file_id, photo_url=None):
+        """Yuklangan rasmning Telegram file_id sini saqlash.
+
+        photo_url - bot yuklagan rasm manzili; u joriy rasmga (yoki uning
+        variantiga) mos kelmasa - rasm oraliqda almashtirilgan - file_id saqlanmaydi.
+        """
+        if not self.photo or not file_id:
+            return False
+        if photo_url and not any(str(photo_url).endswith(f.url) for f in (self.photo, self.telegram_photo)):
+            return False
+        # Guard against a concurrent photo change between read and write
+        updated = Candidate.objects.filter(pk=self.pk, photo=self.photo.name).update(
+            photo_file_id=file_id, photo_file_version=self.photo.name
+        )
+        if updated:
+            self.photo_file_id = file_id
+            self.photo_file_version = self.photo.name
+            from .catalog import patch_photo_file_id
+            patch_photo_file_id(self.pk, file_id)
+        return bool(updated)
+
+    def _move_votes(self, old_district_id, old_region_id):
+        """Tuman o'zgarganda nomzod ovozlarini eski tuman/viloyatdan yangisiga o'tkazish"""
+        from .counters import move_counts
+
+        count = Vote.objects.filter(candidate_id=self.pk).count()
+        move_counts('district', old_district_id, self.district_id, count)
+        move_counts('region', old_region_id, self.district.region_id if self.district_id else None, count)
+
     def save(self, *args, **kwargs):
         # Validate consistency before saving
         self.clean()
-        super().save(*args, **kwargs)
+        _skip_counter(self, 'vote_count', kwargs)
+        # Photo replaced or removed: the cached file_id points to the old image
+        if self.photo_file_id and self.photo_file_version != (self.photo.name if self.photo else None):
+            self.photo_file_id = None
+            self.photo_file_version = None
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'photo_file_id', 'photo_file_version'}
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding and (update_fields is None or 'district' in update_fields):
+                previous = Candidate.objects.select_for_update().filter(pk=self.pk).values(
+                    'district_id', 'district__region_id'
+                ).first()
+            super().save(*args, **kwargs)
+            if previous and previous['district_id'] != self.district_id:
+                self._move_votes(previous['district_id'], previous['district__region_id'])
+
+        if settings.PHOTO_VARIANTS_ON_SAVE:
+            from .photos import sync_variants
+            sync_variants(self)
+
+
+class VoteQuerySet(models.QuerySet):
+    def delete(self):
+        """Hisoblagichlarni bitta guruhlangan so'rov bilan kamaytirib o'chirish"""
+        from .counters import before_votes_delete
+
+        with transaction.atomic(using=self.db):
+            before_votes_delete(self)
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
 
 
 class Vote(models.Model):
@@ -184,6 +309,8 @@ class Vote(models.Model):
     voted_at = models.DateTimeField(default=timezone.now, verbose_name="Ovoz berilgan vaqt")
     ip_address = models.GenericIPAddressField(blank=True, null=True, verbose_name="IP manzil")
 
+    objects = VoteQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Ovoz"
         verbose_name_plural = "Ovozlar"
@@ -194,11 +321,182 @@ class Vote(models.Model):
         return f"{self.user.full_name} → {self.candidate.full_name} ({self.poll.title})"
 
     def save(self, *args, **kwargs):
-        """Ovoz berilganda poll ni avtomatik belgilash"""
+        """Ovoz berilganda poll ni avtomatik belgilash va hisoblagichlarni yangilash"""
+        from .counters import change_counts
+
         if not self.poll_id and self.candidate:
             # Prefer candidate.poll, fallback to candidate.district.region.poll for older records
             if hasattr(self.candidate, 'poll') and self.candidate.poll_id:
                 self.poll = self.candidate.poll
             elif self.candidate.district:
                 self.poll = self.candidate.district.region.poll
-        super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = Vote.objects.filter(pk=self.pk).values('candidate_id', 'poll_id').first()
+            super().save(*args, **kwargs)
+            if previous is None:
+                change_counts(self.candidate_id, self.poll_id, 1)
+            elif (previous['candidate_id'], previous['poll_id']) != (self.candidate_id, self.poll_id):
+                # Vote moved to another candidate (admin edit)
+                change_counts(previous['candidate_id'], previous['poll_id'], -1)
+                change_counts(self.candidate_id, self.poll_id, 1)
+
+    def delete(self, *args, **kwargs):
+        from .counters import before_votes_delete
+
+        with transaction.atomic():
+            before_votes_delete(Vote.objects.filter(pk=self.pk))
+            return super().delete(*args, **kwargs)
+
+
+class VoteCounterShard(models.Model):
+    """Hisoblagich bo'lagi: VOTE_COUNTER_SHARDS > 1 bo'lsa ovozlar shu yerga yoziladi (api/counters.py)"""
+    kind = models.CharField(max_length=20, verbose_name="Hisoblagich turi")
+    object_id = models.PositiveIntegerField(verbose_name="Obyekt ID")
+    shard = models.PositiveSmallIntegerField(verbose_name="Bo'lak")
+    delta = models.IntegerField(default=0, verbose_name="Qo'shilmagan qiymat")
+
+    class Meta:
+        verbose_name = "Hisoblagich bo'lagi"
+        verbose_name_plural = "Hisoblagich bo'laklari"
+        unique_together = ['kind', 'object_id', 'shard']
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id}#{self.shard} {self.delta:+d}"
+
+
+class PollResultSnapshot(models.Model):
+    """So'rovnoma natijalarining saqlangan nusxasi: last_vote_id gacha bo'lgan ovozlar (api/snapshots.py)"""
+    poll = models.OneToOneField(Poll, on_delete=models.CASCADE, related_name='result_snapshot', verbose_name="So'rovnoma")
+    last_vote_id = models.BigIntegerField(default=0, verbose_name="Oxirgi qo'shilgan ovoz ID")
+    total_votes = models.PositiveIntegerField(default=0, verbose_name="Jami ovozlar")
+    needs_rebuild = models.BooleanField(default=False, verbose_name="To'liq qayta hisoblash kerak")
+    refreshed_at = models.DateTimeField(blank=True, null=True, verbose_name="Yangilangan vaqt")
+
+    class Meta:
+        verbose_name = "Natijalar nusxasi"
+        verbose_name_plural = "Natijalar nusxalari"
+
+    def __str__(self):
+        return f"{self.poll} (#{self.last_vote_id})"
+
+
+class ResultSnapshotEntry(models.Model):
+    """Natijalar nusxasidagi bitta nomzod, tuman yoki viloyat jami"""
+    KIND_CANDIDATE = 'candidate'
+    KIND_DISTRICT = 'district'
+    KIND_REGION = 'region'
+    KIND_CHOICES = [
+        (KIND_CANDIDATE, 'Nomzod'),
+        (KIND_DISTRICT, 'Tuman'),
+        (KIND_REGION, 'Viloyat'),
+    ]
+
+    snapshot = models.ForeignKey(PollResultSnapshot, on_delete=models.CASCADE, related_name='entries', verbose_name="Nusxa")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Turi")
+    object_id = models.PositiveIntegerField(verbose_name="Obyekt ID")
+    # Candidate rows only: lets district results be read without a join
+    district_id = models.PositiveIntegerField(blank=True, null=True, verbose_name="Tuman ID")
+    votes = models.PositiveIntegerField(default=0, verbose_name="Ovozlar")
+
+    class Meta:
+        verbose_name = "Natija"
+        verbose_name_plural = "Natijalar"
+        unique_together = ['snapshot', 'kind', 'object_id']
+        indexes = [
+            models.Index(fields=['snapshot', 'kind', '-votes'], name='api_snapshot_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} = {self.votes}"
+
+
+class IdempotencyKey(models.Model):
+    """Takroriy so'rovlar uchun saqlangan natija (Telegram update_id, callback va h.k.), TTL bilan"""
+    key = models.CharField(max_length=255, unique=True, verbose_name="Kalit")
+    result = models.JSONField(blank=True, null=True, verbose_name="Natija")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Amal qilish muddati")
+
+    class Meta:
+        verbose_name = "Idempotentlik kaliti"
+        verbose_name_plural = "Idempotentlik kalitlari"
+
+    def __str__(self):
+        return self.key
+
+
+class CacheVersion(models.Model):
+    """Jarayonlararo kesh versiyasi: o'zgarishda oshiriladi, jarayonlar o'z keshini shu bilan solishtiradi"""
+    key = models.CharField(max_length=100, unique=True, verbose_name="Kalit")
+    version = models.BigIntegerField(default=0, verbose_name="Versiya")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Yangilangan vaqt")
+
+    class Meta:
+        verbose_name = "Kesh versiyasi"
+        verbose_name_plural = "Kesh versiyalari"
+
+    def __str__(self):
+        return f"{self.key}: {self.version}"
+
+
+class BotState(models.Model):
+    """Bot holati (user_data, chat_data, bot_data, conversation) - har bir kalit alohida qatorda"""
+    KIND_USER = 'user'
+    KIND_CHAT = 'chat'
+    KIND_BOT = 'bot'
+    KIND_CONVERSATION = 'conversation'
+    KIND_CHOICES = [
+        (KIND_USER, 'Foydalanuvchi'),
+        (KIND_CHAT, 'Chat'),
+        (KIND_BOT, 'Bot'),
+        (KIND_CONVERSATION, 'Suhbat holati'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Turi")
+    key = models.CharField(max_length=255, verbose_name="Kalit")
+    data = models.JSONField(default=dict, encoder=DjangoJSONEncoder, blank=True, null=True, verbose_name="Ma'lumot")
+    updated_at = models.DateTimeField(default=timezone.now, verbose_name="Yangilangan vaqt")
+
+    class Meta:
+        verbose_name = "Bot holati"
+        verbose_name_plural = "Bot holatlari"
+        unique_together = ['kind', 'key']
+
+    def __str__(self):
+        return f"{self.kind}:{self.key}"
+
+
+class WebhookUpdate(models.Model):
+    """Webhook orqali kelgan, navbatda turgan Telegram update'lari"""
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Navbatda'),
+        (STATUS_PROCESSING, 'Qayta ishlanmoqda'),
+        (STATUS_DONE, 'Bajarildi'),
+        (STATUS_FAILED, 'Xatolik'),
+    ]
+
+    update_id = models.BigIntegerField(unique=True, verbose_name="Update ID")
+    user_key = models.BigIntegerField(default=0, verbose_name="Foydalanuvchi kaliti")
+    payload = models.JSONField(verbose_name="Update")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Holat")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Urinishlar")
+    error = models.TextField(blank=True, null=True, verbose_name="Xatolik")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Qabul qilingan vaqt")
+    processed_at = models.DateTimeField(blank=True, null=True, verbose_name="Qayta ishlangan vaqt")
+
+    class Meta:
+        verbose_name = "Webhook update"
+        verbose_name_plural = "Webhook update'lar"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='api_webhookupdate_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.update_id} ({self.status})"
@@ -0,0 +1,26 @@
+"""Bot-only endpoints: the bot proves itself with a shared secret header.
+
+The REST-mode bot sends settings.BOT_API_SECRET as X-Bot-Secret (see
+bot/api_client.py); INTERNAL mode calls the ORM directly and never comes
+through here. Staff users (admin session) are allowed as well. With no
+secret configured only staff users get in.
+"""
+import hmac
+
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+BOT_SECRET_HEADER = 'X-Bot-Secret'
+
+
+def is_bot_request(request) -> bool:
+    secret = settings.BOT_API_SECRET
+    sent = request.headers.get(BOT_SECRET_HEADER, '')
+    return bool(secret) and hmac.compare_digest(sent.encode(), secret.encode())
+
+
+class IsBotOrAdmin(BasePermission):
+    """Faqat bot (X-Bot-Secret) yoki admin foydalanuvchilar"""
+
+    def has_permission(self, request, view):
+        return is_bot_request(request) or bool(request.user and request.user.is_staff)
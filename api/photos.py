@@ -0,0 +1,114 @@
+"""Candidate photo derivatives.
+
+The original upload is kept as is; two re-encoded variants are derived from
+it: a size-capped JPEG that the bot sends to Telegram and a small WebP
+thumbnail for the admin. render_variants() only needs the original bytes,
+so bulk backfills can run it in a process pool (see build_photo_variants).
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .catalog import invalidate_catalog
+
+logger = logging.getLogger(__name__)
+
+# Telegram downsizes photos to 1280px on the long side anyway
+TELEGRAM_JPEG_QUALITY = 85
+THUMB_WEBP_QUALITY = 80
+
+
+def _encode(image, max_side, fmt, quality):
+    variant = image.copy()
+    variant.thumbnail((max_side, max_side), Image.LANCZOS)
+    buffer = BytesIO()
+    if fmt == 'JPEG':
+        variant.save(buffer, fmt, quality=quality, optimize=True, progressive=True)
+    else:
+        variant.save(buffer, fmt, quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def render_variants(data: bytes, telegram_side: int = None, thumb_side: int = None) -> dict:
+    """Asl rasm baytlaridan variantlar: {'telegram': JPEG baytlari, 'thumb': WebP baytlari}
+
+    Sizes are passed explicitly by process pool callers, whose workers may
+    not have Django settings configured.
+    """
+    telegram_side = telegram_side or settings.PHOTO_TELEGRAM_MAX_SIDE
+    thumb_side = thumb_side or settings.PHOTO_THUMB_MAX_SIDE
+    with Image.open(BytesIO(data)) as source:
+        # Apply the camera rotation before EXIF is dropped by re-encoding
+        image = ImageOps.exif_transpose(source)
+        if image.mode != 'RGB':
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+        return {
+            'telegram': _encode(image, telegram_side, 'JPEG', TELEGRAM_JPEG_QUALITY),
+            'thumb': _encode(image, thumb_side, 'WEBP', THUMB_WEBP_QUALITY),
+        }
+
+
+def read_photo(candidate) -> bytes:
+    with candidate.photo.open('rb') as f:
+        return f.read()
+
+
+def save_variants(candidate, variants: dict) -> None:
+    """Variantlarni saqlash va nomzod yozuvini yangilash (save() chaqirilmaydi).
+
+    The catalog is not invalidated here: sync_variants() does it for a
+    single edit, build_photo_variants once for the whole backfill.
+    """
+    from .models import Candidate
+
+    stem = os.path.splitext(os.path.basename(candidate.photo.name))[0]
+    for field_name, key, ext in (('photo_telegram', 'telegram', 'jpg'), ('photo_thumb', 'thumb', 'webp')):
+        field = getattr(candidate, field_name)
+        if field:
+            field.delete(save=False)
+        field.save(f"{stem}.{ext}", ContentFile(variants[key]), save=False)
+    candidate.photo_variants_source = candidate.photo.name
+
+    # Only if the photo was not replaced meanwhile
+    Candidate.objects.filter(pk=candidate.pk, photo=candidate.photo.name).update(
+        photo_telegram=candidate.photo_telegram.name,
+        photo_thumb=candidate.photo_thumb.name,
+        photo_variants_source=candidate.photo_variants_source,
+    )
+
+
+def clear_variants(candidate) -> None:
+    from .models import Candidate
+
+    for field in (candidate.photo_telegram, candidate.photo_thumb):
+        if field:
+            field.delete(save=False)
+    candidate.photo_variants_source = None
+    Candidate.objects.filter(pk=candidate.pk).update(
+        photo_telegram=None, photo_thumb=None, photo_variants_source=None
+    )
+
+
+def sync_variants(candidate) -> bool:
+    """Rasm o'zgargan bo'lsa variantlarni qayta yaratish. Xatolik rasm saqlanishiga to'sqinlik qilmaydi."""
+    current = candidate.photo.name if candidate.photo else None
+    if candidate.photo_variants_source == current:
+        return False
+    try:
+        if current:
+            save_variants(candidate, render_variants(read_photo(candidate)))
+        else:
+            clear_variants(candidate)
+    except Exception as e:
+        logger.error(f"Photo variants failed for candidate {candidate.pk}: {e}")
+        return False
+    # The catalog serves the variant's URL
+    invalidate_catalog()
+    return True
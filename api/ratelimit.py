@@ -0,0 +1,153 @@
+"""Per-user and per-IP rate limiting for the write-heavy endpoints.
+
+Limits are configured per scope in settings.RATE_LIMITS ("N/period", the
+DRF rate format). The default backend keeps one token bucket per
+(scope, key) in this process: a check is a dict lookup and a bit of
+arithmetic under a lock. With RATE_LIMIT_BACKEND='cache' the count is
+shared by all processes through the Django cache; the cache has no
+compare-and-set, so that backend counts fixed windows with cache.incr
+(same limit, coarser refill). The REST views use scoped_throttle(),
+APIClient INTERNAL mode calls rate_limiter.allow() directly. Requests with
+a valid X-Bot-Secret are exempt from the per-IP limit only.
+"""
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+from .permissions import is_bot_request
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Above this many buckets the least recently used ones are dropped
+MAX_BUCKETS = 100_000
+
+RATE_LIMITED_MESSAGE = "Juda ko'p so'rov yuborildi. Birozdan keyin qayta urinib ko'ring."
+
+
+def parse_rate(rate):
+    """'10/min' -> (10, 60); bo'sh qiymat - cheklov yo'q (None)"""
+    if not rate:
+        return None
+    num, period = rate.split('/')
+    return int(num), PERIODS[period.strip()[0]]
+
+
+class LocalBuckets:
+    """Jarayon ichidagi token bucket'lar"""
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity: int, period: float) -> float:
+        """Bitta token olish: 0 - ruxsat, aks holda keyingi tokengacha kutish (sekund)"""
+        now = time.monotonic()
+        refill = capacity / period
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill)
+            wait = (1 - tokens) / refill if tokens < 1 else 0
+            self._buckets[key] = (tokens if wait else tokens - 1, now)
+            self._buckets.move_to_end(key)
+            # Only idle buckets go: flooding new keys can not reset an active one
+            while len(self._buckets) > MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBuckets:
+    """Django cache orqali barcha jarayonlar uchun umumiy hisob (fixed window)"""
+
+    def take(self, key, capacity: int, period: float) -> float:
+        now = time.time()
+        window = int(now // period)
+        cache_key = f"ratelimit:{key[0]}:{key[1]}:{window}"
+        cache.add(cache_key, 0, timeout=int(period) + 1)
+        try:
+            count = cache.incr(cache_key)
+        except ValueError:
+            # Evicted between add() and incr()
+            cache.set(cache_key, 1, timeout=int(period) + 1)
+            count = 1
+        if count <= capacity:
+            return 0
+        return (window + 1) * period - now
+
+    def clear(self) -> None:
+        pass
+
+
+class RateLimiter:
+    """Scope bo'yicha cheklovlar va rad etilgan so'rovlar hisobi"""
+
+    def __init__(self):
+        self.local = LocalBuckets()
+        self.shared = CacheBuckets()
+        self.rejected = Counter()
+
+    def _backend(self):
+        return self.shared if settings.RATE_LIMIT_BACKEND == 'cache' else self.local
+
+    def check(self, scope: str, telegram_id=None, ip=None) -> float:
+        """0 - ruxsat; aks holda qancha kutish kerakligi (sekund)"""
+        backend = self._backend()
+        checks = []
+        if telegram_id:
+            checks.append((parse_rate(settings.RATE_LIMITS.get(scope)), (scope, f"user:{telegram_id}")))
+        if ip:
+            checks.append((parse_rate(settings.RATE_LIMIT_PER_IP), ('ip', ip)))
+        for rate, key in checks:
+            if rate is None:
+                continue
+            wait = backend.take(key, *rate)
+            if wait:
+                self.rejected[scope] += 1
+                logger.info(f"Rate limited {key[1]} on {scope} (rejected so far: {self.rejected[scope]})")
+                return wait
+        return 0
+
+    def allow(self, scope: str, telegram_id=None, ip=None) -> bool:
+        return not self.check(scope, telegram_id, ip)
+
+    def rejected_counts(self) -> dict:
+        return dict(self.rejected)
+
+    def reset(self) -> None:
+        self.local.clear()
+        self.rejected.clear()
+
+
+rate_limiter = RateLimiter()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """DRF throttle: scope bo'yicha foydalanuvchi (telegram_id) va IP cheklovi"""
+    scope = None
+
+    def allow_request(self, request, view):
+        data = request.data if request.method == 'POST' else request.query_params
+        # A JSON body may be a list or a scalar: only a dict carries telegram_id
+        telegram_id = (data.get('telegram_id') if isinstance(data, dict) else None) or view.kwargs.get('telegram_id')
+        # The REST-mode bot sends every user's requests from one IP
+        ip = None if is_bot_request(request) else self.get_ident(request)
+        self.wait_seconds = rate_limiter.check(self.scope, telegram_id, ip)
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+def scoped_throttle(scope: str):
+    """Berilgan scope uchun throttle klassi (throttle_classes ga)"""
+    return type(f"{scope.title().replace('_', '')}Throttle", (TokenBucketThrottle,), {'scope': scope})
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import TelegramUser, Channel, Poll, Region, District, Candidate, Vote
+from .voting import cast_vote, VoteRejected
 
 
 class TelegramUserSerializer(serializers.ModelSerializer):
@@ -18,7 +19,7 @@ class TelegramUserSerializer(serializers.ModelSerializer):
 class ChannelSerializer(serializers.ModelSerializer):
     class Meta:
         model = Channel
-        fields = ['id', 'channel_id', 'channel_username', 'title', 'description', 'is_active']
+        fields = ['id', 'channel_id', 'channel_username', 'title', 'invite_link', 'description', 'is_active']
         read_only_fields = ['id']
 
 
@@ -39,10 +40,12 @@ class CandidateSerializer(serializers.ModelSerializer):
     district_name = serializers.CharField(source='district.name', read_only=True)
     poll_id = serializers.IntegerField(source='poll.id', read_only=True)
     poll_title = serializers.CharField(source='poll.title', read_only=True)
+    photo_file_id = serializers.CharField(source='telegram_photo_file_id', read_only=True)
+    photo_telegram = serializers.ImageField(source='telegram_photo', read_only=True)
     
     class Meta:
         model = Candidate
-        fields = ['id', 'full_name', 'photo', 'bio', 'position', 'vote_count', 
+        fields = ['id', 'full_name', 'photo', 'photo_telegram', 'photo_file_id', 'bio', 'position', 'vote_count', 
                   'poll_id', 'poll_title', 'district_name', 'order']
         read_only_fields = ['id', 'vote_count']
 
@@ -90,49 +93,13 @@ class VoteCreateSerializer(serializers.Serializer):
     poll_id = serializers.IntegerField()
     candidate_id = serializers.IntegerField()
     
-    def validate(self, data):
-        # Foydalanuvchini tekshirish
-        try:
-            user = TelegramUser.objects.get(telegram_id=data['telegram_id'])
-        except TelegramUser.DoesNotExist:
-            raise serializers.ValidationError("Foydalanuvchi topilmadi!")
-        
-        # Pollni tekshirish
-        try:
-            poll = Poll.objects.get(id=data['poll_id'], is_active=True)
-        except Poll.DoesNotExist:
-            raise serializers.ValidationError("So'rovnoma topilmadi!")
-        
-        if not poll.is_open():
-            raise serializers.ValidationError("So'rovnoma yopiq!")
-        
-        # Foydalanuvchi bu pollda ovoz berganmi?
-        if user.has_voted_in_poll(poll.id):
-            raise serializers.ValidationError("Siz bu so'rovnomada allaqachon ovoz bergansiz!")
-        
-        # Nomzodni tekshirish
+    def create(self, validated_data):
+        # Checks and the INSERT are in api/voting.py (shared with INTERNAL mode)
         try:
-            candidate = Candidate.objects.get(
-                id=data['candidate_id'], 
-                is_active=True,
-                poll=poll
+            return cast_vote(
+                validated_data['telegram_id'],
+                validated_data['poll_id'],
+                validated_data['candidate_id'],
             )
-        except Candidate.DoesNotExist:
-            raise serializers.ValidationError("Nomzod topilmadi yoki bu so'rovnomaga tegishli emas!")
-        
-        data['user'] = user
-        data['poll'] = poll
-        data['candidate'] = candidate
-        return data
-    
-    def create(self, validated_data):
-        user = validated_data['user']
-        poll = validated_data['poll']
-        candidate = validated_data['candidate']
-        
-        vote = Vote.objects.create(
-            user=user,
-            poll=poll,
-            candidate=candidate
-        )
-        return vote
+        except VoteRejected as e:
+            raise serializers.ValidationError({'non_field_errors': [str(e)]})
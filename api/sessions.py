@@ -0,0 +1,59 @@
+"""/start session bootstrap and poll status, shared by the REST views and APIClient INTERNAL mode."""
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .catalog import get_catalog
+from .models import Channel, TelegramUser, Vote
+
+
+def _upsert_user(telegram_id, username, full_name) -> bool:
+    """Foydalanuvchini yaratish yoki yangilash; obuna holatini qaytaradi.
+
+    Returning users with unchanged names (the usual /start) cost one SELECT.
+    """
+    row = TelegramUser.objects.filter(telegram_id=telegram_id).values(
+        'username', 'full_name', 'is_subscribed'
+    ).first()
+    if row is None:
+        try:
+            with transaction.atomic():
+                TelegramUser.objects.create(telegram_id=telegram_id, username=username, full_name=full_name)
+            return False
+        except IntegrityError:
+            # Registered concurrently by another update of the same user
+            return _upsert_user(telegram_id, username, full_name)
+
+    if row['username'] != username or row['full_name'] != full_name:
+        TelegramUser.objects.filter(telegram_id=telegram_id).update(
+            username=username, full_name=full_name, updated_at=timezone.now()
+        )
+    return row['is_subscribed']
+
+
+def active_channels() -> list:
+    return list(Channel.objects.filter(is_active=True).values(
+        'id', 'channel_id', 'channel_username', 'title', 'invite_link'
+    ))
+
+
+def bootstrap_session(telegram_id, username='', full_name='') -> dict:
+    """/start uchun hammasi bitta so'rovda: foydalanuvchi, obuna holati, kanallar va so'rovnomalar"""
+    is_subscribed = _upsert_user(int(telegram_id), username or '', full_name or '')
+    return {
+        'telegram_id': int(telegram_id),
+        'is_subscribed': is_subscribed,
+        # Subscribed users skip the channel step, no need to load channels
+        'channels': [] if is_subscribed else active_channels(),
+        'polls': get_catalog().poll_list(),
+    }
+
+
+def poll_status(telegram_id, poll_id) -> dict:
+    """Bitta (foydalanuvchi, so'rovnoma) uchun: ochiqmi va ovoz berganmi"""
+    return {
+        'poll_id': int(poll_id),
+        # Open state comes from the cached schedule; the only query is the
+        # (user, poll) unique index lookup
+        'is_open': get_catalog().poll_is_open(poll_id),
+        'has_voted_in_poll': Vote.objects.filter(user__telegram_id=telegram_id, poll_id=poll_id).exists(),
+    }
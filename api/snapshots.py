@@ -0,0 +1,183 @@
+"""Materialized poll results (PollResultSnapshot + ResultSnapshotEntry).
+
+A snapshot holds candidate, district and region totals of every vote up to
+last_vote_id. Refreshing only aggregates the votes after that high-water
+mark and adds them to the stored totals, so a dashboard polling the
+results costs the same whether the poll has a thousand votes or ten
+million. Votes younger than RESULT_SNAPSHOT_SETTLE_SECONDS are left for the
+next refresh: a transaction that is still open may commit a lower id than
+the ones already folded in. Deleted or moved votes can not be seen through
+the high-water mark; they mark the snapshot for a full rebuild instead
+(also available as manage.py refresh_result_snapshots --full). A vote that
+still commits below the mark after the settle time is caught by comparing
+the snapshot with Poll.total_votes, which marks it for a rebuild as well.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FloatField, Max, OuterRef, Subquery, Sum, Value, Window
+from django.db.models.functions import Cast, Coalesce, NullIf, Rank, Round
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from .counters import pending_deltas, votes_deleting
+from .models import Candidate, Poll, PollResultSnapshot, ResultSnapshotEntry, Vote
+
+KINDS = (ResultSnapshotEntry.KIND_CANDIDATE, ResultSnapshotEntry.KIND_DISTRICT, ResultSnapshotEntry.KIND_REGION)
+
+
+def _locked_snapshot(poll_id) -> PollResultSnapshot:
+    try:
+        with transaction.atomic():
+            PollResultSnapshot.objects.get_or_create(poll_id=poll_id)
+    except IntegrityError:
+        # Created concurrently
+        pass
+    return PollResultSnapshot.objects.select_for_update().get(poll_id=poll_id)
+
+
+def _aggregate(poll_id, after_id, up_to_id):
+    """(after_id, up_to_id] oralig'idagi ovozlar: {(kind, object_id): (district_id, votes)}"""
+    totals = {}
+    rows = Vote.objects.filter(poll_id=poll_id, id__gt=after_id, id__lte=up_to_id).values(
+        'candidate_id', 'candidate__district_id', 'candidate__district__region_id'
+    ).annotate(votes=Count('id')).order_by()
+    for row in rows:
+        district_id, region_id = row['candidate__district_id'], row['candidate__district__region_id']
+        _add(totals, ResultSnapshotEntry.KIND_CANDIDATE, row['candidate_id'], row['votes'], district_id)
+        if district_id:
+            _add(totals, ResultSnapshotEntry.KIND_DISTRICT, district_id, row['votes'])
+            _add(totals, ResultSnapshotEntry.KIND_REGION, region_id, row['votes'])
+    return totals
+
+
+def _add(totals, kind, object_id, votes, district_id=None):
+    current = totals.get((kind, object_id), (district_id, 0))
+    totals[(kind, object_id)] = (district_id, current[1] + votes)
+
+
+def _fold(snapshot, totals) -> None:
+    """Yangi jamlarni mavjud yozuvlarga qo'shish (bitta SELECT, bulk_update va bulk_create)"""
+    if not totals:
+        return
+    by_kind = defaultdict(list)
+    for kind, object_id in totals:
+        by_kind[kind].append(object_id)
+    existing = []
+    for kind, object_ids in by_kind.items():
+        existing += ResultSnapshotEntry.objects.filter(snapshot=snapshot, kind=kind, object_id__in=object_ids)
+
+    for entry in existing:
+        district_id, votes = totals.pop((entry.kind, entry.object_id))
+        entry.votes += votes
+        # A candidate may have been moved to another district
+        entry.district_id = district_id
+    ResultSnapshotEntry.objects.bulk_update(existing, ['votes', 'district_id'], batch_size=500)
+    ResultSnapshotEntry.objects.bulk_create([
+        ResultSnapshotEntry(snapshot=snapshot, kind=kind, object_id=object_id, district_id=district_id, votes=votes)
+        for (kind, object_id), (district_id, votes) in totals.items()
+    ], batch_size=500)
+
+
+def _missed_votes(poll_id, snapshot) -> bool:
+    """Yuqori belgidan past id bilan kech commit bo'lgan ovoz bormi (hisoblagich bilan solishtirish)"""
+    # Counter first, then the tail: a vote committing in between only makes the tail larger
+    counted = Poll.objects.filter(pk=poll_id).values_list('total_votes', flat=True).first() or 0
+    counted += pending_deltas('poll', [poll_id]).get(poll_id, 0)
+    tail = Vote.objects.filter(poll_id=poll_id, id__gt=snapshot.last_vote_id).count()
+    return snapshot.total_votes + tail < counted
+
+
+def refresh_snapshot(poll_id, full: bool = False) -> PollResultSnapshot:
+    """Yangi ovozlarni nusxaga qo'shish (full=True yoki needs_rebuild - noldan hisoblash)"""
+    with transaction.atomic():
+        snapshot = _locked_snapshot(poll_id)
+        settled = timezone.now() - timedelta(seconds=settings.RESULT_SNAPSHOT_SETTLE_SECONDS)
+        rebuild = full or snapshot.needs_rebuild
+        if rebuild:
+            snapshot.entries.all().delete()
+            snapshot.last_vote_id = 0
+            snapshot.total_votes = 0
+            snapshot.needs_rebuild = False
+
+        high_water = Vote.objects.filter(
+            poll_id=poll_id, id__gt=snapshot.last_vote_id, voted_at__lte=settled
+        ).aggregate(high=Max('id'))['high']
+        if high_water:
+            totals = _aggregate(poll_id, snapshot.last_vote_id, high_water)
+            snapshot.total_votes += sum(
+                votes for (kind, _), (_, votes) in totals.items() if kind == ResultSnapshotEntry.KIND_CANDIDATE
+            )
+            _fold(snapshot, totals)
+            snapshot.last_vote_id = high_water
+        # Not right after a rebuild: a mismatch there means the counter itself is off
+        if not rebuild and _missed_votes(poll_id, snapshot):
+            snapshot.needs_rebuild = True
+        snapshot.refreshed_at = timezone.now()
+        snapshot.save()
+    return snapshot
+
+
+def get_snapshot(poll_id) -> PollResultSnapshot:
+    """Natijalar nusxasi; RESULT_SNAPSHOT_MAX_AGE dan eski bo'lsa avval yangilanadi"""
+    snapshot = PollResultSnapshot.objects.filter(poll_id=poll_id).first()
+    fresh_after = timezone.now() - timedelta(seconds=settings.RESULT_SNAPSHOT_MAX_AGE)
+    if snapshot is None or snapshot.needs_rebuild or not snapshot.refreshed_at or snapshot.refreshed_at < fresh_after:
+        snapshot = refresh_snapshot(poll_id)
+    return snapshot
+
+
+def snapshot_totals(snapshot, kind) -> dict:
+    """{object_id: votes} nusxadagi bitta tur uchun"""
+    return dict(snapshot.entries.filter(kind=kind).values_list('object_id', 'votes'))
+
+
+def ranked_results(snapshot, district_id=None, top=None):
+    """Nomzodlar natijasi bitta so'rovda: ovozlar, o'rin (teng ovoz - teng o'rin), foiz va jami
+
+    Ranks, percentages and the total are window functions over the
+    (optionally district-filtered) candidates; top=N keeps ranks <= N, so
+    candidates tied on the last place are all returned.
+    """
+    # 'votes' is taken by the reverse relation, hence result_votes
+    votes = Coalesce(Subquery(
+        ResultSnapshotEntry.objects.filter(
+            snapshot=snapshot, kind=ResultSnapshotEntry.KIND_CANDIDATE, object_id=OuterRef('pk')
+        ).values('votes')[:1]
+    ), Value(0))
+    candidates = Candidate.objects.filter(poll_id=snapshot.poll_id)
+    if district_id:
+        candidates = candidates.filter(district_id=district_id)
+    candidates = candidates.annotate(result_votes=votes).annotate(
+        rank=Window(Rank(), order_by=F('result_votes').desc()),
+        total=Window(Sum('result_votes')),
+    ).annotate(
+        percentage=Coalesce(
+            Round(Cast(F('result_votes'), FloatField()) * 100 / NullIf(F('total'), 0), 1),
+            Value(0.0),
+        ),
+    )
+    if top:
+        candidates = candidates.filter(rank__lte=top)
+    return list(candidates.order_by('rank', 'order', 'full_name').values(
+        'id', 'full_name', 'position', 'result_votes', 'rank', 'total', 'percentage'
+    ))
+
+
+def _vote_changed(sender, instance, created=False, **kwargs) -> None:
+    if created or kwargs.get('raw'):
+        return
+    # Updated (moved) vote: the high-water mark can not express it
+    PollResultSnapshot.objects.filter(poll_id=instance.poll_id).update(needs_rebuild=True)
+
+
+def _votes_deleting(sender, poll_ids, **kwargs) -> None:
+    PollResultSnapshot.objects.filter(poll_id__in=poll_ids).update(needs_rebuild=True)
+
+
+def connect_signals() -> None:
+    post_save.connect(_vote_changed, sender=Vote, dispatch_uid='snapshot_vote_save')
+    # No post_delete on Vote: it would turn cascades into row-by-row deletes
+    votes_deleting.connect(_votes_deleting, dispatch_uid='snapshot_votes_delete')
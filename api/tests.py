@@ -1,3 +1,855 @@
-from django.test import TestCase
+import asyncio
+import shutil
+import tempfile
+import time
+from io import BytesIO
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+
+from .models import BotState, CacheVersion, Channel, TelegramUser, Poll, Region, District, Candidate, Vote
+
+
+class DjangoPersistenceTests(TransactionTestCase):
+    """bot.persistence.DjangoPersistence - qatorma-qator saqlash"""
+
+    def test_user_data_is_stored_per_user(self):
+        from bot.persistence import DjangoPersistence
+
+        async def scenario():
+            writer = DjangoPersistence()
+            await asyncio.gather(
+                writer.update_user_data(1, {'poll_id': 3}),
+                writer.update_user_data(2, {'region_id': 7}),
+            )
+            reader = DjangoPersistence()
+            data = {}
+            await reader.refresh_user_data(1, data)
+            return data
+
+        self.assertEqual(asyncio.run(scenario()), {'poll_id': 3})
+        self.assertEqual(BotState.objects.filter(kind='user').count(), 2)
+
+    def test_refresh_keeps_unflushed_local_changes(self):
+        from bot.persistence import DjangoPersistence
+
+        async def scenario():
+            persistence = DjangoPersistence()
+            await persistence.update_user_data(1, {'poll_id': 3})
+            data = {'poll_id': 4}
+            # Nobody else wrote the row, so the local (newer) copy must win
+            await persistence.refresh_user_data(1, data)
+            return data
+
+        self.assertEqual(asyncio.run(scenario()), {'poll_id': 4})
+
+    def test_seen_versions_are_bounded(self):
+        from unittest import mock
+        from bot.persistence import DjangoPersistence
+
+        async def scenario():
+            persistence = DjangoPersistence()
+            with mock.patch('bot.persistence.SEEN_MAX_ENTRIES', 2):
+                for user_id in range(1, 4):
+                    await persistence.update_user_data(user_id, {'poll_id': user_id})
+            return persistence
+
+        self.assertEqual(list(asyncio.run(scenario())._seen), [('user', '2'), ('user', '3')])
+
+    def test_pending_write_is_a_snapshot(self):
+        from bot.persistence import DjangoPersistence
+
+        async def scenario():
+            persistence = DjangoPersistence()
+            data = {'poll_id': 3}
+            write = asyncio.ensure_future(persistence.update_user_data(1, data))
+            await asyncio.sleep(0)
+            # A handler changes user_data before the flush runs
+            data['poll_id'] = 4
+            await write
+
+        asyncio.run(scenario())
+        self.assertEqual(BotState.objects.get(kind='user', key='1').data, {'poll_id': 3})
+
+
+class WebhookQueueTests(TestCase):
+    """bot.update_queue.QueueWorker - navbatdan olish, qayta urinish va tozalash"""
+
+    def test_failed_update_is_finished_then_pruned(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from bot.update_queue import QueueWorker, enqueue_update
+        from api.models import WebhookUpdate
+
+        enqueue_update({'update_id': 1, 'message': {'from': {'id': 5}}})
+        worker = QueueWorker(application=None)
+        rows = worker._claim(10)
+        self.assertEqual([row['attempts'] for row in rows], [0])
+        # Claimed rows are not handed out again
+        self.assertEqual(worker._claim(10), [])
+        worker._finish(rows[0]['id'], 3, 'boom')
+        update = WebhookUpdate.objects.get()
+        self.assertEqual((update.status, update.attempts), (WebhookUpdate.STATUS_FAILED, 3))
+
+        WebhookUpdate.objects.update(processed_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(worker._prune(), 1)
+
+    def test_failed_update_is_retried_before_later_ones(self):
+        from unittest import mock
+        from bot import update_queue
+
+        handled = []
+
+        class Application:
+            bot = None
+
+            async def process_update(self, update):
+                handled.append(update.update_id)
+                if handled == [1]:
+                    raise RuntimeError('boom')
+
+        worker = update_queue.QueueWorker(application=Application())
+        finished = []
+        worker._finish = lambda row_id, attempts, error: finished.append((row_id, attempts, error))
+
+        async def scenario():
+            queue = asyncio.Queue()
+            for update_id in (1, 2):
+                worker._in_flight += 1
+                queue.put_nowait({'id': update_id, 'payload': {'update_id': update_id}, 'attempts': 0})
+            queue.put_nowait(None)
+            await worker._lane(queue)
+
+        with mock.patch.object(update_queue, 'RETRY_DELAY', 0):
+            asyncio.run(scenario())
+        self.assertEqual(handled, [1, 1, 2])
+        self.assertEqual(finished, [(1, 2, None), (2, 1, None)])
+
+
+@override_settings(PHOTO_VARIANTS_ON_SAVE=False)
+class CandidatePhotoFileIdTests(TestCase):
+    """Nomzod rasmining Telegram file_id keshi"""
+
+    def setUp(self):
+        poll = Poll.objects.create(title='Test')
+        self.candidate = Candidate.objects.create(poll=poll, full_name='Nomzod', photo='candidates/a.jpg')
+
+    def test_file_id_is_dropped_when_photo_changes(self):
+        self.assertTrue(self.candidate.remember_photo_file_id('FILE-A', '/media/candidates/a.jpg'))
+        self.assertEqual(Candidate.objects.get().telegram_photo_file_id, 'FILE-A')
+
+        self.candidate.photo = 'candidates/b.jpg'
+        self.candidate.save()
+        self.assertIsNone(Candidate.objects.get().telegram_photo_file_id)
+
+    def test_stale_upload_is_not_stored(self):
+        self.assertFalse(self.candidate.remember_photo_file_id('FILE-OLD', '/media/candidates/old.jpg'))
+        self.assertIsNone(Candidate.objects.get().photo_file_id)
+
+
+class CandidatePhotoVariantsTests(TestCase):
+    """api/photos.py - Telegram va admin uchun rasm variantlari"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.poll = Poll.objects.create(title='Test')
+
+    def _upload(self, size, name='big.png'):
+        buffer = BytesIO()
+        Image.new('RGBA', size, (200, 10, 10, 255)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_variants_are_built_on_save(self):
+        candidate = Candidate.objects.create(poll=self.poll, full_name='Nomzod', photo=self._upload((3000, 1500)))
+        candidate.refresh_from_db()
+
+        self.assertEqual(candidate.photo_variants_source, candidate.photo.name)
+        self.assertEqual(candidate.telegram_photo, candidate.photo_telegram)
+        with Image.open(candidate.photo_telegram.path) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (1280, 640)))
+        with Image.open(candidate.photo_thumb.path) as image:
+            self.assertEqual((image.format, max(image.size)), ('WEBP', 200))
+
+    def test_replaced_photo_gets_new_variants(self):
+        candidate = Candidate.objects.create(poll=self.poll, full_name='Nomzod', photo=self._upload((800, 800)))
+        first = candidate.photo_telegram.name
+
+        candidate.photo = self._upload((600, 900), name='new.png')
+        candidate.save()
+        candidate.refresh_from_db()
+        self.assertNotEqual(candidate.photo_telegram.name, first)
+        self.assertEqual(candidate.photo_variants_source, candidate.photo.name)
+
+
+class CatalogTests(TestCase):
+    """api/catalog.py - so'rovnoma katalogi keshi"""
+
+    def setUp(self):
+        from . import catalog
+        self.catalog = catalog
+        catalog._drop_local()
+        self.addCleanup(catalog._drop_local)
+        poll = Poll.objects.create(title='Saylov')
+        self.region = Region.objects.create(poll=poll, name='Toshkent')
+        self.district = District.objects.create(region=self.region, name='Chilonzor')
+        Candidate.objects.create(poll=poll, district=self.district, full_name='Nomzod')
+
+    def test_catalog_is_served_from_memory(self):
+        self.assertEqual(len(self.catalog.get_catalog().district_candidates(self.district.id)), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.catalog.get_catalog().districts(self.region.id)[0]['name'], 'Chilonzor')
+
+    def test_save_invalidates_catalog(self):
+        self.catalog.get_catalog()
+        District.objects.create(region=self.region, name='Yunusobod')
+        names = [d['name'] for d in self.catalog.get_catalog().districts(self.region.id)]
+        self.assertEqual(names, ['Chilonzor', 'Yunusobod'])
+
+    def test_photo_file_id_is_patched_without_new_version(self):
+        candidate = Candidate.objects.get()
+        Candidate.objects.filter(pk=candidate.pk).update(photo='candidates/a.jpg')
+        candidate.refresh_from_db()
+        version = self.catalog.get_catalog().version
+
+        self.assertTrue(candidate.remember_photo_file_id('FILE-A'))
+        # Still the loaded copy: nothing was dropped
+        with self.assertNumQueries(0):
+            catalog = self.catalog.get_catalog()
+        self.assertEqual((catalog.version, catalog.candidate(candidate.pk)['photo_file_id']), (version, 'FILE-A'))
+
+    @override_settings(CATALOG_VERSION_CHECK_INTERVAL=0)
+    def test_version_stamp_reloads_changes_from_other_processes(self):
+        self.catalog.get_catalog()
+        # Simulate another process: change the data bypassing signals and bump the stamp
+        District.objects.filter(pk=self.district.pk).update(name='Mirobod')
+        self.assertEqual(self.catalog.get_catalog().districts(self.region.id)[0]['name'], 'Chilonzor')
+        CacheVersion.objects.update_or_create(key=self.catalog.CATALOG_KEY, defaults={'version': 99})
+        self.assertEqual(self.catalog.get_catalog().districts(self.region.id)[0]['name'], 'Mirobod')
+
+
+@override_settings(BOT_API_SECRET='s3cret')
+class BotOnlyEndpointTests(TestCase):
+    """api/permissions.py - faqat bot yoki admin yozadigan endpoint'lar"""
+
+    def test_membership_write_needs_bot_secret(self):
+        from rest_framework.test import APIRequestFactory
+        from .models import ChannelMembership
+        from .views import channel_memberships
+
+        Channel.objects.create(channel_id='-1001', title='Kanal')
+        factory = APIRequestFactory()
+        data = {'memberships': [{'telegram_id': 1, 'chat_id': -1001, 'status': 'member'}]}
+        response = channel_memberships(factory.post('/api/channel-memberships/', data, format='json'))
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(ChannelMembership.objects.exists())
+
+        response = channel_memberships(factory.post(
+            '/api/channel-memberships/', data, format='json', HTTP_X_BOT_SECRET='s3cret'
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(ChannelMembership.objects.exists())
+
+    def test_invite_link_needs_bot_secret(self):
+        from rest_framework.test import APIRequestFactory
+        from .views import ChannelViewSet
+
+        channel = Channel.objects.create(channel_id='-1001', title='Kanal')
+        # As the router builds it, with the action's own permission_classes
+        view = ChannelViewSet.as_view({'post': 'invite_link'}, **ChannelViewSet.invite_link.kwargs)
+        request = APIRequestFactory().post('/', {'invite_link': 'https://t.me/+evil'}, format='json')
+        self.assertEqual(view(request, pk=channel.pk).status_code, 403)
+        request = APIRequestFactory().post(
+            '/', {'invite_link': 'https://t.me/+abc'}, format='json', HTTP_X_BOT_SECRET='s3cret'
+        )
+        self.assertEqual(view(request, pk=channel.pk).status_code, 200)
+        self.assertEqual(Channel.objects.get().invite_link, 'https://t.me/+abc')
+
+
+class SessionBootstrapTests(TestCase):
+    """api/sessions.py - /start uchun bitta so'rov"""
+
+    def setUp(self):
+        from . import catalog
+        catalog._drop_local()
+        self.addCleanup(catalog._drop_local)
+        Channel.objects.create(channel_id='-1001', title='Kanal', invite_link='https://t.me/+abc')
+        Poll.objects.create(title='Saylov')
+
+    def test_registers_user_and_returns_everything(self):
+        from .sessions import bootstrap_session
+
+        session = bootstrap_session(42, 'user', 'Foydalanuvchi')
+        self.assertFalse(session['is_subscribed'])
+        self.assertEqual(session['channels'][0]['invite_link'], 'https://t.me/+abc')
+        self.assertEqual([p['title'] for p in session['polls']], ['Saylov'])
+        self.assertTrue(TelegramUser.objects.filter(telegram_id=42, full_name='Foydalanuvchi').exists())
+
+    def test_returning_user_costs_two_queries(self):
+        from .sessions import bootstrap_session
+
+        bootstrap_session(42, 'user', 'Foydalanuvchi')
+        with self.assertNumQueries(2):
+            bootstrap_session(42, 'user', 'Foydalanuvchi')
+
+    def test_bootstrap_rejects_non_numeric_id(self):
+        from rest_framework.test import APIRequestFactory
+        from .views import session_bootstrap
+
+        request = APIRequestFactory().post('/', {'telegram_id': 'abc'}, format='json')
+        self.assertEqual(session_bootstrap(request).status_code, 400)
+
+    def test_failed_bootstrap_keeps_channel_check(self):
+        from unittest import mock
+        from bot import bot
+
+        channel = {'id': 1, 'channel_id': '-1001', 'title': 'Kanal', 'invite_link': 'https://t.me/+abc'}
+        # INTERNAL-mode error and REST 429 responses
+        for response in ({'status': 'error', 'message': 'x'}, {'detail': 'Request was throttled.'}):
+            update = mock.Mock()
+            update.message.reply_text = mock.AsyncMock()
+            with mock.patch.object(bot, 'api') as api, \
+                    mock.patch.object(bot, 'show_polls', mock.AsyncMock()) as show_polls, \
+                    mock.patch.object(bot.membership, 'cached_all_member', return_value=False):
+                api.bootstrap_session = mock.AsyncMock(return_value=response)
+                api.get_channels = mock.AsyncMock(return_value=[channel])
+                state = asyncio.run(bot.start(update, mock.Mock()))
+            self.assertEqual(state, bot.CHECKING_SUBSCRIPTION)
+            show_polls.assert_not_called()
+            update.message.reply_text.assert_awaited_once()
+
+    def test_poll_status_is_one_query(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .sessions import poll_status
+
+        closed = Poll.objects.create(title='Yopiq', end_date=timezone.now() - timedelta(days=1))
+        poll_status(42, closed.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                poll_status(42, closed.id),
+                {'poll_id': closed.id, 'is_open': False, 'has_voted_in_poll': False}
+            )
+
+    def test_poll_status_rejects_non_numeric_ids(self):
+        from rest_framework.test import APIRequestFactory
+        from .views import PollViewSet
+
+        view = PollViewSet.as_view({'get': 'status'})
+        factory = APIRequestFactory()
+        self.assertEqual(view(factory.get('/', {'telegram_id': 42}), pk='abc').status_code, 404)
+        self.assertEqual(view(factory.get('/', {'telegram_id': 'x'}), pk='1').status_code, 400)
+
+    def test_compact_catalog_endpoints_reject_non_numeric_ids(self):
+        from rest_framework.test import APIRequestFactory
+        from .views import CandidateViewSet, DistrictViewSet, PollViewSet
+
+        factory = APIRequestFactory()
+        regions = PollViewSet.as_view({'get': 'regions'})
+        self.assertEqual(regions(factory.get('/', {'compact': 1}), pk='abc').status_code, 404)
+        by_region = DistrictViewSet.as_view({'get': 'by_region'})
+        self.assertEqual(by_region(factory.get('/', {'compact': 1, 'region_id': 'x'})).status_code, 400)
+        by_district = CandidateViewSet.as_view({'get': 'by_district'})
+        self.assertEqual(by_district(factory.get('/', {'compact': 1, 'district_id': 'x'})).status_code, 400)
+
+
+class VoteCounterTests(TestCase):
+    """api/counters.py - ovoz hisoblagichlari"""
+
+    def setUp(self):
+        self.poll = Poll.objects.create(title='Saylov')
+        self.region = Region.objects.create(poll=self.poll, name='Toshkent')
+        self.district = District.objects.create(region=self.region, name='Chilonzor')
+        self.candidate = Candidate.objects.create(poll=self.poll, district=self.district, full_name='Nomzod')
+        self.users = [TelegramUser.objects.create(telegram_id=i, full_name=f'U{i}') for i in range(1, 4)]
+
+    def _counts(self):
+        return (
+            Candidate.objects.get(pk=self.candidate.pk).vote_count,
+            District.objects.get(pk=self.district.pk).total_votes,
+            Region.objects.get(pk=self.region.pk).total_votes,
+            Poll.objects.get(pk=self.poll.pk).total_votes,
+        )
+
+    def test_counters_follow_vote_insert_and_delete(self):
+        votes = [Vote.objects.create(user=user, poll=self.poll, candidate=self.candidate) for user in self.users]
+        self.assertEqual(self._counts(), (3, 3, 3, 3))
+
+        votes[0].delete()
+        self.assertEqual(self._counts(), (2, 2, 2, 2))
+
+    def test_cascaded_deletes_adjust_counters_with_fast_delete(self):
+        from django.db.models.deletion import Collector
+
+        other = Candidate.objects.create(poll=self.poll, district=self.district, full_name='Ikkinchi')
+        Vote.objects.create(user=self.users[0], poll=self.poll, candidate=self.candidate)
+        Vote.objects.create(user=self.users[1], poll=self.poll, candidate=self.candidate)
+        Vote.objects.create(user=self.users[2], poll=self.poll, candidate=other)
+        # Vote has no delete receivers, so cascades never load the vote rows
+        self.assertTrue(Collector(using='default').can_fast_delete(Vote.objects.all()))
+
+        other.delete()
+        self.assertEqual(self._counts(), (2, 2, 2, 2))
+        TelegramUser.objects.filter(pk=self.users[0].pk).delete()
+        self.assertEqual(self._counts(), (1, 1, 1, 1))
+        Vote.objects.all().delete()
+        self.assertEqual(self._counts(), (0, 0, 0, 0))
+
+    def test_moved_candidate_and_district_take_their_votes(self):
+        for user in self.users[:2]:
+            Vote.objects.create(user=user, poll=self.poll, candidate=self.candidate)
+        other_region = Region.objects.create(poll=self.poll, name='Samarqand')
+        other_district = District.objects.create(region=other_region, name='Urgut')
+
+        self.candidate.district = other_district
+        self.candidate.save()
+        self.assertEqual(self._counts(), (2, 0, 0, 2))
+        self.assertEqual((District.objects.get(pk=other_district.pk).total_votes,
+                          Region.objects.get(pk=other_region.pk).total_votes), (2, 2))
+
+        other_district.region = self.region
+        other_district.save()
+        self.assertEqual(self._counts(), (2, 0, 2, 2))
+        self.assertEqual(Region.objects.get(pk=other_region.pk).total_votes, 0)
+
+    def test_reconcile_rebuilds_counters(self):
+        from .counters import reconcile_counts
+
+        for user in self.users:
+            Vote.objects.create(user=user, poll=self.poll, candidate=self.candidate)
+        Candidate.objects.update(vote_count=0)
+        Poll.objects.update(total_votes=10)
+
+        reconcile_counts()
+        self.assertEqual(self._counts(), (3, 3, 3, 3))
+
+    @override_settings(VOTE_COUNTER_SHARDS=4)
+    def test_reconcile_folds_sharded_counters(self):
+        from .counters import reconcile_counts
+        from .models import VoteCounterShard
+
+        for user in self.users:
+            Vote.objects.create(user=user, poll=self.poll, candidate=self.candidate)
+        reconcile_counts()
+        self.assertEqual(self._counts(), (3, 3, 3, 3))
+        self.assertFalse(VoteCounterShard.objects.exists())
+
+    @override_settings(VOTE_COUNTER_SHARDS=4)
+    def test_sharded_counters_are_compacted(self):
+        from .catalog import attach_vote_counts
+        from .counters import compact_counters
+
+        for user in self.users:
+            Vote.objects.create(user=user, poll=self.poll, candidate=self.candidate)
+        # Columns are untouched until compaction, readers add the pending shards
+        self.assertEqual(self._counts(), (0, 0, 0, 0))
+        self.assertEqual(attach_vote_counts([{'id': self.candidate.id}])[0]['vote_count'], 3)
+
+        compact_counters()
+        self.assertEqual(self._counts(), (3, 3, 3, 3))
+        self.assertEqual(attach_vote_counts([{'id': self.candidate.id}])[0]['vote_count'], 3)
+
+
+class CastVoteTests(TransactionTestCase):
+    """api/voting.py - bitta so'rovli tekshiruv va unique cheklov"""
+
+    def setUp(self):
+        self.poll = Poll.objects.create(title='Saylov')
+        self.candidate = Candidate.objects.create(poll=self.poll, full_name='Nomzod')
+        self.user = TelegramUser.objects.create(telegram_id=42, full_name='U')
+
+    def test_rejections(self):
+        from .voting import cast_vote, VoteRejected, ALREADY_VOTED
+
+        other_poll = Poll.objects.create(title='Boshqa')
+        with self.assertRaisesMessage(VoteRejected, "Foydalanuvchi topilmadi!"):
+            cast_vote(1, self.poll.id, self.candidate.id)
+        with self.assertRaisesMessage(VoteRejected, "Nomzod topilmadi"):
+            cast_vote(42, other_poll.id, self.candidate.id)
+
+        cast_vote(42, self.poll.id, self.candidate.id)
+        with self.assertRaisesMessage(VoteRejected, ALREADY_VOTED):
+            cast_vote(42, self.poll.id, self.candidate.id)
+        self.assertEqual(Candidate.objects.get(pk=self.candidate.pk).vote_count, 1)
+
+    def test_concurrent_duplicate_votes(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import OperationalError, connection
+        from .voting import cast_vote, VoteRejected
+
+        def vote(_):
+            try:
+                for _ in range(50):
+                    try:
+                        cast_vote(42, self.poll.id, self.candidate.id)
+                        return 'ok'
+                    except OperationalError:
+                        # SQLite test database: writer lock busy, try again
+                        continue
+                return 'locked'
+            except VoteRejected:
+                return 'rejected'
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(vote, range(8)))
+
+        self.assertEqual(results.count('ok'), 1)
+        self.assertEqual(results.count('rejected'), 7)
+        self.assertEqual(Vote.objects.count(), 1)
+        self.assertEqual(Candidate.objects.get(pk=self.candidate.pk).vote_count, 1)
+
+    def test_buffered_votes(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import connection
+        from .vote_buffer import VoteBuffer
+
+        users = [self.user] + [TelegramUser.objects.create(telegram_id=100 + i, full_name='U') for i in range(4)]
+        Vote.objects.create(user=users[1], poll=self.poll, candidate=self.candidate)
+        buffer = VoteBuffer(flush_interval=0.05, max_rows=100)
+        buffer.start()
+
+        def vote(user):
+            try:
+                return buffer.submit(Vote(user=user, poll=self.poll, candidate=self.candidate)).accepted
+            finally:
+                connection.close()
+
+        # users[0] twice (in-memory set), users[1] already in the table (unique constraint)
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            results = list(pool.map(vote, [users[0], users[0], users[1], users[2], users[3], users[4]]))
+        buffer.stop()
+
+        self.assertEqual(results.count(True), 4)
+        self.assertFalse(results[2])
+        self.assertEqual(Vote.objects.count(), 5)
+        self.assertEqual(Candidate.objects.get(pk=self.candidate.pk).vote_count, 5)
+
+    def test_buffered_vote_after_deleted_vote(self):
+        from .vote_buffer import VoteBuffer
+
+        buffer = VoteBuffer(flush_interval=0.01, max_rows=100)
+        buffer.start()
+        self.addCleanup(buffer.stop)
+        self.assertTrue(buffer.submit(Vote(user=self.user, poll=self.poll, candidate=self.candidate)).accepted)
+        # Deleted by an admin: the in-memory "already voted" entry must not block the user
+        Vote.objects.all().delete()
+        self.assertTrue(buffer.submit(Vote(user=self.user, poll=self.poll, candidate=self.candidate)).accepted)
+
+        # Nobody flushes this one: the caller hears "pending", not an error
+        idle = VoteBuffer(flush_interval=1, max_rows=100)
+        pending = idle.submit(Vote(user=self.user, poll=self.poll, candidate=self.candidate), timeout=0.01)
+        self.assertEqual((pending.timed_out, pending.error), (True, None))
+
+
+class IdempotencyTests(TestCase):
+    """api/idempotency.py - takroriy so'rovlar birinchi natijani oladi"""
+
+    def test_replayed_vote_returns_first_result(self):
+        from .idempotency import run_once
+        from .voting import cast_vote, VoteRejected
+
+        poll = Poll.objects.create(title='Saylov')
+        candidate = Candidate.objects.create(poll=poll, full_name='Nomzod')
+        TelegramUser.objects.create(telegram_id=42, full_name='U')
+
+        def submit():
+            try:
+                cast_vote(42, poll.id, candidate.id)
+            except VoteRejected as e:
+                return {'status': 'error', 'message': str(e)}
+            return {'status': 'success'}
+
+        self.assertEqual(run_once('vote:1:7', submit), {'status': 'success'})
+        with self.assertNumQueries(1):
+            self.assertEqual(run_once('vote:1:7', submit), {'status': 'success'})
+        # Without the key the same vote is rejected by the unique constraint
+        self.assertEqual(run_once('vote:1:8', submit)['status'], 'error')
+        self.assertEqual(Vote.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_KEY_TTL=-1)
+    def test_expired_key_is_claimed_again(self):
+        from .idempotency import claim
+
+        self.assertTrue(claim('update:5'))
+        self.assertTrue(claim('update:5'))
+
+    def test_claim_and_release(self):
+        from .idempotency import claim, release
+
+        self.assertTrue(claim('update:5'))
+        self.assertFalse(claim('update:5'))
+        release('update:5')
+        self.assertTrue(claim('update:5'))
+
+    def test_reserved_key_is_not_run_twice(self):
+        from unittest import mock
+        from . import idempotency
+
+        self.assertTrue(idempotency.claim('vote:1:9', ttl=idempotency.PENDING_LEASE))
+        calls = []
+        with mock.patch.object(idempotency, 'WAIT_TIMEOUT', 0):
+            with self.assertRaises(idempotency.InProgress):
+                idempotency.run_once('vote:1:9', lambda: calls.append(1) or {'status': 'success'})
+        self.assertEqual(calls, [])
+        # A pending outcome releases the key instead of being replayed
+        idempotency.release('vote:1:9')
+        idempotency.run_once('vote:1:9', lambda: {'status': 'pending'}, store=lambda r: r['status'] != 'pending')
+        self.assertIsNone(idempotency.stored_result('vote:1:9'))
+        self.assertTrue(idempotency.claim('vote:1:9'))
+
+    def test_timed_out_update_keeps_its_key(self):
+        import concurrent.futures
+        from unittest import mock
+        from bot import webhook
+        from .idempotency import claim
+
+        future = concurrent.futures.Future()
+        runner = mock.Mock()
+        runner.process.side_effect = webhook.UpdateStillRunning(future)
+        with mock.patch.object(webhook, 'WEBHOOK_MODE', 'persistent'), \
+                mock.patch.object(webhook, 'get_webhook_runner', return_value=runner):
+            with self.assertRaises(webhook.UpdateStillRunning):
+                webhook.process_payload({'update_id': 77})
+        # Still running: a redelivery must be ignored
+        self.assertFalse(claim('update:77'))
+
+
+@override_settings(RATE_LIMITS={'vote': '2/min'}, RATE_LIMIT_PER_IP='', RATE_LIMIT_BACKEND='local')
+class RateLimitTests(TestCase):
+    """api/ratelimit.py - token bucket cheklovi"""
+
+    def setUp(self):
+        from .ratelimit import rate_limiter
+
+        rate_limiter.reset()
+        self.addCleanup(rate_limiter.reset)
+
+    def test_bucket_rejects_after_capacity_and_counts(self):
+        from .ratelimit import rate_limiter
+
+        self.assertTrue(rate_limiter.allow('vote', 1))
+        self.assertTrue(rate_limiter.allow('vote', 1))
+        self.assertFalse(rate_limiter.allow('vote', 1))
+        # Other users and unconfigured scopes are not affected
+        self.assertTrue(rate_limiter.allow('vote', 2))
+        self.assertTrue(rate_limiter.allow('register', 1))
+        self.assertEqual(rate_limiter.rejected_counts(), {'vote': 1})
+
+    def test_bucket_refills(self):
+        from .ratelimit import LocalBuckets
+
+        buckets = LocalBuckets()
+        self.assertEqual(buckets.take('k', 1, 0.05), 0)
+        self.assertGreater(buckets.take('k', 1, 0.05), 0)
+        time.sleep(0.06)
+        self.assertEqual(buckets.take('k', 1, 0.05), 0)
+
+    def test_full_bucket_table_drops_least_recently_used(self):
+        from unittest import mock
+        from .ratelimit import LocalBuckets
+
+        buckets = LocalBuckets()
+        with mock.patch('api.ratelimit.MAX_BUCKETS', 2):
+            buckets.take('limited', 1, 60)
+            buckets.take('a', 1, 60)
+            buckets.take('limited', 1, 60)
+            buckets.take('b', 1, 60)
+            # 'a' was evicted, the recently used (and empty) bucket survived
+            self.assertEqual(list(buckets._buckets), ['limited', 'b'])
+            self.assertGreater(buckets.take('limited', 1, 60), 0)
+
+    def test_internal_vote_is_limited(self):
+        from bot.api_client import APIClient
+        from .ratelimit import RATE_LIMITED_MESSAGE
+
+        client = APIClient()
+        data = {'telegram_id': 42, 'poll_id': 0, 'candidate_id': 0}
+        for _ in range(2):
+            self.assertNotEqual(client._handle_internal_post('votes/', data).get('message'), RATE_LIMITED_MESSAGE)
+        self.assertEqual(client._handle_internal_post('votes/', data)['message'], RATE_LIMITED_MESSAGE)
+
+    @override_settings(RATE_LIMITS={}, RATE_LIMIT_PER_IP='2/min', BOT_API_SECRET='s3cret')
+    def test_per_ip_limit_ignores_rotated_ids_but_not_the_bot(self):
+        from rest_framework.test import APIRequestFactory
+        from .views import check_subscription
+
+        factory = APIRequestFactory()
+        codes = [check_subscription(factory.get('/', {'telegram_id': i})).status_code for i in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+        request = factory.get('/', {'telegram_id': 5}, HTTP_X_BOT_SECRET='s3cret')
+        self.assertEqual(check_subscription(request).status_code, 200)
+
+    @override_settings(RATE_LIMITS={'register': '1/min', 'check_subscription': '1/min'})
+    def test_bootstrap_and_poll_status_are_limited(self):
+        from rest_framework.test import APIRequestFactory
+        from bot.api_client import APIClient
+        from .ratelimit import RATE_LIMITED_MESSAGE
+        from .views import PollViewSet, session_bootstrap
+
+        factory = APIRequestFactory()
+        bootstrap = lambda: session_bootstrap(factory.post('/', {'telegram_id': 42}, format='json'))
+        self.assertEqual(bootstrap().status_code, 200)
+        self.assertEqual(bootstrap().status_code, 429)
+        # A non-object JSON body is a client error, not a 500
+        self.assertEqual(session_bootstrap(factory.post('/', [1, 2], format='json')).status_code, 400)
+
+        poll = Poll.objects.create(title='Saylov')
+        view = PollViewSet.as_view({'get': 'status'}, **PollViewSet.status.kwargs)
+        self.assertEqual(view(factory.get('/', {'telegram_id': 7}), pk=poll.pk).status_code, 200)
+        self.assertEqual(view(factory.get('/', {'telegram_id': 7}), pk=poll.pk).status_code, 429)
+
+        client = APIClient()
+        client._handle_internal_get(f'polls/{poll.pk}/status/', {'telegram_id': 8})
+        self.assertEqual(
+            client._handle_internal_get(f'polls/{poll.pk}/status/', {'telegram_id': 8})['message'],
+            RATE_LIMITED_MESSAGE
+        )
+
+
+@override_settings(RESULT_SNAPSHOT_SETTLE_SECONDS=0, RESULT_SNAPSHOT_MAX_AGE=0)
+class ResultSnapshotTests(TestCase):
+    """api/snapshots.py - natijalar nusxasi"""
+
+    def setUp(self):
+        self.poll = Poll.objects.create(title='Saylov')
+        self.region = Region.objects.create(poll=self.poll, name='Toshkent')
+        self.district = District.objects.create(region=self.region, name='Chilonzor')
+        self.first = Candidate.objects.create(poll=self.poll, district=self.district, full_name='A')
+        self.second = Candidate.objects.create(poll=self.poll, district=self.district, full_name='B')
+        self.users = [TelegramUser.objects.create(telegram_id=i, full_name=f'U{i}') for i in range(1, 5)]
+
+    def _totals(self, snapshot, kind):
+        from .snapshots import snapshot_totals
+
+        return snapshot_totals(snapshot, kind)
+
+    def test_incremental_refresh_folds_only_new_votes(self):
+        from .snapshots import refresh_snapshot
+
+        Vote.objects.create(user=self.users[0], poll=self.poll, candidate=self.first)
+        snapshot = refresh_snapshot(self.poll.id)
+        self.assertEqual(snapshot.total_votes, 1)
+
+        for user in self.users[1:]:
+            Vote.objects.create(user=user, poll=self.poll, candidate=self.second)
+        snapshot = refresh_snapshot(self.poll.id)
+        self.assertEqual(snapshot.total_votes, 4)
+        self.assertEqual(self._totals(snapshot, 'candidate'), {self.first.id: 1, self.second.id: 3})
+        self.assertEqual(self._totals(snapshot, 'district'), {self.district.id: 4})
+        self.assertEqual(self._totals(snapshot, 'region'), {self.region.id: 4})
+
+    def test_deleted_vote_triggers_rebuild(self):
+        from .snapshots import get_snapshot
+
+        votes = [Vote.objects.create(user=user, poll=self.poll, candidate=self.first) for user in self.users]
+        self.assertEqual(get_snapshot(self.poll.id).total_votes, 4)
+
+        votes[0].delete()
+        snapshot = get_snapshot(self.poll.id)
+        self.assertEqual(snapshot.total_votes, 3)
+        self.assertEqual(self._totals(snapshot, 'candidate'), {self.first.id: 3})
+
+    def test_vote_committed_below_high_water_triggers_rebuild(self):
+        from .snapshots import get_snapshot, refresh_snapshot
+
+        # An id taken by a transaction that commits only after the later votes are folded in
+        placeholder = Vote.objects.create(user=self.users[0], poll=self.poll, candidate=self.second)
+        late_id = placeholder.id
+        placeholder.delete()
+        for user in self.users[1:]:
+            Vote.objects.create(user=user, poll=self.poll, candidate=self.first)
+        self.assertEqual(refresh_snapshot(self.poll.id).total_votes, 3)
+
+        Vote.objects.create(id=late_id, user=self.users[0], poll=self.poll, candidate=self.second)
+        self.assertTrue(refresh_snapshot(self.poll.id).needs_rebuild)
+        snapshot = get_snapshot(self.poll.id)
+        self.assertEqual(snapshot.total_votes, 4)
+        self.assertFalse(snapshot.needs_rebuild)
+
+    def test_statistics_top_ten_skips_inactive_candidates(self):
+        from rest_framework.test import APIRequestFactory
+        from .views import PollViewSet
+
+        candidates = [self.first, self.second] + [
+            Candidate.objects.create(poll=self.poll, district=self.district, full_name=f'N{i}') for i in range(10)
+        ]
+        for i, candidate in enumerate(candidates):
+            user = TelegramUser.objects.create(telegram_id=100 + i, full_name=f'V{i}')
+            Vote.objects.create(user=user, poll=self.poll, candidate=candidate)
+        # The most voted candidate is inactive
+        Vote.objects.create(user=self.users[0], poll=self.poll, candidate=self.first)
+        Candidate.objects.filter(pk=self.first.pk).update(is_active=False)
+
+        view = PollViewSet.as_view({'get': 'statistics'})
+        top = view(APIRequestFactory().get('/'), pk=self.poll.pk).data['top_candidates']
+        self.assertEqual(len(top), 10)
+        self.assertNotIn(self.first.id, [c['id'] for c in top])
+
+    def test_ranked_results_share_ranks_on_ties(self):
+        from .snapshots import ranked_results, refresh_snapshot
+
+        other = District.objects.create(region=self.region, name='Yunusobod')
+        third = Candidate.objects.create(poll=self.poll, district=other, full_name='C')
+        for user, candidate in zip(self.users, (self.first, self.first, self.second, self.second)):
+            Vote.objects.create(user=user, poll=self.poll, candidate=candidate)
+        snapshot = refresh_snapshot(self.poll.id)
+
+        rows = ranked_results(snapshot)
+        self.assertEqual([(r['id'], r['rank'], r['percentage']) for r in rows], [
+            (self.first.id, 1, 50.0), (self.second.id, 1, 50.0), (third.id, 3, 0.0)
+        ])
+        # Both candidates tied on first place are kept by top=1
+        self.assertEqual(len(ranked_results(snapshot, top=1)), 2)
+        self.assertEqual(
+            [(r['id'], r['total']) for r in ranked_results(snapshot, district_id=other.id)], [(third.id, 0)]
+        )
+
+
+class GlobalStatisticsTests(TestCase):
+    """api/global_stats.py - umumiy statistika va kesh"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+        poll = Poll.objects.create(title='Saylov')
+        region = Region.objects.create(poll=poll, name='Toshkent')
+        district = District.objects.create(region=region, name='Chilonzor')
+        candidate = Candidate.objects.create(poll=poll, district=district, full_name='Nomzod')
+        users = [TelegramUser.objects.create(telegram_id=i, full_name=f'U{i}', is_subscribed=i < 3) for i in range(1, 5)]
+        for user in users[:3]:
+            Vote.objects.create(user=user, poll=poll, candidate=candidate)
+
+    def test_statistics_values(self):
+        from .global_stats import compute_statistics
+
+        with self.assertNumQueries(4):
+            data = compute_statistics()
+        self.assertEqual(
+            (data['total_users'], data['subscribed_users'], data['voted_users'], data['total_votes']),
+            (4, 2, 3, 3)
+        )
+        self.assertEqual(data['regions'][0]['vote_count'], 3)
+        self.assertEqual(data['top_candidates'][0]['votes'], 3)
+        self.assertEqual(data['top_candidates'][0]['district'], 'Chilonzor')
+
+    def test_stale_copy_is_served_while_another_caller_recomputes(self):
+        from django.core.cache import cache
+        from .global_stats import CACHE_KEY, LOCK_KEY, get_statistics
+
+        first = get_statistics()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_statistics(), first)
+
+        # Expire the copy and pretend another worker holds the recompute lock
+        cached = cache.get(CACHE_KEY)
+        cached['fresh_until'] = 0
+        cache.set(CACHE_KEY, cached)
+        cache.add(LOCK_KEY, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_statistics(), first)
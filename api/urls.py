@@ -3,7 +3,8 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     TelegramUserViewSet, ChannelViewSet, PollViewSet, RegionViewSet,
     DistrictViewSet, CandidateViewSet, VoteViewSet,
-    statistics, check_subscription, poll_statistics, telegram_webhook
+    statistics, check_subscription, poll_statistics, telegram_webhook,
+    channel_memberships, channel_memberships_reset, session_bootstrap, catalog_version
 )
 
 router = DefaultRouter()
@@ -20,5 +21,9 @@ urlpatterns = [
     path('statistics/', statistics, name='statistics'),
     path('poll-statistics/', poll_statistics, name='poll-statistics'),
     path('check-subscription/', check_subscription, name='check-subscription'),
+    path('session/bootstrap/', session_bootstrap, name='session-bootstrap'),
+    path('catalog-version/', catalog_version, name='catalog-version'),
+    path('channel-memberships/', channel_memberships, name='channel-memberships'),
+    path('channel-memberships/reset/', channel_memberships_reset, name='channel-memberships-reset'),
     path('telegram/webhook/<str:token>/', telegram_webhook, name='telegram-webhook'),
 ]
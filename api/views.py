@@ -1,21 +1,42 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, action
+from rest_framework.decorators import api_view, action, permission_classes, throttle_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from django.db.models import Count, Q
-from .models import TelegramUser, Channel, Poll, Region, District, Candidate, Vote
+from django.db.models import Q
+from .models import TelegramUser, Channel, Poll, Region, District, Candidate, Vote, ResultSnapshotEntry
+from .memberships import lookup_memberships, record_memberships, reset_channel
+from .permissions import IsBotOrAdmin
+from .catalog import get_catalog, attach_vote_counts
+from .global_stats import get_statistics
+from .idempotency import InProgress, run_once
+from .ratelimit import scoped_throttle
+from .sessions import bootstrap_session, poll_status
+from .snapshots import get_snapshot, ranked_results, snapshot_totals
+from .voting import VOTE_PENDING, VotePending
 from .serializers import (
     TelegramUserSerializer, ChannelSerializer, PollSerializer, RegionSerializer,
     DistrictSerializer, CandidateSerializer, VoteSerializer, VoteCreateSerializer
 )
 
 
+def is_compact(request):
+    """?compact=1 - bot uchun ixcham javob (so'rovnoma katalogi keshidan)"""
+    return request.query_params.get('compact') in ('1', 'true')
+
+
+def catalog_response(catalog, data):
+    response = Response(data)
+    response['X-Catalog-Version'] = str(catalog.version)
+    return response
+
+
 class TelegramUserViewSet(viewsets.ModelViewSet):
     """Telegram foydalanuvchilar API"""
     queryset = TelegramUser.objects.all()
     serializer_class = TelegramUserSerializer
     lookup_field = 'telegram_id'
 
-    @action(detail=False, methods=['post'])
+    @action(detail=False, methods=['post'], throttle_classes=[scoped_throttle('register')])
     def register(self, request):
         """Foydalanuvchini ro'yxatdan o'tkazish yoki yangilash"""
         telegram_id = request.data.get('telegram_id')
@@ -72,42 +93,86 @@ class ChannelViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Channel.objects.filter(is_active=True)
     serializer_class = ChannelSerializer
 
+    @action(detail=True, methods=['post'], permission_classes=[IsBotOrAdmin])
+    def invite_link(self, request, pk=None):
+        """Bot yaratgan taklif havolasini saqlash"""
+        link = request.data.get('invite_link')
+        if not link:
+            return Response(
+                {'error': 'invite_link talab qilinadi'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        Channel.objects.filter(pk=self.get_object().pk).update(invite_link=link)
+        return Response({'status': 'success'})
+
 
 class PollViewSet(viewsets.ReadOnlyModelViewSet):
     """So'rovnomalar API (faqat o'qish)"""
     queryset = Poll.objects.filter(is_active=True)
     serializer_class = PollSerializer
+
+    def list(self, request, *args, **kwargs):
+        if is_compact(request):
+            catalog = get_catalog()
+            return catalog_response(catalog, {'results': catalog.poll_list()})
+        return super().list(request, *args, **kwargs)
     
     @action(detail=True, methods=['get'])
     def regions(self, request, pk=None):
         """Poll uchun viloyatlar"""
+        if not str(pk).isdigit():
+            return Response(
+                {'error': 'So\'rovnoma topilmadi'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if is_compact(request):
+            catalog = get_catalog()
+            return catalog_response(catalog, catalog.regions(pk))
         poll = self.get_object()
         regions = Region.objects.filter(poll=poll, is_active=True).prefetch_related('districts__candidates')
         serializer = RegionSerializer(regions, many=True)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'], throttle_classes=[scoped_throttle('check_subscription')])
+    def status(self, request, pk=None):
+        """Foydalanuvchi uchun: so'rovnoma ochiqmi va ovoz berganmi"""
+        telegram_id = request.query_params.get('telegram_id')
+        if not telegram_id or not telegram_id.lstrip('-').isdigit():
+            return Response(
+                {'error': 'telegram_id talab qilinadi (butun son)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not str(pk).isdigit():
+            return Response(
+                {'error': 'So\'rovnoma topilmadi'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(poll_status(telegram_id, pk))
+
     @action(detail=True, methods=['get'])
     def statistics(self, request, pk=None):
         """Poll statistikasi"""
         poll = self.get_object()
-        
-        total_votes = poll.total_votes
-        total_participants = poll.total_participants
+        # Served from the results snapshot (api/snapshots.py), refreshed incrementally
+        snapshot = get_snapshot(poll.id)
         
         # Viloyatlar bo'yicha
-        regions_stats = Region.objects.filter(poll=poll, is_active=True).annotate(
-            vote_count=Count('districts__candidates__votes')
-        ).values('id', 'name', 'vote_count').order_by('-vote_count')
+        region_votes = snapshot_totals(snapshot, ResultSnapshotEntry.KIND_REGION)
+        regions_stats = [
+            {'id': region['id'], 'name': region['name'], 'vote_count': region_votes.get(region['id'], 0)}
+            for region in Region.objects.filter(poll=poll, is_active=True).values('id', 'name')
+        ]
+        regions_stats.sort(key=lambda region: -region['vote_count'])
         
-        # Top nomzodlar
-        top_candidates = Candidate.objects.filter(
-            poll=poll, is_active=True
-        ).annotate(
-            vote_count=Count('votes')
-        ).select_related('district__region').order_by('-vote_count')[:10]
+        # Top nomzodlar (inactive ones are left out before taking 10)
+        top_votes = dict(snapshot.entries.filter(
+            kind=ResultSnapshotEntry.KIND_CANDIDATE,
+            object_id__in=Candidate.objects.filter(poll=poll, is_active=True).values('id'),
+        ).order_by('-votes').values_list('object_id', 'votes')[:10])
+        top_candidates = Candidate.objects.filter(id__in=top_votes).select_related('district__region')
         
         top_candidates_data = []
-        for c in top_candidates:
+        for c in sorted(top_candidates, key=lambda c: -top_votes[c.id]):
             district = c.district.name if c.district else None
             region = c.district.region.name if c.district else None
             top_candidates_data.append({
@@ -115,15 +180,16 @@ class PollViewSet(viewsets.ReadOnlyModelViewSet):
                 'name': c.full_name,
                 'district': district,
                 'region': region,
-                'votes': c.vote_count
+                'votes': top_votes[c.id]
             })
         
         return Response({
             'poll': PollSerializer(poll).data,
-            'total_votes': total_votes,
-            'total_participants': total_participants,
-            'regions': list(regions_stats),
-            'top_candidates': top_candidates_data
+            'total_votes': snapshot.total_votes,
+            'total_participants': snapshot.total_votes,
+            'regions': regions_stats,
+            'top_candidates': top_candidates_data,
+            'refreshed_at': snapshot.refreshed_at,
         })
 
 
@@ -144,11 +210,15 @@ class DistrictViewSet(viewsets.ReadOnlyModelViewSet):
     def by_region(self, request):
         """Viloyat bo'yicha tumanlarni olish"""
         region_id = request.query_params.get('region_id')
-        if not region_id:
+        if not region_id or not region_id.isdigit():
             return Response(
-                {'error': 'region_id parametri talab qilinadi'},
+                {'error': 'region_id parametri talab qilinadi (butun son)'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if is_compact(request):
+            catalog = get_catalog()
+            return catalog_response(catalog, catalog.districts(region_id))
+
         
         districts = self.queryset.filter(region_id=region_id)
         serializer = self.get_serializer(districts, many=True)
@@ -160,15 +230,27 @@ class CandidateViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Candidate.objects.filter(is_active=True).select_related('poll', 'district__region')
     serializer_class = CandidateSerializer
 
+    def retrieve(self, request, *args, **kwargs):
+        if is_compact(request):
+            catalog = get_catalog()
+            candidate = catalog.candidate(kwargs['pk']) if str(kwargs['pk']).isdigit() else None
+            if candidate is not None:
+                return catalog_response(catalog, candidate)
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=False, methods=['get'])
     def by_district(self, request):
         """Tuman bo'yicha nomzodlarni olish"""
         district_id = request.query_params.get('district_id')
-        if not district_id:
+        if not district_id or not district_id.isdigit():
             return Response(
-                {'error': 'district_id parametri talab qilinadi'},
+                {'error': 'district_id parametri talab qilinadi (butun son)'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if is_compact(request):
+            catalog = get_catalog()
+            return catalog_response(catalog, attach_vote_counts(catalog.district_candidates(district_id)))
+
         
         candidates = self.queryset.filter(district_id=district_id)
         serializer = self.get_serializer(candidates, many=True)
@@ -188,6 +270,19 @@ class CandidateViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = self.get_serializer(candidates, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['post'])
+    def photo_file_id(self, request, pk=None):
+        """Bot yuklagan rasmning Telegram file_id sini saqlash"""
+        candidate = self.get_object()
+        file_id = request.data.get('file_id')
+        if not file_id:
+            return Response(
+                {'error': 'file_id talab qilinadi'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        saved = candidate.remember_photo_file_id(file_id, request.data.get('photo'))
+        return Response({'status': 'success' if saved else 'stale'})
+
 
 class VoteViewSet(viewsets.ModelViewSet):
     """Ovozlar API"""
@@ -199,32 +294,52 @@ class VoteViewSet(viewsets.ModelViewSet):
             return VoteCreateSerializer
         return VoteSerializer
 
+    def get_throttles(self):
+        if self.action == 'create':
+            return [scoped_throttle('vote')()]
+        return super().get_throttles()
+
     def create(self, request, *args, **kwargs):
-        """Ovoz berish"""
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        vote = serializer.save()
-        
-        return Response({
+        """Ovoz berish. idempotency_key bilan takroriy so'rov birinchi javobni oladi"""
+        key = request.data.get('idempotency_key')
+        if key:
+            key = f"vote:{request.data.get('telegram_id')}:{key}"
+        try:
+            # A pending outcome is not stored: the retry checks the vote again
+            outcome = run_once(key, lambda: self._submit(request.data),
+                               store=lambda o: o['code'] != status.HTTP_202_ACCEPTED)
+        except InProgress:
+            outcome = {'code': status.HTTP_202_ACCEPTED, 'data': {'status': 'pending', 'message': VOTE_PENDING}}
+        return Response(outcome['data'], status=outcome['code'])
+
+    def _submit(self, data):
+        serializer = self.get_serializer(data=data)
+        try:
+            serializer.is_valid(raise_exception=True)
+            vote = serializer.save()
+        except ValidationError as e:
+            return {'code': status.HTTP_400_BAD_REQUEST, 'data': e.detail}
+        except VotePending as e:
+            # Buffered write still in flight: the client checks the poll status
+            return {'code': status.HTTP_202_ACCEPTED, 'data': {'status': 'pending', 'message': str(e)}}
+        return {'code': status.HTTP_201_CREATED, 'data': {
             'status': 'success',
             'message': 'Ovozingiz qabul qilindi!',
             'vote': VoteSerializer(vote).data
-        }, status=status.HTTP_201_CREATED)
+        }}
 
 
 @api_view(['GET'])
 def statistics(request):
-    """Umumiy statistika"""
-    total_users = TelegramUser.objects.count()
+    """Umumiy statistika (qisqa muddatli kesh bilan, api/global_stats.py)"""
+    return Response(get_statistics())
 
 
 # Webhook for Telegram (used when deploying via webhook instead of polling)
 from django.views.decorators.csrf import csrf_exempt
 from django.http import HttpResponse, JsonResponse
 import json
-import asyncio
-import telegram
-from bot.bot import create_application
+from bot.webhook import process_payload
 from bot.config import BOT_TOKEN as BOT_TOKEN_CONFIG
 
 import logging
@@ -245,78 +360,24 @@ def telegram_webhook(request, token=None):
         logger.error(f"Invalid JSON payload: {e}")
         return HttpResponse(status=400)
 
-    async def process_update_async(app, update):
-        try:
-            # Skip the redundant getMe() network call to Telegram on every webhook request
-            # This significantly speeds up response time on PythonAnywhere
-            await app.initialize()
-            await app.process_update(update)
-            # Explicitly save persistence state after processing
-            if app.persistence:
-                await app.update_persistence()
-            await app.shutdown()
-        except Exception as e:
-            logger.error(f"Async processing error: {e}", exc_info=True)
-
     try:
-        # Create a fresh application instance for this request
-        # This is required because we are using asyncio.run() which creates a new event loop
-        # Reusing a global application would cause it to be bound to a closed loop from a previous request.
-        app = create_application()
-        
-        # Manually decode update using the bot instance from the new app
-        update = telegram.Update.de_json(payload, app.bot)
-        
-        # Process asynchronously
-        asyncio.run(process_update_async(app, update))
-            
+        # Hand the update to the long-lived Application (see bot/webhook.py)
+        process_payload(payload)
     except Exception as e:
         logger.error(f"Error processing webhook update: {e}", exc_info=True)
         return JsonResponse({'ok': False, 'error': str(e)}, status=500)
 
     return JsonResponse({'ok': True})
-    total_votes = Vote.objects.count()
-    subscribed_users = TelegramUser.objects.filter(is_subscribed=True).count()
-    voted_users = TelegramUser.objects.filter(has_voted=True).count()
-    
-    # Viloyatlar bo'yicha statistika
-    regions_stats = Region.objects.filter(is_active=True).annotate(
-        vote_count=Count('districts__candidates__votes')
-    ).values('id', 'name', 'vote_count').order_by('-vote_count')
-    
-    # Top nomzodlar
-    top_candidates = Candidate.objects.filter(is_active=True).annotate(
-        vote_count=Count('votes')
-    ).select_related('district__region').order_by('-vote_count')[:10]
-    
-    top_candidates_data = []
-    for c in top_candidates:
-        district = c.district.name if c.district else None
-        region = c.district.region.name if c.district else None
-        top_candidates_data.append({
-            'id': c.id,
-            'name': c.full_name,
-            'district': district,
-            'region': region,
-            'votes': c.vote_count
-        })
-    
-    return Response({
-        'total_users': total_users,
-        'total_votes': total_votes,
-        'subscribed_users': subscribed_users,
-        'voted_users': voted_users,
-        'regions': list(regions_stats),
-        'top_candidates': top_candidates_data
-    })
 
 
 @api_view(['POST', 'GET'])
+@throttle_classes([scoped_throttle('check_subscription')])
 def check_subscription(request):
     """Foydalanuvchining obuna holatini tekshirish"""
     if request.method == 'POST':
-        telegram_id = request.data.get('telegram_id')
-        poll_id = request.data.get('poll_id')
+        data = request.data if isinstance(request.data, dict) else {}
+        telegram_id = data.get('telegram_id')
+        poll_id = data.get('poll_id')
     else:
         telegram_id = request.query_params.get('telegram_id')
         poll_id = request.query_params.get('poll_id')
@@ -344,6 +405,61 @@ def check_subscription(request):
         })
 
 
+@api_view(['POST'])
+@throttle_classes([scoped_throttle('register')])
+def session_bootstrap(request):
+    """/start: foydalanuvchini ro'yxatdan o'tkazish, obuna holati, kanallar va so'rovnomalar - bitta so'rovda"""
+    telegram_id = request.data.get('telegram_id') if isinstance(request.data, dict) else None
+    if not telegram_id or not str(telegram_id).lstrip('-').isdigit():
+        return Response(
+            {'error': 'telegram_id talab qilinadi (butun son)'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return Response(bootstrap_session(
+        telegram_id, request.data.get('username', ''), request.data.get('full_name', '')
+    ))
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsBotOrAdmin])
+def channel_memberships(request):
+    """Kanal a'zoligi indeksi: GET - tekshirish, POST - yozish"""
+    if request.method == 'POST':
+        entries = request.data.get('memberships') or []
+        try:
+            saved = record_memberships(entries)
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {'error': 'memberships ro\'yxati noto\'g\'ri'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({'status': 'success', 'saved': saved})
+
+    telegram_id = request.query_params.get('telegram_id')
+    channel_ids = [c for c in request.query_params.get('channel_ids', '').split(',') if c]
+    if not telegram_id:
+        return Response(
+            {'error': 'telegram_id talab qilinadi'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return Response({'memberships': lookup_memberships(telegram_id, channel_ids)})
+
+
+@api_view(['POST'])
+@permission_classes([IsBotOrAdmin])
+def channel_memberships_reset(request):
+    """Kanal bo'yicha a'zolik indeksini tozalash (bot admin bo'lmay qolganda)"""
+    deleted = reset_channel(request.data.get('chat_id'), request.data.get('chat_username'))
+    return Response({'status': 'success', 'deleted': deleted})
+
+
+@api_view(['GET'])
+def catalog_version(request):
+    """So'rovnoma katalogi versiyasi: bot keshlangan klaviaturalarini shu bilan tekshiradi"""
+    catalog = get_catalog()
+    return catalog_response(catalog, {'version': catalog.version})
+
+
 @api_view(['GET'])
 def poll_statistics(request):
     """So'rovnoma bo'yicha nomzodlarning ovoz statistikasi"""
@@ -356,36 +472,47 @@ def poll_statistics(request):
         )
     
     try:
-        poll = Poll.objects.get(id=poll_id)
-        candidates_stats = poll.candidates.annotate(
-            votes_count=Count('votes')
-        ).order_by('-votes_count').values(
-            'id', 'full_name', 'position', 'votes_count'
+        poll_id = int(poll_id)
+        district_id = int(request.query_params.get('district_id') or 0) or None
+        top = int(request.query_params.get('top') or 0) or None
+    except ValueError:
+        return Response(
+            {'error': 'poll_id, district_id va top butun son bo\'lishi kerak'},
+            status=status.HTTP_400_BAD_REQUEST
         )
-        
-        total_votes = poll.total_votes
-        
+
+    try:
+        poll = Poll.objects.get(id=poll_id)
+        # Served from the results snapshot (api/snapshots.py), refreshed incrementally;
+        # ranks (ties share a rank), percentages and the total come from one windowed query
+        snapshot = get_snapshot(poll.id)
+        results = ranked_results(snapshot, district_id=district_id, top=top)
+
+        if results:
+            total_votes = results[0]['total']
+        else:
+            total_votes = 0 if district_id else snapshot.total_votes
+
         stats_data = {
             'poll_id': poll.id,
             'poll_title': poll.title,
             'total_votes': total_votes,
-            'total_participants': poll.total_participants,
-            'candidates': []
+            # One vote per participant
+            'total_participants': total_votes,
+            'refreshed_at': snapshot.refreshed_at,
+            'candidates': [
+                {
+                    'rank': row['rank'],
+                    'candidate_id': row['id'],
+                    'full_name': row['full_name'],
+                    'position': row['position'],
+                    'votes': row['result_votes'],
+                    'percentage': row['percentage'],
+                }
+                for row in results
+            ]
         }
-        
-        rank = 1
-        for candidate in candidates_stats:
-            percentage = (candidate['votes_count'] / total_votes * 100) if total_votes > 0 else 0
-            stats_data['candidates'].append({
-                'rank': rank,
-                'candidate_id': candidate['id'],
-                'full_name': candidate['full_name'],
-                'position': candidate['position'],
-                'votes': candidate['votes_count'],
-                'percentage': round(percentage, 1)
-            })
-            rank += 1
-        
+
         return Response(stats_data)
     except Poll.DoesNotExist:
         return Response(
@@ -0,0 +1,175 @@
+"""Write-behind vote buffer (VOTE_BUFFER_ENABLED).
+
+Instead of one INSERT transaction per vote, validated votes are queued in
+this process and a background thread commits them with one
+bulk_create(ignore_conflicts=True) every VOTE_BUFFER_FLUSH_MS milliseconds
+or as soon as VOTE_BUFFER_MAX_ROWS are waiting. The caller still gets a
+synchronous answer: repeated votes are rejected from the in-memory
+"already voted" set, everything else waits for its flush, where rows
+skipped by the (user, poll) unique constraint are reported as rejected.
+Counters are applied in the same transaction (bulk_create skips
+Vote.save). Whatever is queued at exit is flushed by atexit.
+
+Batching only happens when one process has several callers at a time:
+threaded (gunicorn --threads / gthread), async or INTERNAL-mode bot
+workers. With the default sync gunicorn workers every batch holds a
+single vote that has waited up to the flush interval for nothing, so
+leave the buffer off there.
+
+A caller that gives up waiting (timeout) gets VotePending: the vote may
+still be written by the flush, so the client should check the vote
+status instead of voting again.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+from .counters import change_counts_many
+from .models import Vote
+
+logger = logging.getLogger(__name__)
+
+# The "already voted" set is only a shortcut, the unique constraint is the
+# real check, so it is simply dropped when it grows past this size
+SEEN_LIMIT = 200_000
+
+
+class PendingVote:
+    def __init__(self, vote):
+        self.vote = vote
+        self.done = threading.Event()
+        self.accepted = False
+        self.error = None
+        # Still queued or being written when the caller stopped waiting
+        self.timed_out = False
+
+
+class VoteBuffer:
+    """Ovozlarni yig'ib, bulk_create bilan yozuvchi navbat (jarayon uchun bitta)"""
+
+    def __init__(self, flush_interval: float, max_rows: int):
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self._queue = []
+        # (user_id, poll_id) of votes stored or queued by this process
+        self._seen = set()
+        self._queued = set()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='vote-buffer', daemon=True)
+        self._thread.start()
+
+    def submit(self, vote, timeout: float = 30) -> PendingVote:
+        """Ovozni navbatga qo'yish va yozilishini kutish"""
+        pending = PendingVote(vote)
+        key = (vote.user_id, vote.poll_id)
+        with self._cond:
+            seen, queued = key in self._seen, key in self._queued
+        # A stored vote may have been deleted since (admin), so a hit is
+        # confirmed with one indexed lookup instead of a write
+        if queued or (seen and Vote.objects.filter(user_id=vote.user_id, poll_id=vote.poll_id).exists()):
+            pending.done.set()
+            return pending
+        with self._cond:
+            if self._stopping:
+                pending.error = "stopped"
+                return pending
+            if key in self._queued:
+                pending.done.set()
+                return pending
+            if len(self._seen) >= SEEN_LIMIT:
+                self._seen.clear()
+            self._seen.add(key)
+            self._queued.add(key)
+            self._queue.append(pending)
+            if len(self._queue) >= self.max_rows:
+                self._cond.notify()
+        if not pending.done.wait(timeout):
+            pending.timed_out = True
+        return pending
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                # Woken early by submit() once max_rows votes are waiting
+                if len(self._queue) < self.max_rows and not self._stopping:
+                    self._cond.wait(self.flush_interval)
+                batch, self._queue = self._queue[:self.max_rows], self._queue[self.max_rows:]
+                stopping = self._stopping
+            if batch:
+                self.flush(batch)
+            elif stopping:
+                connection.close()
+                return
+
+    def flush(self, batch: list) -> None:
+        try:
+            with transaction.atomic():
+                self._insert(batch)
+        except Exception as e:
+            logger.error(f"Vote buffer flush of {len(batch)} votes failed: {e}")
+            for pending in batch:
+                pending.vote.pk = None
+                pending.error = str(e)
+            # The connection is kept between flushes; drop it only when broken
+            if isinstance(e, DatabaseError) and connection.connection is not None and not connection.is_usable():
+                connection.close()
+
+        for pending in batch:
+            vote = pending.vote
+            pending.accepted = vote.pk is not None
+            with self._cond:
+                self._queued.discard((vote.user_id, vote.poll_id))
+                if pending.error:
+                    # Not stored: the user may try again
+                    self._seen.discard((vote.user_id, vote.poll_id))
+            pending.done.set()
+
+    @staticmethod
+    def _insert(batch: list) -> None:
+        votes = [pending.vote for pending in batch]
+        Vote.objects.bulk_create(votes, ignore_conflicts=True)
+
+        # ignore_conflicts leaves pk unset: find our rows by their voted_at
+        ours = {(v.user_id, v.poll_id): v for v in votes}
+        rows = Vote.objects.filter(
+            user_id__in={v.user_id for v in votes}, poll_id__in={v.poll_id for v in votes}
+        ).values_list('id', 'user_id', 'poll_id', 'candidate_id', 'voted_at')
+        for pk, user_id, poll_id, candidate_id, voted_at in rows:
+            vote = ours.get((user_id, poll_id))
+            if vote is not None and vote.candidate_id == candidate_id and vote.voted_at == voted_at:
+                vote.pk = pk
+
+        change_counts_many(Counter((v.candidate_id, v.poll_id) for v in votes if v.pk is not None))
+
+    def stop(self) -> None:
+        """Navbatdagi hamma ovozlarni yozib, oqimni to'xtatish"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer() -> VoteBuffer:
+    """Jarayon uchun yagona VoteBuffer (birinchi ovozda yaratiladi)"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                buffer = VoteBuffer(settings.VOTE_BUFFER_FLUSH_MS / 1000, settings.VOTE_BUFFER_MAX_ROWS)
+                buffer.start()
+                atexit.register(buffer.stop)
+                _buffer = buffer
+    return _buffer
@@ -0,0 +1,86 @@
+"""Vote submission shared by the REST view and APIClient INTERNAL mode.
+
+User, poll and candidate are checked with one query. Duplicate votes are
+not looked up beforehand: the (user, poll) unique constraint rejects them
+at INSERT time, which also holds when the same user votes twice at once.
+With VOTE_BUFFER_ENABLED the INSERT is batched by api/vote_buffer.py.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import TelegramUser, Poll, Candidate, Vote
+
+ALREADY_VOTED = "Siz bu so'rovnomada allaqachon ovoz bergansiz!"
+VOTE_PENDING = "Ovozingiz qabul qilindi va saqlanmoqda. Birozdan keyin so'rovnomani qayta ochib, holatini tekshiring."
+
+
+class VoteRejected(Exception):
+    """Ovoz qabul qilinmadi (xabar foydalanuvchiga ko'rsatiladi)"""
+
+
+class VotePending(Exception):
+    """Ovoz navbatda, natijasi hali ma'lum emas (qayta ovoz berish o'rniga holatini tekshirish kerak)"""
+
+
+def _poll_is_open(row) -> bool:
+    now = timezone.now()
+    if row['poll__start_date'] and now < row['poll__start_date']:
+        return False
+    if row['poll__end_date'] and now > row['poll__end_date']:
+        return False
+    return True
+
+
+def _rejection_reason(telegram_id, poll_id) -> str:
+    # Only reached when the combined lookup found nothing
+    if not TelegramUser.objects.filter(telegram_id=telegram_id).exists():
+        return "Foydalanuvchi topilmadi!"
+    if not Poll.objects.filter(id=poll_id, is_active=True).exists():
+        return "So'rovnoma topilmadi!"
+    return "Nomzod topilmadi yoki bu so'rovnomaga tegishli emas!"
+
+
+def cast_vote(telegram_id, poll_id, candidate_id, ip_address=None) -> Vote:
+    """Ovozni saqlash; qabul qilinmasa VoteRejected"""
+    row = Candidate.objects.filter(
+        id=candidate_id, poll_id=poll_id, is_active=True, poll__is_active=True
+    ).annotate(
+        user_pk=Subquery(TelegramUser.objects.filter(telegram_id=telegram_id).values('id')[:1]),
+        user_name=Subquery(TelegramUser.objects.filter(telegram_id=telegram_id).values('full_name')[:1]),
+    ).values('user_pk', 'user_name', 'full_name', 'poll__title', 'poll__start_date', 'poll__end_date').first()
+
+    if row is None or row['user_pk'] is None:
+        raise VoteRejected(_rejection_reason(telegram_id, poll_id))
+    if not _poll_is_open(row):
+        raise VoteRejected("So'rovnoma yopiq!")
+
+    # Related rows are filled from the lookup, so serializing the vote needs no extra queries
+    vote = Vote(
+        user=TelegramUser(id=row['user_pk'], telegram_id=telegram_id, full_name=row['user_name']),
+        poll=Poll(id=poll_id, title=row['poll__title']),
+        candidate=Candidate(id=candidate_id, poll_id=poll_id, full_name=row['full_name']),
+        ip_address=ip_address,
+    )
+    if settings.VOTE_BUFFER_ENABLED:
+        return _buffered_save(vote)
+    try:
+        with transaction.atomic():
+            vote.save()
+    except IntegrityError:
+        raise VoteRejected(ALREADY_VOTED)
+    return vote
+
+
+def _buffered_save(vote) -> Vote:
+    from .vote_buffer import get_vote_buffer
+
+    pending = get_vote_buffer().submit(vote)
+    if pending.timed_out:
+        raise VotePending(VOTE_PENDING)
+    if pending.error:
+        raise VoteRejected("Ovozni saqlab bo'lmadi, birozdan keyin qayta urinib ko'ring.")
+    if not pending.accepted:
+        raise VoteRejected(ALREADY_VOTED)
+    return vote
@@ -0,0 +1,113 @@
+"""Hot candidate benchmark: direct counter columns vs sharded counters.
+
+Many threads vote for the same candidate at once, first with
+VOTE_COUNTER_SHARDS=0 (every vote updates the same candidate/district/
+region/poll rows) and then with the given shard count. After each run the
+shards are compacted and the counters are checked against the Vote table.
+Needs a migrated database (DATABASE_URL); row lock contention only shows on
+PostgreSQL - SQLite serializes all writers regardless.
+
+    python benchmarks/bench_hot_candidate.py --votes 2000 --threads 16 --shards 16
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_USER_BASE = 900_000_000
+
+
+def setup_poll(votes):
+    from api.models import Poll, Region, District, Candidate, TelegramUser
+
+    poll = Poll.objects.create(title='Bench: hot candidate')
+    region = Region.objects.create(poll=poll, name='Bench region')
+    district = District.objects.create(region=region, name='Bench district')
+    candidate = Candidate.objects.create(poll=poll, district=district, full_name='Hot candidate')
+    TelegramUser.objects.bulk_create(
+        [TelegramUser(telegram_id=BENCH_USER_BASE + i, full_name=f'Bench {i}') for i in range(votes)],
+        ignore_conflicts=True,
+    )
+    users = list(TelegramUser.objects.filter(
+        telegram_id__gte=BENCH_USER_BASE, telegram_id__lt=BENCH_USER_BASE + votes
+    ).values_list('id', flat=True))
+    return poll, candidate, users
+
+
+def run(shards, votes, threads):
+    from django.conf import settings
+    from django.db import OperationalError, close_old_connections, connection
+    from api.counters import compact_counters
+    from api.models import Poll, Candidate, Vote
+
+    settings.VOTE_COUNTER_SHARDS = shards
+    poll, candidate, users = setup_poll(votes)
+    retries = 0
+
+    def vote(user_id):
+        nonlocal retries
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA busy_timeout = 30000')
+        try:
+            for _ in range(10):
+                try:
+                    Vote.objects.create(user_id=user_id, poll=poll, candidate=candidate)
+                    return
+                except OperationalError:
+                    retries += 1
+            raise RuntimeError(f"Vote for user {user_id} failed")
+        finally:
+            close_old_connections()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(vote, users))
+    elapsed = time.perf_counter() - started
+
+    compact_counters()
+    expected = Vote.objects.filter(poll=poll).count()
+    counted = (
+        Candidate.objects.get(pk=candidate.pk).vote_count,
+        Poll.objects.get(pk=poll.pk).total_votes,
+    )
+    ok = counted == (expected, expected)
+
+    poll.delete()
+    return votes / elapsed, elapsed, retries, ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--votes', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--shards', type=int, default=16)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ovozber.settings')
+    import logging
+    import django
+    django.setup()
+    logging.disable(logging.INFO)
+
+    from django.db import connection
+    from api.models import TelegramUser
+
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode = WAL')
+
+    print(f"--- Hot candidate benchmark: {args.votes} votes, {args.threads} thread(s), {connection.vendor} ---")
+    for shards in (0, args.shards):
+        rate, elapsed, retries, ok = run(shards, args.votes, args.threads)
+        label = 'direct' if shards <= 1 else f'{shards} shards'
+        print(f"{label:>12}: {rate:8.1f} votes/sec  ({elapsed:.2f}s, retries={retries}, counters {'OK' if ok else 'MISMATCH'})")
+
+    TelegramUser.objects.filter(telegram_id__gte=BENCH_USER_BASE).delete()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""Statistics and listing endpoint benchmark on generated datasets.
+
+For every dataset size (votes; users = votes) the data is generated with
+`manage.py seed_scale --clear`, then each endpoint is requested --repeat
+times through its URL and view (no HTTP server). Wall time (min/median),
+query count and peak Python memory (tracemalloc, one extra run) are
+recorded and written as JSON, together with the git commit, so runs of
+different commits can be compared with --compare. The statistics cache and
+the results snapshot max-age are off (unless set in the environment), so
+repeated runs are cold computations, not cache hits. Needs a migrated
+database (DATABASE_URL); 10M votes is only practical on PostgreSQL.
+
+    python benchmarks/bench_statistics.py --sizes 10k,1M --output before.json
+    python benchmarks/bench_statistics.py --sizes 10k,1M --compare before.json
+"""
+import argparse
+import json
+import os
+import statistics as stats
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ENDPOINTS = {
+    'statistics': '/api/statistics/',
+    'poll_statistics': '/api/poll-statistics/?poll_id={poll}',
+    'poll_viewset_statistics': '/api/polls/{poll}/statistics/',
+    'poll_regions': '/api/polls/{poll}/regions/',
+    'regions_list': '/api/regions/',
+}
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def call(factory, path):
+    """So'rovni URL orqali view'ga yuborish va javobni to'liq render qilish"""
+    from django.urls import resolve
+
+    match = resolve(path.split('?')[0])
+    response = match.func(factory.get(path), *match.args, **match.kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+    return response.status_code
+
+
+def measure(factory, path, repeat):
+    from django.db import connection, reset_queries
+    from django.test.utils import CaptureQueriesContext
+
+    times = []
+    status_code = None
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            try:
+                status_code = call(factory, path)
+            except Exception as e:
+                return {'error': f"{type(e).__name__}: {e}"}
+            times.append(time.perf_counter() - started)
+        queries = len(captured)
+        reset_queries()
+
+    tracemalloc.start()
+    try:
+        call(factory, path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': status_code,
+        'min_ms': round(min(times) * 1000, 2),
+        'median_ms': round(stats.median(times) * 1000, 2),
+        'queries': queries,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"--- Compared with {baseline_path} (commit {baseline.get('commit')}) ---")
+    for size, endpoints in results['results'].items():
+        for name, current in endpoints.items():
+            before = baseline.get('results', {}).get(size, {}).get(name)
+            if not before or 'median_ms' not in before or 'median_ms' not in current:
+                continue
+            ratio = current['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+            print(
+                f"{size:>6} {name:>24}: {before['median_ms']:9.1f} -> {current['median_ms']:9.1f} ms"
+                f" (x{ratio:.2f}), queries {before['queries']} -> {current['queries']}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10k,1M,10M', help='Vote counts, e.g. 10k,1M,10M')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--candidates', type=int, default=5000)
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    parser.add_argument('--skip-seed', action='store_true', help='Use the dataset already in the database (one size)')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare with')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ovozber.settings')
+    # Seeded votes are brand new; let the results snapshot take them in right away
+    os.environ.setdefault('RESULT_SNAPSHOT_SETTLE_SECONDS', '0')
+    # Measure the computation, not cache hits: every run refreshes the snapshot
+    # and recomputes the statistics
+    os.environ.setdefault('RESULT_SNAPSHOT_MAX_AGE', '0')
+    os.environ.setdefault('STATISTICS_CACHE_TTL', '0')
+    import logging
+    import django
+    django.setup()
+    logging.disable(logging.WARNING)
+
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test import RequestFactory
+    from api.management.commands.seed_scale import SCALE_POLL_PREFIX
+    from api.models import Poll
+
+    factory = RequestFactory()
+    results = {
+        'commit': git_commit(),
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'database': connection.vendor,
+        'repeat': args.repeat,
+        'results': {},
+    }
+    for size_text in args.sizes.split(','):
+        size = parse_size(size_text)
+        if not args.skip_seed:
+            print(f"--- Seeding {size} votes ---")
+            call_command(
+                'seed_scale', clear=True, polls=1, users=size, votes=size,
+                candidates=min(args.candidates, size), stdout=open(os.devnull, 'w'),
+            )
+        poll = Poll.objects.filter(title__startswith=SCALE_POLL_PREFIX).order_by('-id').first()
+        if poll is None:
+            parser.error("No seed_scale poll in the database")
+
+        print(f"--- {size_text.strip()}: {size} votes, {connection.vendor} ---")
+        size_results = {}
+        for name in args.endpoints.split(','):
+            path = ENDPOINTS[name.strip()].format(poll=poll.id)
+            size_results[name] = result = measure(factory, path, args.repeat)
+            if 'error' in result:
+                print(f"{name:>24}: ERROR {result['error']}")
+            else:
+                print(
+                    f"{name:>24}: {result['median_ms']:9.1f} ms median ({result['min_ms']:.1f} min),"
+                    f" {result['queries']:4d} queries, {result['peak_kb']:9.1f} KB peak, HTTP {result['status']}"
+                )
+        results['results'][size_text.strip()] = size_results
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
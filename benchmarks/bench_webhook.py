@@ -0,0 +1,115 @@
+"""Webhook throughput benchmark: per-request Application vs long-lived Application.
+
+Sends synthetic callback updates (refer_friends, no API calls) through the
+telegram_webhook view against a local fake Bot API and prints updates/sec
+for both WEBHOOK_MODE values. Needs a migrated database (DATABASE_URL).
+
+    python benchmarks/bench_webhook.py --updates 300 --threads 4
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_telegram import FakeTelegramServer
+
+BENCH_TOKEN = '123456:bench-token'
+
+# Every mode and run gets fresh update_ids: processed ones are remembered as
+# idempotency keys and a repeated id would only measure duplicate rejection
+UPDATE_ID_BASE = int(time.time() * 1000)
+_update_ids = itertools.count(UPDATE_ID_BASE)
+
+
+def make_callback_update(update_id, user_id, data='refer_friends'):
+    now = int(time.time())
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': user,
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': 1, 'date': now, 'text': 'menu',
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': 100000001, 'is_bot': True, 'first_name': 'Bench'},
+            },
+        },
+    }
+
+
+def run(view, mode, updates, threads):
+    import bot.webhook as bot_webhook
+    from django.test import RequestFactory
+
+    bot_webhook.WEBHOOK_MODE = mode
+    factory = RequestFactory()
+    errors = 0
+
+    def send(i):
+        payload = make_callback_update(next(_update_ids), 1000 + i % 50)
+        request = factory.post(
+            f'/api/telegram/webhook/{BENCH_TOKEN}/', data=json.dumps(payload),
+            content_type='application/json'
+        )
+        return view(request, token=BENCH_TOKEN).status_code
+
+    # Warm-up (also starts the long-lived runner in persistent mode)
+    send(0)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for status_code in pool.map(send, range(updates)):
+            if status_code != 200:
+                errors += 1
+    elapsed = time.perf_counter() - started
+    return updates / elapsed, elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.0, help='Fake Bot API latency per call (s)')
+    parser.add_argument('--modes', default='per_request,persistent')
+    args = parser.parse_args()
+
+    server = FakeTelegramServer(latency=args.latency).start()
+    os.environ['BOT_TOKEN'] = BENCH_TOKEN
+    os.environ['TELEGRAM_API_URL'] = server.api_url
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ovozber.settings')
+
+    import logging
+    import django
+    django.setup()
+    logging.disable(logging.INFO)
+
+    from api.views import telegram_webhook
+    import bot.webhook as bot_webhook
+
+    from api.models import IdempotencyKey
+
+    print(f"--- Webhook benchmark: {args.updates} updates, {args.threads} thread(s) ---")
+    for mode in args.modes.split(','):
+        calls = sum(server.calls.values())
+        rate, elapsed, errors = run(telegram_webhook, mode.strip(), args.updates, args.threads)
+        print(f"{mode:>12}: {rate:8.1f} updates/sec  ({elapsed:.2f}s, errors={errors}, "
+              f"Bot API calls={sum(server.calls.values()) - calls})")
+
+    if bot_webhook._runner is not None:
+        bot_webhook._runner.stop()
+    print(f"Bot API calls: {server.calls}")
+    # Same digit count, so the string range matches the update_id range
+    IdempotencyKey.objects.filter(key__gte=f'update:{UPDATE_ID_BASE}', key__lt=f'update:{next(_update_ids)}').delete()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
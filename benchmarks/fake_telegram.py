@@ -0,0 +1,119 @@
+"""Local fake Telegram Bot API server for benchmarks and load tests.
+
+Answers every Bot API method with a canned successful response so the bot can
+be exercised without network access. Point the bot at it with
+TELEGRAM_API_URL=http://127.0.0.1:<port>/bot
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BOT_ID = 100000001
+
+
+def _message(chat_id, text=''):
+    return {
+        'message_id': int(time.time() * 1000) % 1000000,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'Bench'},
+        'text': text,
+    }
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _params(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        content_type = self.headers.get('Content-Type', '')
+        if 'application/json' in content_type:
+            try:
+                return json.loads(body or b'{}')
+            except ValueError:
+                return {}
+        if 'application/x-www-form-urlencoded' in content_type:
+            return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        return {}
+
+    def _result(self, method, params):
+        try:
+            chat_id = int(params.get('chat_id', 1))
+        except (TypeError, ValueError):
+            chat_id = 1
+        if method == 'getMe':
+            return {
+                'id': BOT_ID, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot',
+                'can_join_groups': False, 'can_read_all_group_messages': False,
+                'supports_inline_queries': False,
+            }
+        if method == 'getChatMember':
+            return {
+                'status': 'member',
+                'user': {'id': int(params.get('user_id') or 1), 'is_bot': False, 'first_name': 'User'},
+            }
+        if method == 'getChat':
+            return {'id': chat_id, 'type': 'channel', 'title': 'Bench', 'invite_link': 'https://t.me/+bench'}
+        if method == 'createChatInviteLink':
+            return {
+                'invite_link': 'https://t.me/+bench', 'creator': {'id': BOT_ID, 'is_bot': True, 'first_name': 'Bench'},
+                'creates_join_request': False, 'is_primary': False, 'is_revoked': False,
+            }
+        if method == 'sendPhoto':
+            message = _message(chat_id)
+            message['photo'] = [{'file_id': f'bench-photo-{chat_id}', 'file_unique_id': 'bench', 'width': 640, 'height': 640}]
+            return message
+        if method.startswith('send') or method.startswith('edit'):
+            return _message(chat_id, params.get('text', ''))
+        return True
+
+    def do_POST(self):
+        method = self.path.rstrip('/').rsplit('/', 1)[-1]
+        params = self._params()
+        self.server.record(method)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        body = json.dumps({'ok': True, 'result': self._result(method, params)}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST
+
+
+class FakeTelegramServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        super().__init__((host, port), FakeTelegramHandler)
+        self.latency = latency
+        self.calls = {}
+        self._calls_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def api_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def record(self, method):
+        with self._calls_lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-telegram', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,217 @@
+"""Load test: thousands of synthetic voters against the webhook and the vote API.
+
+Every simulated user walks the whole bot flow with synthetic Telegram
+updates posted to the telegram_webhook view:
+
+    /start -> poll -> region -> district -> candidate -> vote
+
+Users are started at a fixed arrival rate (open loop, --rate users/sec) and
+each user's updates are sent one after another, as Telegram would. Bot API
+calls go to a local fake server. With --target votes (or both) every user
+also posts straight to /api/votes/. Latency percentiles, throughput and
+error rates are printed per step. Needs a migrated database (DATABASE_URL);
+a dedicated poll and users are created for the run and deleted afterwards.
+
+    python benchmarks/loadtest.py --users 1000 --rate 100 --threads 32
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_webhook import BENCH_TOKEN, make_callback_update
+from benchmarks.fake_telegram import FakeTelegramServer
+
+LOADTEST_USER_BASE = 800_000_000
+
+# Unique per run: processed update_ids are remembered as idempotency keys
+UPDATE_ID_BASE = int(time.time() * 1000)
+_update_ids = itertools.count(UPDATE_ID_BASE)
+
+
+def make_start_update(user_id):
+    return {
+        'update_id': next(_update_ids),
+        'message': {
+            'message_id': 1, 'date': int(time.time()), 'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+        },
+    }
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class Stats:
+    """Qadam bo'yicha kechikishlar va xatolar"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, step, elapsed, ok):
+        with self._lock:
+            self.latencies[step].append(elapsed)
+            if not ok:
+                self.errors[step] += 1
+
+    def report(self, wall_time):
+        total = sum(len(v) for v in self.latencies.values())
+        errors = sum(self.errors.values())
+        print(f"{'step':>18} {'count':>7} {'err%':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for step, values in self.latencies.items():
+            print(
+                f"{step:>18} {len(values):7d} {100 * self.errors[step] / len(values):6.1f}"
+                f" {percentile(values, 50) * 1000:8.1f} {percentile(values, 95) * 1000:8.1f}"
+                f" {percentile(values, 99) * 1000:8.1f}"
+            )
+        print(f"Requests: {total} in {wall_time:.2f}s = {total / wall_time:.1f} req/s, errors: {errors} ({100 * errors / max(total, 1):.2f}%)")
+
+
+def seed_poll(users, candidates):
+    from api.models import Poll, Region, District, Candidate, TelegramUser
+
+    poll = Poll.objects.create(title='Load test')
+    region = Region.objects.create(poll=poll, name='Load region')
+    district = District.objects.create(region=region, name='Load district')
+    candidate_ids = [
+        Candidate.objects.create(poll=poll, district=district, full_name=f'Load candidate {i}').id
+        for i in range(candidates)
+    ]
+    # Pre-registered and subscribed: the vote API needs existing users and
+    # /start goes straight to the poll list without the channel check
+    TelegramUser.objects.bulk_create(
+        [TelegramUser(telegram_id=LOADTEST_USER_BASE + i, full_name=f'Load {i}', is_subscribed=True) for i in range(users)],
+        ignore_conflicts=True,
+    )
+    return poll, region, district, candidate_ids
+
+
+def cleanup(poll):
+    from api.models import IdempotencyKey, TelegramUser
+
+    poll.delete()
+    TelegramUser.objects.filter(telegram_id__gte=LOADTEST_USER_BASE, telegram_id__lt=LOADTEST_USER_BASE + 100_000_000).delete()
+    # Same digit count, so the string range matches the update_id range
+    IdempotencyKey.objects.filter(key__gte=f'update:{UPDATE_ID_BASE}', key__lt=f'update:{next(_update_ids)}').delete()
+    IdempotencyKey.objects.filter(key__regex=r'^vote:8\d{8}:').delete()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=50, help='New users per second')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--candidates', type=int, default=10)
+    parser.add_argument('--target', choices=['webhook', 'votes', 'both'], default='webhook')
+    parser.add_argument('--latency', type=float, default=0.0, help='Fake Bot API latency per call (s)')
+    parser.add_argument('--webhook-mode', default='persistent', help='bot.webhook WEBHOOK_MODE (persistent/per_request)')
+    args = parser.parse_args()
+
+    server = FakeTelegramServer(latency=args.latency).start()
+    os.environ['BOT_TOKEN'] = BENCH_TOKEN
+    os.environ['TELEGRAM_API_URL'] = server.api_url
+    # The bot inside the webhook talks to Django directly, as in production webhook mode
+    os.environ['API_BASE_URL'] = 'INTERNAL'
+    # Measure the server, not the per-user limits
+    for name in ('RATE_LIMIT_VOTE', 'RATE_LIMIT_REGISTER', 'RATE_LIMIT_CHECK_SUBSCRIPTION', 'RATE_LIMIT_PER_IP'):
+        os.environ[name] = ''
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ovozber.settings')
+
+    import logging
+    import django
+    django.setup()
+    logging.disable(logging.WARNING)
+
+    from django.db import close_old_connections
+    from django.test import RequestFactory
+    from api.views import telegram_webhook, VoteViewSet
+    import bot.webhook as bot_webhook
+
+    bot_webhook.WEBHOOK_MODE = args.webhook_mode
+    poll, region, district, candidate_ids = seed_poll(args.users, args.candidates)
+    close_old_connections()
+
+    factory = RequestFactory()
+    vote_view = VoteViewSet.as_view({'post': 'create'})
+    stats = Stats()
+
+    def post(step, view, path, payload, expected=(200, 201), **kwargs):
+        request = factory.post(path, data=json.dumps(payload), content_type='application/json')
+        started = time.perf_counter()
+        try:
+            status_code = view(request, **kwargs).status_code
+        except Exception:
+            status_code = 500
+        stats.record(step, time.perf_counter() - started, status_code in expected)
+
+    def webhook(step, payload):
+        post(step, telegram_webhook, f'/api/telegram/webhook/{BENCH_TOKEN}/', payload, token=BENCH_TOKEN)
+
+    def callback(user_id, data):
+        return make_callback_update(next(_update_ids), user_id, data)
+
+    def run_user(i):
+        user_id = LOADTEST_USER_BASE + i
+        candidate_id = candidate_ids[i % len(candidate_ids)]
+        try:
+            if args.target in ('webhook', 'both'):
+                webhook('start', make_start_update(user_id))
+                webhook('poll', callback(user_id, f'poll_{poll.id}'))
+                webhook('region', callback(user_id, f'region_{region.id}'))
+                webhook('district', callback(user_id, f'district_{district.id}'))
+                webhook('candidate', callback(user_id, f'candidate_{candidate_id}'))
+                webhook('vote', callback(user_id, f'vote_{candidate_id}'))
+            if args.target in ('votes', 'both'):
+                # After the webhook vote this is a duplicate and must be rejected (400)
+                post('api_vote', vote_view, '/api/votes/', {
+                    'telegram_id': user_id, 'poll_id': poll.id, 'candidate_id': candidate_id,
+                }, expected=(400,) if args.target == 'both' else (201,))
+        finally:
+            close_old_connections()
+
+    print(
+        f"--- Load test: {args.users} users at {args.rate}/s, {args.threads} thread(s), "
+        f"target={args.target}, webhook={args.webhook_mode} ---"
+    )
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            futures = []
+            for i in range(args.users):
+                # Open loop: users arrive on schedule even if the server falls behind
+                delay = started + i / args.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(run_user, i))
+            for future in futures:
+                future.result()
+        wall_time = time.perf_counter() - started
+        stats.report(wall_time)
+        from api.models import Vote
+        print(f"Votes stored: {Vote.objects.filter(poll=poll).count()} / {args.users}")
+    finally:
+        if bot_webhook._runner is not None:
+            bot_webhook._runner.stop()
+        cleanup(poll)
+        print(f"Bot API calls: {server.calls}")
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,135 +1,226 @@
-import requests
+import asyncio
+import time
+import httpx
 from typing import List, Dict, Optional
 import logging
-from bot.config import API_BASE_URL
+from bot.config import (
+    API_BASE_URL, API_TIMEOUT, API_MAX_CONNECTIONS, API_MAX_CONCURRENCY, API_CATALOG_VERSION_MAX_AGE, BOT_API_SECRET
+)
+from bot.orm import get_orm_executor, run_orm
 
 logger = logging.getLogger(__name__)
 
 
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+# INTERNAL endpoint -> api.ratelimit scope
+INTERNAL_RATE_LIMIT_SCOPES = {
+    'votes': 'vote',
+    'users/register': 'register',
+    'session/bootstrap': 'register',
+    'check-subscription': 'check_subscription',
+    'polls/<id>/status': 'check_subscription',
+}
+
+
+def _rate_limited(clean_ep: str, data) -> bool:
+    """REST dagi throttle'lar bilan bir xil foydalanuvchi cheklovi"""
+    parts = clean_ep.split('/')
+    if len(parts) == 3 and parts[0] == 'polls' and parts[2] == 'status':
+        clean_ep = 'polls/<id>/status'
+    scope = INTERNAL_RATE_LIMIT_SCOPES.get(clean_ep)
+    if not scope:
+        return False
+    from api.ratelimit import rate_limiter
+    telegram_id = data.get('telegram_id') if isinstance(data, dict) else None
+    return not rate_limiter.allow(scope, telegram_id)
+
+
 class APIClient:
     """Django API bilan aloqa qilish uchun klient"""
     
-    def __init__(self, base_url: str = API_BASE_URL):
+    def __init__(self, base_url: str = API_BASE_URL, timeout: float = API_TIMEOUT,
+                 max_connections: int = API_MAX_CONNECTIONS, max_concurrency: int = API_MAX_CONCURRENCY):
         # Use .strip() to remove hidden characters like \r or spaces from .env
         self.base_url = str(base_url).strip().rstrip('/')
         self.is_internal = self.base_url.upper() == 'INTERNAL'
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        # Keep-alive pool and concurrency limit, bound to the event loop they were created on
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+        # Last catalog version reported by the server and when (REST mode)
+        self._catalog_version = None
+        self._catalog_version_at = 0.0
         
         if self.is_internal:
-            import os
-            # Allow ORM calls from async context (Telegram bot event loop)
-            os.environ["DJANGO_ALLOW_ASYNC_UNSAFE"] = "true"
-            logger.info("APIClient is running in INTERNAL mode (Direct ORM access) with ASYNC_UNSAFE=true")
+            # ORM calls run in a bounded thread pool, never on the event loop
+            logger.info("APIClient is running in INTERNAL mode (Direct ORM access via thread pool)")
         else:
             logger.info(f"APIClient initialized with base_url: {self.base_url}")
 
-    def _get(self, endpoint: str, params: dict = None) -> dict:
+    def _get_client(self):
+        """Joriy event loop uchun httpx klient va semafor"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            # A new loop (e.g. asyncio.run per request) cannot reuse connections of a closed one
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                # Bot-only endpoints check it (api/permissions.py)
+                headers={'X-Bot-Secret': BOT_API_SECRET} if BOT_API_SECRET else None,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client, self._semaphore
+
+    async def aclose(self) -> None:
+        """HTTP ulanishlarni yopish"""
+        if self.is_internal:
+            get_orm_executor().log_stats()
+        if self._client is not None:
+            client, self._client = self._client, None
+            try:
+                await client.aclose()
+            except RuntimeError:
+                # Client belonged to an already closed loop
+                pass
+
+    async def _get(self, endpoint: str, params: dict = None, timeout: float = None) -> dict:
         """GET so'rov"""
         if self.is_internal:
-            return self._handle_internal_get(endpoint, params)
+            return await run_orm(self._handle_internal_get, endpoint, params)
 
         try:
+            client, semaphore = self._get_client()
             url = f"{self.base_url}/{endpoint}"
             logger.debug(f"GET request to: {url} with params: {params}")
-            response = requests.get(url, params=params)
+            async with semaphore:
+                response = await client.get(url, params=params, timeout=timeout or self.timeout)
             response.raise_for_status()
+            if 'X-Catalog-Version' in response.headers:
+                self._catalog_version = response.headers['X-Catalog-Version']
+                self._catalog_version_at = time.monotonic()
             result = response.json()
             logger.debug(f"Response: {result}")
             return result
-        except requests.RequestException as e:
+        except (httpx.HTTPError, ValueError) as e:
             logger.error(f"API GET error: {e}")
-            print(f"API xatolik: {e}")
             return {}
     
-    def _post(self, endpoint: str, data: dict) -> dict:
+    async def _post(self, endpoint: str, data: dict, timeout: float = None) -> dict:
         """POST so'rov"""
         if self.is_internal:
-            return self._handle_internal_post(endpoint, data)
+            return await run_orm(self._handle_internal_post, endpoint, data)
 
         try:
+            client, semaphore = self._get_client()
             url = f"{self.base_url}/{endpoint}"
-            response = requests.post(url, json=data)
+            async with semaphore:
+                response = await client.post(url, json=data, timeout=timeout or self.timeout)
             try:
                 response.raise_for_status()
-            except requests.HTTPError as http_err:
+            except httpx.HTTPStatusError as http_err:
                 try:
                     return response.json()
-                except Exception:
+                except ValueError:
                     logger.error(f"HTTP error: {http_err}")
-                    print(f"API xatolik: {http_err}")
                     return {}
             return response.json()
-        except requests.RequestException as e:
+        except (httpx.HTTPError, ValueError) as e:
             logger.error(f"API POST error: {e}")
-            print(f"API xatolik: {e}")
             return {}
 
     def _handle_internal_get(self, endpoint: str, params: dict = None) -> dict:
         """Internal Django logic for GET"""
-        from django.db import close_old_connections
-        from api.models import Channel, Poll, Region, District, Candidate, TelegramUser, Vote
+        from api.models import Candidate
+        from api.catalog import get_catalog, attach_vote_counts
         
         try:
-            # Clean up old/broken connections before query
-            close_old_connections()
-            
             # Clean endpoint for matching
             clean_ep = endpoint.strip('/')
+
+            if _rate_limited(clean_ep, params):
+                from api.ratelimit import RATE_LIMITED_MESSAGE
+                return {'status': 'error', 'message': RATE_LIMITED_MESSAGE}
             
             if clean_ep == 'channels':
-                channels = Channel.objects.filter(is_active=True)
-                return {'results': [{'id': c.id, 'channel_id': c.channel_id, 'channel_username': c.channel_username, 'title': c.title} for c in channels]}
+                from api.sessions import active_channels
+                return {'results': active_channels()}
             
             if clean_ep == 'polls':
-                polls = Poll.objects.filter(is_active=True)
-                return {'results': [{'id': p.id, 'title': p.title, 'is_open': p.is_open()} for p in polls]}
+                return {'results': get_catalog().poll_list()}
             
             if clean_ep.startswith('polls/') and clean_ep.endswith('/regions'):
                 poll_id = clean_ep.split('/')[1]
-                regions = Region.objects.filter(poll_id=poll_id, is_active=True)
-                return [{'id': r.id, 'name': r.name} for r in regions]
+                return get_catalog().regions(poll_id)
+            
+            if clean_ep.startswith('polls/') and clean_ep.endswith('/status'):
+                from api.sessions import poll_status
+                return poll_status(params['telegram_id'], clean_ep.split('/')[1])
             
             if clean_ep == 'districts/by_region':
                 region_id = params.get('region_id')
-                districts = District.objects.filter(region_id=region_id, is_active=True)
-                return [{'id': d.id, 'name': d.name} for d in districts]
+                return get_catalog().districts(region_id)
             
             if clean_ep == 'candidates/by_district':
                 district_id = params.get('district_id')
-                candidates = Candidate.objects.filter(district_id=district_id, is_active=True)
-                return [{'id': c.id, 'full_name': c.full_name, 'position': c.position, 'vote_count': c.vote_count} for c in candidates]
+                return attach_vote_counts(get_catalog().district_candidates(district_id))
             
             # Candidate detail: candidates/ID or just ID
             if clean_ep.startswith('candidates/') or clean_ep.isdigit():
                 candidate_id = clean_ep.split('/')[-1]
+                candidate = get_catalog().candidate(candidate_id)
+                if candidate is not None:
+                    return candidate
+                # Not in the catalog (inactive candidate)
                 c = Candidate.objects.get(id=candidate_id)
                 return {
                     'id': c.id, 'full_name': c.full_name, 'position': c.position, 
-                    'bio': c.bio, 'photo': c.photo.url if c.photo else None
+                    'bio': c.bio, 'photo': c.photo.url if c.photo else None,
+                    'photo_telegram': c.telegram_photo.url if c.photo else None,
+                    'photo_file_id': c.telegram_photo_file_id
                 }
 
+            if clean_ep == 'channel-memberships':
+                from api.memberships import lookup_memberships
+                channel_ids = [c for c in params.get('channel_ids', '').split(',') if c]
+                return {'memberships': lookup_memberships(params['telegram_id'], channel_ids)}
+
             if clean_ep == 'statistics':
-                return {
-                    'total_users': TelegramUser.objects.count(),
-                    'total_votes': Vote.objects.count()
-                }
+                from api.global_stats import get_statistics
+                return get_statistics()
 
         except Exception as e:
             logger.error(f"Internal GET error on {endpoint}: {e}")
-        finally:
-            # Crucial: Close connection AFTER query in internal/async mode
-            close_old_connections()
         return {}
 
     def _handle_internal_post(self, endpoint: str, data: dict) -> dict:
         """Internal Django logic for POST"""
-        from django.db import close_old_connections
-        from api.models import TelegramUser, Poll, Candidate, Vote
+        from api.models import TelegramUser, Channel, Candidate
         
         try:
-            # Clean up before query
-            close_old_connections()
-            
             clean_ep = endpoint.strip('/')
+
+            if _rate_limited(clean_ep, data):
+                from api.ratelimit import RATE_LIMITED_MESSAGE
+                return {'status': 'error', 'message': RATE_LIMITED_MESSAGE}
+            
+            if clean_ep == 'session/bootstrap':
+                from api.sessions import bootstrap_session
+                return bootstrap_session(data['telegram_id'], data.get('username', ''), data.get('full_name', ''))
+            
+            if clean_ep.startswith('channels/') and clean_ep.endswith('/invite_link'):
+                Channel.objects.filter(pk=clean_ep.split('/')[1]).update(invite_link=data['invite_link'])
+                return {'status': 'success'}
             
             if clean_ep == 'users/register':
                 user, created = TelegramUser.objects.update_or_create(
@@ -155,102 +246,181 @@ class APIClient:
                 except TelegramUser.DoesNotExist:
                     return {'is_subscribed': False}
             
+            if clean_ep.startswith('candidates/') and clean_ep.endswith('/photo_file_id'):
+                candidate = Candidate.objects.get(id=clean_ep.split('/')[1])
+                saved = candidate.remember_photo_file_id(data.get('file_id'), data.get('photo'))
+                return {'status': 'success' if saved else 'stale'}
+            
+            if clean_ep == 'channel-memberships':
+                from api.memberships import record_memberships
+                return {'status': 'success', 'saved': record_memberships(data.get('memberships') or [])}
+
+            if clean_ep == 'channel-memberships/reset':
+                from api.memberships import reset_channel
+                return {'status': 'success', 'deleted': reset_channel(data.get('chat_id'), data.get('chat_username'))}
+
             if clean_ep == 'votes':
-                user = TelegramUser.objects.get(telegram_id=data['telegram_id'])
-                poll = Poll.objects.get(id=data['poll_id'])
-                candidate = Candidate.objects.get(id=data['candidate_id'])
-                
-                # Check if poll is open
-                if not poll.is_open():
-                    return {'status': 'error', 'message': 'So\'rovnoma yopiq!'}
-                
-                # Check if already voted
-                if user.has_voted_in_poll(poll.id):
-                    return {'status': 'error', 'message': 'Siz bu so\'rovnomada allaqachon ovoz bergansiz!'}
-                
-                Vote.objects.create(user=user, poll=poll, candidate=candidate)
-                return {'status': 'success'}
+                from api.idempotency import InProgress, run_once
+                from api.voting import cast_vote, VOTE_PENDING, VotePending, VoteRejected
+
+                def submit():
+                    try:
+                        cast_vote(data['telegram_id'], data['poll_id'], data['candidate_id'])
+                    except VoteRejected as e:
+                        return {'status': 'error', 'message': str(e)}
+                    except VotePending as e:
+                        return {'status': 'pending', 'message': str(e)}
+                    return {'status': 'success'}
+
+                key = data.get('idempotency_key')
+                try:
+                    return run_once(f"vote:{data['telegram_id']}:{key}" if key else None, submit,
+                                    store=lambda r: r['status'] != 'pending')
+                except InProgress:
+                    return {'status': 'pending', 'message': VOTE_PENDING}
 
         except Exception as e:
             logger.error(f"Internal POST error on {endpoint}: {e}")
             return {'status': 'error', 'message': str(e)}
-        finally:
-            # Crucial: Close connection AFTER query
-            close_old_connections()
         return {}
     
     # Foydalanuvchilar
-    def register_user(self, telegram_id: int, username: str, full_name: str) -> dict:
+    async def register_user(self, telegram_id: int, username: str, full_name: str) -> dict:
         """Foydalanuvchini ro'yxatdan o'tkazish"""
-        return self._post('users/register/', {
+        return await self._post('users/register/', {
             'telegram_id': telegram_id,
             'username': username,
             'full_name': full_name
         })
     
-    def mark_subscribed(self, telegram_id: int) -> dict:
+    async def bootstrap_session(self, telegram_id: int, username: str, full_name: str) -> dict:
+        """/start uchun: ro'yxatdan o'tkazish, obuna holati, kanallar va so'rovnomalar (bitta so'rov)"""
+        return await self._post('session/bootstrap/', {
+            'telegram_id': telegram_id,
+            'username': username,
+            'full_name': full_name
+        })
+    
+    async def mark_subscribed(self, telegram_id: int) -> dict:
         """Foydalanuvchini obuna bo'lgan deb belgilash"""
-        return self._post(f'users/{telegram_id}/mark_subscribed/', {})
+        return await self._post(f'users/{telegram_id}/mark_subscribed/', {})
     
-    def check_subscription(self, telegram_id: int, poll_id: int = None) -> dict:
+    async def check_subscription(self, telegram_id: int, poll_id: int = None) -> dict:
         """Obuna holatini tekshirish"""
         data = {'telegram_id': telegram_id}
         if poll_id:
             data['poll_id'] = poll_id
-        return self._post('check-subscription/', data)
+        return await self._post('check-subscription/', data)
     
     # Kanallar
-    def get_channels(self) -> List[Dict]:
+    async def get_channels(self) -> List[Dict]:
         """Barcha faol kanallarni olish"""
-        result = self._get('channels/')
+        result = await self._get('channels/')
         return result.get('results', [])
     
+    async def get_memberships(self, telegram_id: int, channel_ids: List) -> Dict:
+        """A'zolik indeksidan yangi yozuvlar: {channel_id: is_member}"""
+        result = await self._get('channel-memberships/', {
+            'telegram_id': telegram_id,
+            'channel_ids': ','.join(str(c) for c in channel_ids)
+        })
+        return result.get('memberships', {})
+    
+    async def record_memberships(self, entries: List[Dict]) -> dict:
+        """A'zolik holatlarini indeksga yozish"""
+        return await self._post('channel-memberships/', {'memberships': entries})
+    
+    async def reset_channel_memberships(self, chat_id: int, chat_username: str = None) -> dict:
+        """Kanal a'zolik indeksini tozalash"""
+        return await self._post('channel-memberships/reset/', {
+            'chat_id': chat_id,
+            'chat_username': chat_username
+        })
+    
+    async def get_catalog_version(self):
+        """So'rovnoma katalogi versiyasi (noma'lum bo'lsa None)"""
+        if not self.is_internal:
+            # Cached keyboards are served without a request, so the version
+            # would otherwise only move when some catalog list is fetched
+            if time.monotonic() - self._catalog_version_at >= API_CATALOG_VERSION_MAX_AGE:
+                # Concurrent callers keep using the old value meanwhile
+                self._catalog_version_at = time.monotonic()
+                if not await self._get('catalog-version/'):
+                    return None
+            return self._catalog_version
+        from api.catalog import cached_version, current_version
+        version = cached_version()
+        if version is None:
+            try:
+                version = await run_orm(current_version)
+            except Exception as e:
+                logger.error(f"Catalog version error: {e}")
+        return version
+    
+    async def save_invite_link(self, channel_pk: int, invite_link: str) -> dict:
+        """Yopiq kanal uchun yaratilgan taklif havolasini saqlash"""
+        return await self._post(f'channels/{channel_pk}/invite_link/', {'invite_link': invite_link})
+    
     # So'rovnomalar
-    def get_polls(self) -> List[Dict]:
+    async def get_polls(self) -> List[Dict]:
         """Barcha faol so'rovnomalarni olish"""
-        result = self._get('polls/')
+        result = await self._get('polls/', {'compact': 1})
         return result.get('results', [])
     
+    async def get_poll_status(self, telegram_id: int, poll_id: int) -> dict:
+        """So'rovnoma ochiqmi va foydalanuvchi ovoz berganmi (bitta so'rov)"""
+        return await self._get(f'polls/{poll_id}/status/', {'telegram_id': telegram_id})
+    
     # Viloyatlar
-    def get_regions(self, poll_id: int = None) -> List[Dict]:
+    async def get_regions(self, poll_id: int = None) -> List[Dict]:
         """Poll bo'yicha viloyatlarni olish"""
         if poll_id:
-            result = self._get(f'polls/{poll_id}/regions/')
+            result = await self._get(f'polls/{poll_id}/regions/', {'compact': 1})
             return result if isinstance(result, list) else []
-        result = self._get('regions/')
+        result = await self._get('regions/')
         return result.get('results', [])
     
     # Tumanlar
-    def get_districts_by_region(self, region_id: int) -> List[Dict]:
+    async def get_districts_by_region(self, region_id: int) -> List[Dict]:
         """Viloyat bo'yicha tumanlarni olish"""
-        return self._get('districts/by_region/', {'region_id': region_id})
+        return await self._get('districts/by_region/', {'region_id': region_id, 'compact': 1})
     
     # Nomzodlar
-    def get_candidates_by_district(self, district_id: int) -> List[Dict]:
+    async def get_candidates_by_district(self, district_id: int) -> List[Dict]:
         """Tuman bo'yicha nomzodlarni olish"""
-        return self._get('candidates/by_district/', {'district_id': district_id})
+        return await self._get('candidates/by_district/', {'district_id': district_id, 'compact': 1})
     
-    def get_candidate_detail(self, candidate_id: int) -> dict:
+    async def get_candidate_detail(self, candidate_id: int) -> dict:
         """Nomzodning batafsil ma'lumotlarini olish"""
         # Ensure correct endpoint format for internal matcher
         endpoint = f"{candidate_id}/" if self.is_internal else f"candidates/{candidate_id}/"
-        return self._get(endpoint, {})
+        return await self._get(endpoint, {'compact': 1})
+    
+    async def save_photo_file_id(self, candidate_id: int, file_id: str, photo_url: str) -> dict:
+        """Nomzod rasmining Telegram file_id sini saqlash (keyingi safar qayta yuklanmaydi)"""
+        return await self._post(f'candidates/{candidate_id}/photo_file_id/', {
+            'file_id': file_id,
+            'photo': photo_url
+        })
     
     # Ovoz berish
-    def submit_vote(self, telegram_id: int, poll_id: int, candidate_id: int) -> dict:
-        """Ovoz berish"""
-        return self._post('votes/', {
+    async def submit_vote(self, telegram_id: int, poll_id: int, candidate_id: int, idempotency_key: str = None) -> dict:
+        """Ovoz berish. Bir xil idempotency_key bilan takroriy chaqiruv birinchi natijani qaytaradi"""
+        data = {
             'telegram_id': telegram_id,
             'poll_id': poll_id,
             'candidate_id': candidate_id
-        })
+        }
+        if idempotency_key:
+            data['idempotency_key'] = idempotency_key
+        return await self._post('votes/', data)
     
     # Statistika
-    def get_statistics(self) -> dict:
+    async def get_statistics(self) -> dict:
         """Umumiy statistikani olish"""
-        return self._get('statistics/')
+        return await self._get('statistics/')
     
-    def download_photo(self, photo_url: str) -> bytes:
+    async def download_photo(self, photo_url: str) -> bytes:
         """Rasmni download qilish"""
         try:
             if not photo_url:
@@ -266,8 +436,7 @@ class APIClient:
                 full_path = os.path.join(settings.MEDIA_ROOT, rel_path)
                 
                 if os.path.exists(full_path):
-                    with open(full_path, 'rb') as f:
-                        return f.read()
+                    return await asyncio.to_thread(_read_file, full_path)
             
             # Fallback to HTTP
             if photo_url.startswith('/media/'):
@@ -276,7 +445,9 @@ class APIClient:
                 photo_url = f"{self.base_url.replace('/api', '')}/media/{photo_url}"
             
             logger.debug(f"Downloading photo from: {photo_url}")
-            response = requests.get(photo_url, timeout=10)
+            client, semaphore = self._get_client()
+            async with semaphore:
+                response = await client.get(photo_url)
             response.raise_for_status()
             return response.content
         except Exception as e:
@@ -6,12 +6,15 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler,
     ContextTypes, ConversationHandler, PicklePersistence,
-    ChatJoinRequestHandler
+    ChatJoinRequestHandler, ChatMemberHandler
 )
 from bot.api_client import APIClient
+from bot.membership import MembershipChecker
+from bot.keyboards import Keyboards, build_districts_markup
 from bot.config import (
     BOT_TOKEN, BOT_USERNAME, WELCOME_MESSAGE, SUBSCRIPTION_CONFIRMED, 
-    VOTE_SUCCESS, ALREADY_VOTED, RUN_BOT_LOCAL, REFER_FRIENDS_MESSAGE
+    VOTE_SUCCESS, ALREADY_VOTED, RUN_BOT_LOCAL, REFER_FRIENDS_MESSAGE,
+    TELEGRAM_API_URL, BOT_PERSISTENCE, BOT_PERSISTENCE_INTERVAL
 )
 
 # Base directory for persistence
@@ -27,63 +30,79 @@ logger = logging.getLogger(__name__)
 # API klient
 api = APIClient()
 
+# Kanal a'zoligi tekshiruvchisi (TTL keshi va a'zolik indeksi bilan)
+membership = MembershipChecker(api)
+
+# Navigatsiya klaviaturalari keshi (katalog versiyasi bo'yicha)
+keyboards = Keyboards(api)
+
 # Conversation states
 CHECKING_SUBSCRIPTION, SELECTING_POLL, SELECTING_REGION, SELECTING_DISTRICT, SELECTING_CANDIDATE = range(5)
 
 
+async def channel_link(bot, channel: dict):
+    """Kanal havolasi: ochiq kanal - t.me/username, yopiq kanal - saqlangan yoki yangi taklif havolasi"""
+    username = channel.get('channel_username', '')
+    if username and not str(username).startswith('-') and not str(username).isdigit():
+        return f"https://t.me/{str(username).replace('@', '')}"
+
+    # Private channel: the link is created once and stored on the Channel row
+    if channel.get('invite_link'):
+        return channel['invite_link']
+    channel_id = channel['channel_id']
+    try:
+        chat = await bot.get_chat(channel_id)
+        link = chat.invite_link
+        if not link:
+            link_obj = await bot.create_chat_invite_link(channel_id)
+            link = link_obj.invite_link
+    except Exception as e:
+        logger.error(f"Failed to get/create link for {channel_id}: {e}")
+        return None
+    try:
+        await api.save_invite_link(channel['id'], link)
+    except Exception as e:
+        logger.error(f"Failed to save invite link for {channel_id}: {e}")
+    channel['invite_link'] = link
+    return link
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Start komandasi - botni boshlash"""
     user = update.effective_user
     
-    # Foydalanuvchini ro'yxatdan o'tkazish
-    api.register_user(
+    # Ro'yxatdan o'tkazish, obuna holati, kanallar va so'rovnomalar - bitta so'rovda
+    session = await api.bootstrap_session(
         telegram_id=user.id,
         username=user.username or '',
         full_name=user.full_name
     )
+    if session.get('status') == 'error' or 'channels' not in session or 'is_subscribed' not in session:
+        # Bootstrap failed or was throttled: fall back to the plain channel list,
+        # the channel check must not be skipped
+        session = {'is_subscribed': False, 'channels': await api.get_channels()}
+    polls = session.get('polls')
     
-    # Obuna holatini tekshirish (pollsiz)
-    status = api.check_subscription(user.id)
-    
-    if status.get('is_subscribed'):
+    if session['is_subscribed']:
         # Agar obuna bo'lgan bo'lsa, so'rovnomalarni ko'rsatish
-        return await show_polls(update, context)
+        return await show_polls(update, context, polls)
     
-    # Kanallarni ko'rsatish
-    channels = api.get_channels()
+    channels = session['channels']
     
     if not channels:
         # Kanal yo'q bo'lsa ham so'rovnomalarni ko'rsatish
-        return await show_polls(update, context)
+        return await show_polls(update, context, polls)
+    
+    # A'zolik yaqinda tasdiqlangan bo'lsa, Telegram'ga qayta so'rov yubormaslik
+    if membership.cached_all_member(user.id, channels):
+        await api.mark_subscribed(user.id)
+        return await show_polls(update, context, polls)
     
     message = WELCOME_MESSAGE
     keyboard = []
     
     for channel in channels:
-        channel_id = channel['channel_id']
-        username = channel.get('channel_username', '')
-        
-        # Determine link
-        if username and not str(username).startswith('-') and not str(username).isdigit():
-            link = f"https://t.me/{str(username).replace('@', '')}"
-        else:
-            # It's a private channel ID, try to get or create an invite link
-            if 'links' not in context.bot_data:
-                context.bot_data['links'] = {}
-            
-            link = context.bot_data['links'].get(channel_id)
-            if not link:
-                try:
-                    chat = await context.bot.get_chat(channel_id)
-                    link = chat.invite_link
-                    if not link:
-                        link_obj = await context.bot.create_chat_invite_link(channel_id)
-                        link = link_obj.invite_link
-                    context.bot_data['links'][channel_id] = link
-                except Exception as e:
-                    logger.error(f"Failed to get/create link for {channel_id}: {e}")
-                    link = None
-
+        link = await channel_link(context.bot, channel)
         if link:
             keyboard.append([
                 InlineKeyboardButton(f"📢 {channel['title']}", url=link)
@@ -108,29 +127,19 @@ async def check_subscription_callback(update: Update, context: ContextTypes.DEFA
     query = update.callback_query
     user_id = query.from_user.id
     
-    channels = api.get_channels()
-    not_subscribed = []
-    
-    for channel in channels:
-        try:
-            member = await context.bot.get_chat_member(chat_id=channel['channel_id'], user_id=user_id)
-            if member.status in ['left', 'kicked', 'left_member']:
-                not_subscribed.append(channel['title'])
-        except Exception as e:
-            logger.error(f"Subscription check error for {channel['channel_id']}: {e}")
-            # If bot is not admin in that channel, we can't check
-            continue
+    channels = await api.get_channels()
+    not_subscribed = await membership.not_subscribed(context.bot, user_id, channels)
 
     if not_subscribed:
         # User is not subscribed to some channels
-        channels_str = ", ".join(not_subscribed)
+        channels_str = ", ".join(channel['title'] for channel in not_subscribed)
         await query.answer(f"❌ Siz hali quyidagi kanallarga obuna bo'lmagansiz: {channels_str}", show_alert=True)
         return CHECKING_SUBSCRIPTION
 
     await query.answer()
     
     # Obunani tasdiqlash
-    api.mark_subscribed(user_id)
+    await api.mark_subscribed(user_id)
     
     try:
         await query.edit_message_text(SUBSCRIPTION_CONFIRMED)
@@ -146,9 +155,10 @@ async def check_subscription_callback(update: Update, context: ContextTypes.DEFA
     return await show_polls(update, context)
 
 
-async def show_polls(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+async def show_polls(update: Update, context: ContextTypes.DEFAULT_TYPE, polls: list = None) -> int:
     """So'rovnomalarni ko'rsatish"""
-    polls = api.get_polls()
+    if polls is None:
+        polls = await api.get_polls()
     
     if not polls:
         message = "⚠️ Hozircha faol so'rovnomalar mavjud emas."
@@ -202,14 +212,11 @@ async def select_poll(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     context.user_data['poll_id'] = poll_id
     user = query.from_user
     
-    # Poll holatini va user ovoz berganini tekshirish
-    status = api.check_subscription(user.id, poll_id)
+    # Poll holatini va user ovoz berganini tekshirish (bitta so'rov)
+    status = await api.get_poll_status(user.id, poll_id)
     
     # 1. Poll ochiqmi?
-    polls = api.get_polls()
-    current_poll = next((p for p in polls if p['id'] == poll_id), None)
-    
-    if current_poll and not current_poll.get('is_open'):
+    if status.get('is_open') is False:
         await query.answer("⚠️ Bu so'rovnoma yopilgan!", show_alert=True)
         return await show_polls(update, context)
 
@@ -276,9 +283,9 @@ async def show_regions(update: Update, context: ContextTypes.DEFAULT_TYPE, poll_
     if not poll_id:
         poll_id = context.user_data.get('poll_id')
         
-    regions = api.get_regions(poll_id)
+    reply_markup = await keyboards.regions(poll_id)
     
-    if not regions:
+    if reply_markup is None:
         message = "⚠️ Bu so'rovnoma uchun viloyatlar mavjud emas."
         if update.callback_query:
             await update.callback_query.message.reply_text(message)
@@ -286,20 +293,6 @@ async def show_regions(update: Update, context: ContextTypes.DEFAULT_TYPE, poll_
             await update.message.reply_text(message)
         return await show_polls(update, context) # Qaytish
     
-    keyboard = []
-    for region in regions:
-        keyboard.append([
-            InlineKeyboardButton(
-                f"📍 {region['name']}", 
-                callback_data=f"region_{region['id']}"
-            )
-        ])
-    
-    keyboard.append([
-        InlineKeyboardButton("◀️ So'rovnomalar", callback_data="back_to_polls")
-    ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
     message = "🗺 Viloyatingizni tanlang:"
     
     if update.callback_query:
@@ -326,10 +319,10 @@ async def select_region(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     region_id = int(query.data.split('_')[1])
     context.user_data['region_id'] = region_id
     
-    # Tumanlarni olish
-    districts = api.get_districts_by_region(region_id)
+    # Tumanlar klaviaturasi
+    reply_markup = await keyboards.districts(region_id)
     
-    if not districts:
+    if reply_markup is None:
         try:
             await query.edit_message_text("⚠️ Bu viloyatda tumanlar mavjud emas.")
         except Exception as e:
@@ -341,20 +334,6 @@ async def select_region(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
             await query.message.chat.send_message("⚠️ Bu viloyatda tumanlar mavjud emas.")
         return SELECTING_REGION # Viloyat tanlashda qolish
     
-    keyboard = []
-    for district in districts:
-        keyboard.append([
-            InlineKeyboardButton(
-                f"🏘 {district['name']}", 
-                callback_data=f"district_{district['id']}"
-            )
-        ])
-    
-    keyboard.append([
-        InlineKeyboardButton("◀️ Orqaga", callback_data="back_to_regions")
-    ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
     message = "🏘 Tumaningizni tanlang:"
     
     try:
@@ -378,10 +357,10 @@ async def select_district(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     district_id = int(query.data.split('_')[1])
     context.user_data['district_id'] = district_id
     
-    # Nomzodlarni olish
-    candidates = api.get_candidates_by_district(district_id)
+    # Nomzodlar klaviaturasi (ovozlar soni bilan)
+    reply_markup = await keyboards.candidates(district_id)
     
-    if not candidates:
+    if reply_markup is None:
         try:
             await query.edit_message_text("⚠️ Bu tumanda nomzodlar mavjud emas.")
         except Exception as e:
@@ -393,21 +372,6 @@ async def select_district(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             await query.message.chat.send_message("⚠️ Bu tumanda nomzodlar mavjud emas.")
         return SELECTING_DISTRICT
     
-    keyboard = []
-    for candidate in candidates:
-        vote_count = candidate.get('vote_count', 0)
-        keyboard.append([
-            InlineKeyboardButton(
-                f"[{vote_count}] {candidate['full_name']}" + (f" - {candidate['position']}" if candidate.get('position') else ""),
-                callback_data=f"candidate_{candidate['id']}"
-            )
-        ])
-    
-    keyboard.append([
-        InlineKeyboardButton("◀️ Orqaga", callback_data="back_to_districts")
-    ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
     message = "👤 Nomzodni tanlang:"
     
     try:
@@ -445,7 +409,7 @@ async def select_candidate(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         return await show_polls(update, context)
     
     # Nomzod ma'lumotlarini olish
-    candidate = api.get_candidate_detail(candidate_id)
+    candidate = await api.get_candidate_detail(candidate_id)
     logger.info(f"Candidate {candidate_id} details: {candidate}")
     
     if not candidate or 'full_name' not in candidate:
@@ -465,7 +429,8 @@ async def select_candidate(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     full_name = candidate.get('full_name', 'Nomalum')
     position = candidate.get('position', '')
     biography = candidate.get('bio', candidate.get('biography', ''))  # 'bio' yoki 'biography'
-    photo_url = candidate.get('photo', '')
+    # Telegram uchun kichraytirilgan variant (bo'lmasa asl rasm)
+    photo_url = candidate.get('photo_telegram') or candidate.get('photo', '')
     
     # Xabar tayyorlash
     message = f"👤 <b>{full_name}</b>"
@@ -484,10 +449,28 @@ async def select_candidate(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    # Rasmni download qilib yuborish (agar mavjud bo'lsa)
+    # Rasmni yuborish: avval saqlangan file_id, bo'lmasa download qilib yuklash
     if photo_url and isinstance(photo_url, str) and len(photo_url) > 5:
+        photo_file_id = candidate.get('photo_file_id')
+        if photo_file_id:
+            try:
+                # Eski xabarni o'chir va rasmli xabar jo'nat
+                try:
+                    await query.message.delete()
+                except:
+                    pass
+                await query.message.chat.send_photo(
+                    photo=photo_file_id,
+                    caption=message,
+                    parse_mode='HTML',
+                    reply_markup=reply_markup
+                )
+                return SELECTING_CANDIDATE
+            except Exception as e:
+                # file_id may be rejected (e.g. another bot token); upload again below
+                logger.warning(f"Cached photo file_id failed for candidate {candidate_id}: {e}")
         try:
-            photo_bytes = api.download_photo(photo_url)
+            photo_bytes = await api.download_photo(photo_url)
             if photo_bytes:
                 photo_file = BytesIO(photo_bytes)
                 photo_file.name = f"candidate_{candidate_id}.jpg"
@@ -496,12 +479,17 @@ async def select_candidate(update: Update, context: ContextTypes.DEFAULT_TYPE) -
                     await query.message.delete()
                 except:
                     pass
-                await query.message.chat.send_photo(
+                sent = await query.message.chat.send_photo(
                     photo=photo_file,
                     caption=message,
                     parse_mode='HTML',
                     reply_markup=reply_markup
                 )
+                if sent.photo:
+                    try:
+                        await api.save_photo_file_id(candidate_id, sent.photo[-1].file_id, photo_url)
+                    except Exception as e:
+                        logger.error(f"Saving photo file_id failed: {e}")
                 return SELECTING_CANDIDATE
         except Exception as e:
             logger.error(f"Photo send error: {e}")
@@ -540,8 +528,11 @@ async def submit_vote(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
             await query.message.chat.send_message("⚠️ Xatolik: So'rovnoma topilmadi.")
         return await show_polls(update, context)
     
-    # Ovoz berish
-    result = api.submit_vote(user.id, poll_id, candidate_id)
+    # Ovoz berish. A double tap or a redelivered update for the same vote
+    # message replays the first answer instead of "already voted"
+    vote_message = query.message
+    idempotency_key = f"{vote_message.chat.id}:{vote_message.message_id}" if vote_message else query.id
+    result = await api.submit_vote(user.id, poll_id, candidate_id, idempotency_key=idempotency_key)
     
     try:
         # Eski xabarni o'chir
@@ -570,7 +561,8 @@ async def submit_vote(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
                 error_message = non_field[0]
         if not error_message:
             error_message = 'Xatolik yuz berdi!'
-        message = f"❌ {error_message}"
+        # pending: the vote is still being written, not rejected
+        message = f"⏳ {error_message}" if result.get('status') == 'pending' else f"❌ {error_message}"
         # Xatolik bo'lsa ham polllarga qaytish tugmasini ko'rsatish
         keyboard = [[InlineKeyboardButton("◀️ So'rovnomalar", callback_data="back_to_polls")]]
         try:
@@ -611,23 +603,9 @@ async def back_to_districts(update: Update, context: ContextTypes.DEFAULT_TYPE)
         poll_id = context.user_data.get('poll_id')
         return await show_regions(update, context, poll_id)
     
-    # Tumanlarni olish
-    districts = api.get_districts_by_region(region_id)
-    
-    keyboard = []
-    for district in districts:
-        keyboard.append([
-            InlineKeyboardButton(
-                f"🏘 {district['name']}", 
-                callback_data=f"district_{district['id']}"
-            )
-        ])
-    
-    keyboard.append([
-        InlineKeyboardButton("◀️ Orqaga", callback_data="back_to_regions")
-    ])
+    # Tumanlar klaviaturasi (select_region bilan bir xil, keshdan)
+    reply_markup = await keyboards.districts(region_id) or build_districts_markup([])
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
     message = "🏘 Tumaningizni tanlang:"
     
     # Try to edit, if it fails (e.g., photo message), delete and send new message
@@ -654,21 +632,58 @@ async def approve_join_request(update: Update, context: ContextTypes.DEFAULT_TYP
         logger.error(f"Failed to approve join request: {e}")
 
 
+async def track_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Kanal a'zoligi o'zgarishlarini indeksga yozish"""
+    change = update.chat_member
+    try:
+        await membership.on_chat_member(
+            change.chat, change.new_chat_member.user.id, change.new_chat_member.status
+        )
+    except Exception as e:
+        logger.error(f"Failed to record membership change in {change.chat.id}: {e}")
+
+
+async def track_bot_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Botning kanaldagi huquqlari o'zgarishini kuzatish"""
+    change = update.my_chat_member
+    try:
+        await membership.on_bot_status(change.chat, change.new_chat_member.status)
+    except Exception as e:
+        logger.error(f"Failed to handle bot status change in {change.chat.id}: {e}")
+
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Bekor qilish"""
     await update.message.reply_text("Jarayon bekor qilindi. /start ni bosing.")
     return ConversationHandler.END
 
 
+async def close_api_client(application: Application) -> None:
+    """Application to'xtaganda API klient ulanishlarini yopish"""
+    await api.aclose()
+
+
+def create_persistence():
+    """Bot holatini saqlash uchun persistence tanlash"""
+    from django.apps import apps
+
+    # The database backend needs a configured Django (webhook, worker or INTERNAL mode)
+    if BOT_PERSISTENCE == 'django' and apps.ready:
+        from bot.persistence import DjangoPersistence
+        return DjangoPersistence(update_interval=BOT_PERSISTENCE_INTERVAL)
+    return PicklePersistence(filepath=os.path.join(BASE_DIR, "bot_state.pickle"))
+
+
 def create_application() -> Application:
     """Create and return a configured Application instance (no polling started)."""
-    # Persistence setup for webhook mode
-    persistence = PicklePersistence(filepath=os.path.join(BASE_DIR, "bot_state.pickle"))
+    persistence = create_persistence()
     
     application = (
         Application.builder()
         .token(BOT_TOKEN)
+        .base_url(TELEGRAM_API_URL)
         .persistence(persistence)
+        .post_shutdown(close_api_client)
         .build()
     )
 
@@ -728,6 +743,10 @@ def create_application() -> Application:
     
     # Join request handler (auto approve)
     application.add_handler(ChatJoinRequestHandler(approve_join_request))
+
+    # Kanal a'zoligi indeksi (bot kanalda admin bo'lishi va allowed_updates'da chat_member bo'lishi kerak)
+    application.add_handler(ChatMemberHandler(track_chat_member, ChatMemberHandler.CHAT_MEMBER))
+    application.add_handler(ChatMemberHandler(track_bot_member, ChatMemberHandler.MY_CHAT_MEMBER))
     
     return application
 
@@ -15,6 +15,50 @@ RUN_BOT_LOCAL = config('RUN_BOT_LOCAL', default='1')
 # Django API URL
 API_BASE_URL = config('API_BASE_URL', default='http://localhost:8000/api')
 
+# Backend bilan umumiy maxfiy kalit (Django sozlamalaridagi BOT_API_SECRET bilan bir xil), REST rejimida yuboriladi
+BOT_API_SECRET = config('BOT_API_SECRET', default='')
+
+# REST rejimidagi API klient sozlamalari
+API_TIMEOUT = config('API_TIMEOUT', default=10, cast=float)  # har bir so'rov uchun (sekund)
+API_MAX_CONNECTIONS = config('API_MAX_CONNECTIONS', default=20, cast=int)  # keep-alive pool hajmi
+API_MAX_CONCURRENCY = config('API_MAX_CONCURRENCY', default=20, cast=int)  # bir vaqtdagi so'rovlar soni
+API_CATALOG_VERSION_MAX_AGE = config('API_CATALOG_VERSION_MAX_AGE', default=5, cast=float)  # katalog versiyasi shundan eski bo'lsa qayta so'raladi (sekund)
+
+# INTERNAL rejimi: ORM so'rovlari bajariladigan thread pool hajmi (har bir thread o'z DB ulanishini saqlaydi)
+ORM_POOL_SIZE = config('ORM_POOL_SIZE', default=8, cast=int)
+
+# Telegram Bot API manzili (local Bot API server yoki test uchun almashtirish mumkin)
+TELEGRAM_API_URL = config('TELEGRAM_API_URL', default='https://api.telegram.org/bot')
+
+# Kanal a'zoligini tekshirish
+MEMBERSHIP_CHECK_CONCURRENCY = config('MEMBERSHIP_CHECK_CONCURRENCY', default=5, cast=int)  # parallel get_chat_member
+MEMBERSHIP_CACHE_TTL = config('MEMBERSHIP_CACHE_TTL', default=300, cast=float)  # a'zo bo'lsa (sekund)
+MEMBERSHIP_NEGATIVE_CACHE_TTL = config('MEMBERSHIP_NEGATIVE_CACHE_TTL', default=3, cast=float)  # a'zo bo'lmasa (sekund)
+MEMBERSHIP_CACHE_MAX_ENTRIES = config('MEMBERSHIP_CACHE_MAX_ENTRIES', default=100000, cast=int)
+
+# Bot holatini saqlash: 'django' (BotState jadvali, har bir foydalanuvchi alohida qator) yoki 'pickle' (bitta fayl)
+BOT_PERSISTENCE = config('BOT_PERSISTENCE', default='django')
+
+# Persistence o'zgarishlarini bazaga yozish oralig'i (sekund)
+BOT_PERSISTENCE_INTERVAL = config('BOT_PERSISTENCE_INTERVAL', default=1, cast=float)
+
+# Webhook rejimi:
+#   'persistent'  - bitta Application va event loop worker jarayoni davomida yashaydi (tavsiya etiladi)
+#   'per_request' - har bir update uchun yangi Application va asyncio.run() (eski usul)
+#   'queue'       - update bazadagi navbatga yoziladi va darhol 200 qaytariladi;
+#                   navbatni `python manage.py run_bot_worker` qayta ishlaydi
+WEBHOOK_MODE = config('WEBHOOK_MODE', default='persistent')
+
+# Navbat worker sozlamalari
+WEBHOOK_QUEUE_CONCURRENCY = config('WEBHOOK_QUEUE_CONCURRENCY', default=8, cast=int)  # parallel "yo'laklar" soni
+WEBHOOK_QUEUE_BATCH_SIZE = config('WEBHOOK_QUEUE_BATCH_SIZE', default=100, cast=int)
+WEBHOOK_QUEUE_POLL_INTERVAL = config('WEBHOOK_QUEUE_POLL_INTERVAL', default=0.2, cast=float)  # sekund
+WEBHOOK_QUEUE_RETENTION = config('WEBHOOK_QUEUE_RETENTION', default=3600, cast=int)  # bajarilgan/xato bo'lganlarni saqlash (sekund)
+WEBHOOK_QUEUE_MAX_ATTEMPTS = config('WEBHOOK_QUEUE_MAX_ATTEMPTS', default=3, cast=int)  # xato bo'lgan update'ni qayta urinishlar chegarasi
+
+# Bitta update'ni qayta ishlash uchun maksimal vaqt (sekund)
+WEBHOOK_PROCESS_TIMEOUT = config('WEBHOOK_PROCESS_TIMEOUT', default=25, cast=float)
+
 # Bot sozlamalasri
 WELCOME_MESSAGE = """
 🗳 Assalomu alaykum!
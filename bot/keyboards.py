@@ -0,0 +1,127 @@
+"""Ready-to-send inline keyboards for the poll navigation.
+
+Region and district keyboards are the same for every user, so they are
+built once per (level, id) and reused until the poll catalog version
+changes. The candidate keyboard also shows live vote counts: its buttons
+are cached per candidate and only the ones whose count changed are
+rebuilt.
+"""
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+
+class KeyboardCache:
+    """(level, id) -> tayyor klaviatura; katalog versiyasi o'zgarsa butunlay tozalanadi"""
+
+    def __init__(self):
+        self.version = None
+        self._entries = {}
+
+    def get(self, level: str, key_id, version):
+        if version is None or version != self.version:
+            return None
+        return self._entries.get((level, int(key_id)))
+
+    def set(self, level: str, key_id, version, value) -> None:
+        if version is None:
+            return
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+        self._entries[(level, int(key_id))] = value
+
+
+def build_regions_markup(regions: list) -> InlineKeyboardMarkup:
+    keyboard = [
+        [InlineKeyboardButton(f"📍 {region['name']}", callback_data=f"region_{region['id']}")]
+        for region in regions
+    ]
+    keyboard.append([InlineKeyboardButton("◀️ So'rovnomalar", callback_data="back_to_polls")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def build_districts_markup(districts: list) -> InlineKeyboardMarkup:
+    keyboard = [
+        [InlineKeyboardButton(f"🏘 {district['name']}", callback_data=f"district_{district['id']}")]
+        for district in districts
+    ]
+    keyboard.append([InlineKeyboardButton("◀️ Orqaga", callback_data="back_to_regions")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def _candidate_button(candidate: dict, vote_count: int) -> InlineKeyboardButton:
+    return InlineKeyboardButton(
+        f"[{vote_count}] {candidate['full_name']}" + (f" - {candidate['position']}" if candidate.get('position') else ""),
+        callback_data=f"candidate_{candidate['id']}"
+    )
+
+
+class CandidateKeyboard:
+    """Tuman nomzodlari klaviaturasi: faqat ovozlar soni o'zgargan tugmalar qayta yaratiladi"""
+
+    BACK_ROW = (InlineKeyboardButton("◀️ Orqaga", callback_data="back_to_districts"),)
+
+    def __init__(self):
+        # candidate_id -> (vote_count, row)
+        self._rows = {}
+        self._markup = None
+
+    def render(self, candidates: list) -> InlineKeyboardMarkup:
+        changed = self._markup is None or len(candidates) != len(self._rows)
+        rows = []
+        for candidate in candidates:
+            vote_count = candidate.get('vote_count', 0)
+            cached = self._rows.get(candidate['id'])
+            if cached is None or cached[0] != vote_count:
+                cached = (vote_count, (_candidate_button(candidate, vote_count),))
+                self._rows[candidate['id']] = cached
+                changed = True
+            rows.append(cached[1])
+        if changed:
+            rows.append(self.BACK_ROW)
+            self._markup = InlineKeyboardMarkup(rows)
+        return self._markup
+
+
+class Keyboards:
+    """Navigatsiya klaviaturalari keshi (bot jarayoni uchun bitta)"""
+
+    def __init__(self, api):
+        self.api = api
+        self.cache = KeyboardCache()
+
+    async def regions(self, poll_id):
+        """Viloyatlar klaviaturasi yoki None (viloyatlar yo'q)"""
+        version = await self.api.get_catalog_version()
+        markup = self.cache.get('regions', poll_id, version)
+        if markup is None:
+            regions = await self.api.get_regions(poll_id)
+            if not regions:
+                return None
+            markup = build_regions_markup(regions)
+            self.cache.set('regions', poll_id, version, markup)
+        return markup
+
+    async def districts(self, region_id):
+        """Tumanlar klaviaturasi yoki None (tumanlar yo'q)"""
+        version = await self.api.get_catalog_version()
+        markup = self.cache.get('districts', region_id, version)
+        if markup is None:
+            districts = await self.api.get_districts_by_region(region_id)
+            if not districts:
+                return None
+            markup = build_districts_markup(districts)
+            self.cache.set('districts', region_id, version, markup)
+        return markup
+
+    async def candidates(self, district_id):
+        """Nomzodlar klaviaturasi (joriy ovozlar soni bilan) yoki None"""
+        # Vote counts are live, so the list is always fetched; only the markup is reused
+        version = await self.api.get_catalog_version()
+        candidates = await self.api.get_candidates_by_district(district_id)
+        if not candidates:
+            return None
+        keyboard = self.cache.get('candidates', district_id, version)
+        if keyboard is None:
+            keyboard = CandidateKeyboard()
+            self.cache.set('candidates', district_id, version, keyboard)
+        return keyboard.render(candidates)
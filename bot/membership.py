@@ -0,0 +1,166 @@
+"""Channel membership checks for the mandatory subscription step.
+
+Answers come from, in order: the in-process per-(user, channel) TTL cache,
+the local membership index (ChannelMembership rows kept current by
+chat_member updates), and only then Telegram. get_chat_member calls for
+the remaining channels are fanned out concurrently, bounded by a
+semaphore to stay below Telegram flood limits, and written back to the
+index.
+"""
+import asyncio
+import logging
+import time
+
+from bot.config import (
+    MEMBERSHIP_CHECK_CONCURRENCY, MEMBERSHIP_CACHE_TTL,
+    MEMBERSHIP_NEGATIVE_CACHE_TTL, MEMBERSHIP_CACHE_MAX_ENTRIES
+)
+
+logger = logging.getLogger(__name__)
+
+NOT_MEMBER_STATUSES = ('left', 'kicked', 'left_member')
+
+
+class MembershipCache:
+    """(user_id, channel_id) -> a'zolik natijasi, TTL bilan"""
+
+    def __init__(self, ttl: float = MEMBERSHIP_CACHE_TTL, negative_ttl: float = MEMBERSHIP_NEGATIVE_CACHE_TTL,
+                 max_entries: int = MEMBERSHIP_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = {}
+
+    def get(self, user_id, channel_id):
+        """True/False yoki None (keshda yo'q yoki eskirgan)"""
+        entry = self._entries.get((user_id, str(channel_id)))
+        if entry is None:
+            return None
+        is_member, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[(user_id, str(channel_id))]
+            return None
+        return is_member
+
+    def set(self, user_id, channel_id, is_member: bool) -> None:
+        ttl = self.ttl if is_member else self.negative_ttl
+        if ttl <= 0:
+            self._entries.pop((user_id, str(channel_id)), None)
+            return
+        if len(self._entries) >= self.max_entries:
+            self._evict()
+        self._entries[(user_id, str(channel_id))] = (is_member, time.monotonic() + ttl)
+
+    def invalidate(self, user_id=None, channel_id=None) -> None:
+        """Foydalanuvchi va/yoki kanal bo'yicha keshni tozalash"""
+        if user_id is None and channel_id is None:
+            self._entries.clear()
+            return
+        for key in [k for k in self._entries
+                    if (user_id is None or k[0] == user_id)
+                    and (channel_id is None or k[1] == str(channel_id))]:
+            del self._entries[key]
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, (_, expires_at) in self._entries.items() if expires_at < now]:
+            del self._entries[key]
+        # Still full: drop the oldest half (dicts keep insertion order)
+        if len(self._entries) >= self.max_entries:
+            for key in list(self._entries)[:len(self._entries) // 2]:
+                del self._entries[key]
+
+
+class MembershipChecker:
+    """Kanallarga a'zolikni parallel tekshirish"""
+
+    def __init__(self, api=None, cache: MembershipCache = None, concurrency: int = MEMBERSHIP_CHECK_CONCURRENCY):
+        self.api = api
+        self.cache = cache or MembershipCache()
+        self.concurrency = concurrency
+        self._semaphore = None
+        self._loop = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    async def _ask_telegram(self, bot, user_id: int, channel_id):
+        """get_chat_member: holat (str) yoki None (tekshirib bo'lmadi)"""
+        try:
+            async with self._get_semaphore():
+                member = await bot.get_chat_member(chat_id=channel_id, user_id=user_id)
+        except Exception as e:
+            logger.error(f"Subscription check error for {channel_id}: {e}")
+            return None
+        return member.status
+
+    async def not_subscribed(self, bot, user_id: int, channels: list) -> list:
+        """Foydalanuvchi obuna bo'lmagan kanallar ro'yxati"""
+        results = {}
+        missing = []
+        for channel in channels:
+            cached = self.cache.get(user_id, channel['channel_id'])
+            if cached is None:
+                missing.append(channel)
+            else:
+                results[channel['channel_id']] = cached
+
+        if missing and self.api is not None:
+            indexed = await self.api.get_memberships(user_id, [c['channel_id'] for c in missing])
+            for channel in missing:
+                is_member = indexed.get(str(channel['channel_id']))
+                if is_member is not None:
+                    results[channel['channel_id']] = is_member
+                    self.cache.set(user_id, channel['channel_id'], is_member)
+            missing = [c for c in missing if c['channel_id'] not in results]
+
+        if missing:
+            statuses = await asyncio.gather(
+                *(self._ask_telegram(bot, user_id, channel['channel_id']) for channel in missing)
+            )
+            learned = []
+            for channel, member_status in zip(missing, statuses):
+                if member_status is None:
+                    # If bot is not admin in that channel, we can't check; don't block the user
+                    results[channel['channel_id']] = True
+                    continue
+                is_member = member_status not in NOT_MEMBER_STATUSES
+                results[channel['channel_id']] = is_member
+                self.cache.set(user_id, channel['channel_id'], is_member)
+                learned.append({'telegram_id': user_id, 'chat_id': channel['channel_id'], 'status': member_status})
+            if learned and self.api is not None:
+                await self.api.record_memberships(learned)
+
+        return [channel for channel in channels if not results[channel['channel_id']]]
+
+    async def on_chat_member(self, chat, user_id: int, member_status: str) -> None:
+        """chat_member update'i: kesh va indeksni yangilash"""
+        is_member = member_status not in NOT_MEMBER_STATUSES
+        self.cache.set(user_id, chat.id, is_member)
+        if chat.username:
+            self.cache.set(user_id, f"@{chat.username}", is_member)
+        if self.api is not None:
+            await self.api.record_memberships([{
+                'telegram_id': user_id, 'chat_id': chat.id,
+                'chat_username': chat.username, 'status': member_status,
+            }])
+
+    async def on_bot_status(self, chat, bot_status: str) -> None:
+        """my_chat_member update'i: bot admin bo'lmasa, kanal uchun update'lar kelmaydi - indeks eskiradi"""
+        if bot_status == 'administrator':
+            return
+        self.cache.invalidate(channel_id=chat.id)
+        if chat.username:
+            self.cache.invalidate(channel_id=f"@{chat.username}")
+        if self.api is not None:
+            await self.api.reset_channel_memberships(chat.id, chat.username)
+
+    def cached_all_member(self, user_id: int, channels: list) -> bool:
+        """Barcha kanallarga a'zolik keshda tasdiqlanganmi (Telegram'ga so'rovsiz)"""
+        return bool(channels) and all(
+            self.cache.get(user_id, channel['channel_id']) for channel in channels
+        )
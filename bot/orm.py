@@ -0,0 +1,126 @@
+"""Bounded thread pool for running Django ORM code from the bot's event loop.
+
+Each pool thread keeps its own persistent database connection (Django
+connections are thread-local), so queries no longer pay for a new
+connection and the event loop never blocks on the database.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bot.config import ORM_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Log a saturation warning at most this often (seconds)
+SATURATION_LOG_INTERVAL = 60
+
+
+class ORMExecutor:
+    """ORM chaqiruvlarini cheklangan thread pool'da bajarish"""
+
+    def __init__(self, max_workers: int = ORM_POOL_SIZE):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='orm')
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._max_queued = 0
+        self._submitted = 0
+        self._completed = 0
+        self._saturated = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._last_warning = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) ni pool thread'ida bajarib, natijani qaytarish"""
+        submitted_at = time.monotonic()
+        with self._lock:
+            self._submitted += 1
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+            if self._active + self._queued > self.max_workers:
+                self._saturated += 1
+                self._warn_saturated()
+
+        def call():
+            wait = time.monotonic() - submitted_at
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                _discard_broken_connection(e)
+                raise
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._completed += 1
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, call)
+
+    def stats(self) -> dict:
+        """Pool yuklanganlik ko'rsatkichlari"""
+        with self._lock:
+            return {
+                'pool_size': self.max_workers,
+                'active': self._active,
+                'queued': self._queued,
+                'max_queued': self._max_queued,
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'saturated': self._saturated,
+                'avg_wait_ms': round(self._total_wait / self._completed * 1000, 2) if self._completed else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 2),
+            }
+
+    def log_stats(self) -> None:
+        logger.info(f"ORM pool stats: {self.stats()}")
+
+    def shutdown(self) -> None:
+        self.log_stats()
+        self._executor.shutdown(wait=True)
+
+    def _warn_saturated(self) -> None:
+        now = time.monotonic()
+        if now - self._last_warning >= SATURATION_LOG_INTERVAL:
+            self._last_warning = now
+            logger.warning(
+                f"ORM pool saturated: {self._active} active, {self._queued} queued "
+                f"(pool_size={self.max_workers}, saturated calls so far={self._saturated})"
+            )
+
+
+def _discard_broken_connection(error: Exception) -> None:
+    """Uzilgan ulanishni yopish, keyingi chaqiruv yangisini ochadi"""
+    from django.db import connection, DatabaseError
+
+    if isinstance(error, DatabaseError) and connection.connection is not None:
+        if not connection.is_usable():
+            connection.close()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_orm_executor() -> ORMExecutor:
+    """Jarayon uchun yagona ORMExecutor"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ORMExecutor()
+    return _executor
+
+
+async def run_orm(fn, *args, **kwargs):
+    """Qisqa yo'l: get_orm_executor().run(...)"""
+    return await get_orm_executor().run(fn, *args, **kwargs)
@@ -0,0 +1,171 @@
+"""Database-backed persistence for the bot (replaces whole-file PicklePersistence).
+
+Every user/chat/conversation entry is a separate BotState row, so handling an
+update reads and writes only the rows of the user being handled. Writes that
+PTB issues in one persistence run are coalesced into a single bulk upsert,
+which keeps several gunicorn workers safe to share the same database.
+"""
+import asyncio
+import copy
+import json
+from collections import OrderedDict
+
+from django.db import connection, transaction
+from django.utils import timezone
+from telegram.ext import BasePersistence, PersistenceInput
+
+from bot.orm import run_orm
+
+# Row versions remembered per process; the least recently used are dropped
+SEEN_MAX_ENTRIES = 10_000
+
+
+class DjangoPersistence(BasePersistence):
+    """BotState jadvaliga asoslangan, qatorma-qator ishlaydigan persistence"""
+
+    def __init__(self, update_interval: float = 1):
+        # The bot keeps its state in user_data and bot_data only
+        super().__init__(
+            store_data=PersistenceInput(chat_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        # (kind, key) -> updated_at of the row version this process last read or wrote.
+        # A dropped entry only means the row is re-read on the next refresh.
+        self._seen = OrderedDict()
+        self._pending = {}
+        self._flush_task = None
+        self._last_bot_data = None
+
+    # --- Sync ORM helpers (run outside the event loop) ---
+
+    @staticmethod
+    def _load(kind, key):
+        from api.models import BotState
+        return BotState.objects.filter(kind=kind, key=key).values_list('data', 'updated_at').first()
+
+    @staticmethod
+    def _load_prefix(kind, prefix):
+        from api.models import BotState
+        return list(BotState.objects.filter(kind=kind, key__startswith=prefix).values_list('key', 'data'))
+
+    @staticmethod
+    def _store(entries):
+        from api.models import BotState
+        objs = [BotState(kind=kind, key=key, data=data, updated_at=updated_at)
+                for (kind, key), (data, updated_at) in entries.items()]
+        kwargs = {'update_conflicts': True, 'update_fields': ['data', 'updated_at']}
+        if connection.features.supports_update_conflicts_with_target:
+            kwargs['unique_fields'] = ['kind', 'key']
+        with transaction.atomic():
+            BotState.objects.bulk_create(objs, **kwargs)
+
+    @staticmethod
+    def _delete(kind, key):
+        from api.models import BotState
+        BotState.objects.filter(kind=kind, key=key).delete()
+
+    def _remember(self, entry_key, updated_at):
+        self._seen[entry_key] = updated_at
+        self._seen.move_to_end(entry_key)
+        while len(self._seen) > SEEN_MAX_ENTRIES:
+            self._seen.popitem(last=False)
+
+    # --- Batching ---
+
+    async def _write(self, kind, key, data):
+        # Handlers keep changing the live dict while the copy is stored on the ORM thread
+        self._pending[(kind, key)] = (copy.deepcopy(data), timezone.now())
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush_pending())
+        await asyncio.shield(self._flush_task)
+
+    async def _flush_pending(self):
+        # Let the other update_* coroutines of this persistence run enqueue first
+        await asyncio.sleep(0)
+        pending, self._pending = self._pending, {}
+        self._flush_task = None
+        if not pending:
+            return
+        await run_orm(self._store, pending)
+        for entry_key, (_, updated_at) in pending.items():
+            self._remember(entry_key, updated_at)
+
+    async def _refresh(self, kind, key, current: dict):
+        row = await run_orm(self._load, kind, key)
+        if row is None:
+            return
+        data, updated_at = row
+        # Only replace local data if another process wrote a newer version;
+        # otherwise the in-memory copy may hold changes that are not flushed yet.
+        if self._seen.get((kind, key)) != updated_at:
+            current.clear()
+            current.update(data or {})
+        self._remember((kind, key), updated_at)
+
+    # --- BasePersistence API ---
+
+    async def get_user_data(self):
+        # Loaded lazily per user in refresh_user_data()
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        row = await run_orm(self._load, 'bot', 'bot')
+        if row is None:
+            return {}
+        self._remember(('bot', 'bot'), row[1])
+        self._last_bot_data = row[0] or {}
+        return dict(self._last_bot_data)
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        prefix = f"{name}:"
+        rows = await run_orm(self._load_prefix, 'conversation', prefix)
+        return {tuple(json.loads(key[len(prefix):])): state for key, state in rows}
+
+    async def update_conversation(self, name, key, new_state):
+        await self._write('conversation', f"{name}:{json.dumps(list(key))}", new_state)
+
+    async def update_user_data(self, user_id, data):
+        await self._write('user', str(user_id), data)
+
+    async def update_chat_data(self, chat_id, data):
+        await self._write('chat', str(chat_id), data)
+
+    async def update_bot_data(self, data):
+        # PTB calls this on every persistence run; skip the write if nothing changed
+        if data == self._last_bot_data:
+            return
+        self._last_bot_data = copy.deepcopy(data)
+        await self._write('bot', 'bot', data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        await run_orm(self._delete, 'user', str(user_id))
+        self._seen.pop(('user', str(user_id)), None)
+
+    async def drop_chat_data(self, chat_id):
+        await run_orm(self._delete, 'chat', str(chat_id))
+        self._seen.pop(('chat', str(chat_id)), None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        await self._refresh('user', str(user_id), user_data)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        await self._refresh('chat', str(chat_id), chat_data)
+
+    async def refresh_bot_data(self, bot_data):
+        # bot_data only caches invite links; it is read once in get_bot_data()
+        pass
+
+    async def flush(self):
+        if self._flush_task is not None:
+            await self._flush_task
+        if self._pending:
+            await self._flush_pending()
@@ -47,10 +47,14 @@ def setup_webhook():
         return
 
     # Set webhook
-    telegram_url = f"https://api.telegram.org/bot{token}/setWebhook?url={webhook_url}"
+    telegram_url = f"https://api.telegram.org/bot{token}/setWebhook"
+    # chat_member is not delivered by default; the channel membership index needs it
+    allowed_updates = [
+        "message", "callback_query", "chat_join_request", "chat_member", "my_chat_member"
+    ]
     
     try:
-        response = requests.get(telegram_url)
+        response = requests.post(telegram_url, json={"url": webhook_url, "allowed_updates": allowed_updates})
         result = response.json()
         
         if result.get('ok'):
@@ -1,5 +1,6 @@
 import os
 import sys
+import asyncio
 import django
 from datetime import timedelta
 from django.utils import timezone
@@ -38,7 +39,7 @@ def test_poll_closing():
     client = APIClient(base_url='INTERNAL')
     
     print(f"Attempting to vote in closed poll (ID: {poll.id})...")
-    result = client.submit_vote(user.telegram_id, poll.id, candidate.id)
+    result = asyncio.run(client.submit_vote(user.telegram_id, poll.id, candidate.id))
     
     if result.get('status') == 'error' and 'yopiq' in result.get('message', ''):
         print("✅ Success: APIClient correctly rejected vote for closed poll.")
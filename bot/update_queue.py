@@ -0,0 +1,228 @@
+"""Durable webhook update queue (enqueue-and-acknowledge ingestion).
+
+The webhook view only stores the raw update in the WebhookUpdate table and
+returns 200. QueueWorker drains the table with a configurable number of
+concurrent lanes; every update of one user goes to the same lane, so a
+user's updates are always processed in the order Telegram sent them.
+A failed update is retried in place by its lane (the user's later updates
+wait behind it) until it has been tried WEBHOOK_QUEUE_MAX_ATTEMPTS times,
+then it stays FAILED until pruned.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from telegram import Update
+
+from bot.config import (
+    WEBHOOK_QUEUE_CONCURRENCY, WEBHOOK_QUEUE_BATCH_SIZE,
+    WEBHOOK_QUEUE_POLL_INTERVAL, WEBHOOK_QUEUE_RETENTION, WEBHOOK_QUEUE_MAX_ATTEMPTS
+)
+from bot.orm import run_orm
+
+logger = logging.getLogger(__name__)
+
+# How often finished rows are pruned (seconds)
+PRUNE_INTERVAL = 60
+# Pause before retrying a failed update, multiplied by the attempt number (seconds)
+RETRY_DELAY = 0.5
+
+
+def update_user_key(payload: dict) -> int:
+    """Update'ni yuborgan foydalanuvchi (yoki chat) ID si - tartib kaliti"""
+    for name, value in payload.items():
+        if name == 'update_id' or not isinstance(value, dict):
+            continue
+        sender = value.get('from') or value.get('user') or {}
+        if sender.get('id'):
+            return abs(int(sender['id']))
+        chat = value.get('chat') or {}
+        if chat.get('id'):
+            return abs(int(chat['id']))
+    return 0
+
+
+def enqueue_update(payload: dict) -> None:
+    """Update'ni navbatga yozish. Telegram qayta yuborgan update (takroriy update_id) e'tiborsiz qoldiriladi"""
+    from api.models import WebhookUpdate
+
+    WebhookUpdate.objects.bulk_create(
+        [WebhookUpdate(
+            update_id=payload['update_id'],
+            user_key=update_user_key(payload),
+            payload=payload,
+        )],
+        ignore_conflicts=True,
+    )
+
+
+class QueueWorker:
+    """WebhookUpdate navbatini bir nechta parallel yo'lakda qayta ishlash
+
+    Several worker processes may drain the same table as long as each one
+    gets its own shard (shard_index of shard_count); a shard owns all
+    updates of the users with user_key % shard_count == shard_index.
+    """
+
+    def __init__(self, application, concurrency: int = WEBHOOK_QUEUE_CONCURRENCY,
+                 shard_index: int = 0, shard_count: int = 1,
+                 batch_size: int = WEBHOOK_QUEUE_BATCH_SIZE,
+                 poll_interval: float = WEBHOOK_QUEUE_POLL_INTERVAL):
+        self.application = application
+        self.concurrency = concurrency
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._stopping = asyncio.Event()
+        self._lanes = []
+        self._in_flight = 0
+        self.processed = 0
+        self.failed = 0
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    # --- Sync ORM helpers ---
+
+    def _shard_queryset(self):
+        from api.models import WebhookUpdate
+
+        queryset = WebhookUpdate.objects.all()
+        if self.shard_count > 1:
+            queryset = queryset.annotate(
+                shard=F('user_key') % self.shard_count
+            ).filter(shard=self.shard_index)
+        return queryset
+
+    def _recover(self) -> int:
+        """Oldingi ishga tushirishda yarim qolgan update'larni navbatga qaytarish"""
+        from api.models import WebhookUpdate
+
+        ids = list(self._shard_queryset().filter(
+            status=WebhookUpdate.STATUS_PROCESSING
+        ).values_list('id', flat=True))
+        stuck = WebhookUpdate.objects.filter(id__in=ids)
+        # An update that keeps killing the worker is not retried forever
+        stuck.filter(attempts__gte=WEBHOOK_QUEUE_MAX_ATTEMPTS).update(
+            status=WebhookUpdate.STATUS_FAILED, error='Worker stopped while processing', processed_at=timezone.now()
+        )
+        return stuck.filter(status=WebhookUpdate.STATUS_PROCESSING).update(status=WebhookUpdate.STATUS_PENDING)
+
+    def _claim(self, limit: int) -> list:
+        from api.models import WebhookUpdate
+
+        queryset = self._shard_queryset().filter(status=WebhookUpdate.STATUS_PENDING).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Rows locked by another worker's claim are skipped, not claimed twice
+            queryset = queryset.select_for_update(skip_locked=True, of=('self',))
+        # Without row locks (SQLite) the database lock makes a concurrent
+        # claim fail instead; run() treats that as an empty batch
+        with transaction.atomic():
+            rows = list(queryset.values('id', 'user_key', 'payload', 'attempts')[:limit])
+            if rows:
+                WebhookUpdate.objects.filter(
+                    id__in=[row['id'] for row in rows]
+                ).update(status=WebhookUpdate.STATUS_PROCESSING, attempts=F('attempts') + 1)
+        return rows
+
+    @staticmethod
+    def _finish(row_id: int, attempts: int, error: str = None) -> None:
+        """attempts - shu jarayonda qilingan urinishlar bilan birga"""
+        from api.models import WebhookUpdate
+
+        WebhookUpdate.objects.filter(id=row_id).update(
+            status=WebhookUpdate.STATUS_FAILED if error else WebhookUpdate.STATUS_DONE,
+            attempts=attempts,
+            error=error,
+            processed_at=timezone.now(),
+        )
+
+    @staticmethod
+    def _prune() -> int:
+        from api.models import WebhookUpdate
+
+        deleted, _ = WebhookUpdate.objects.filter(
+            status__in=[WebhookUpdate.STATUS_DONE, WebhookUpdate.STATUS_FAILED],
+            processed_at__lt=timezone.now() - timedelta(seconds=WEBHOOK_QUEUE_RETENTION),
+        ).delete()
+        return deleted
+
+    # --- Async loop ---
+
+    async def run(self) -> None:
+        """Navbat bo'shatilishini to'xtatilguncha davom ettirish"""
+        recovered = await run_orm(self._recover)
+        if recovered:
+            logger.info(f"Re-queued {recovered} updates left in processing state")
+
+        self._lanes = [asyncio.Queue() for _ in range(self.concurrency)]
+        lane_tasks = [asyncio.create_task(self._lane(queue)) for queue in self._lanes]
+        last_prune = 0.0
+        loop = asyncio.get_running_loop()
+
+        try:
+            while not self._stopping.is_set():
+                if loop.time() - last_prune >= PRUNE_INTERVAL:
+                    last_prune = loop.time()
+                    await run_orm(self._prune)
+
+                # Backpressure: never hold more than a few batches in memory
+                capacity = self.batch_size * 2 - self._in_flight
+                try:
+                    rows = await run_orm(self._claim, min(self.batch_size, capacity)) if capacity > 0 else []
+                except DatabaseError as e:
+                    logger.warning(f"Could not claim queued updates: {e}")
+                    rows = []
+                for row in rows:
+                    self._in_flight += 1
+                    self._lanes[row['user_key'] % self.concurrency].put_nowait(row)
+
+                if len(rows) < self.batch_size:
+                    try:
+                        await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            # Drain what was already claimed, then stop the lanes
+            for queue in self._lanes:
+                queue.put_nowait(None)
+            await asyncio.gather(*lane_tasks)
+            logger.info(f"Queue worker stopped: processed={self.processed}, failed={self.failed}")
+
+    async def _process(self, row: dict):
+        """Bitta urinish; xato bo'lsa uning matni"""
+        try:
+            update = Update.de_json(row['payload'], self.application.bot)
+            await self.application.process_update(update)
+        except Exception as e:
+            logger.error(f"Queued update {row['id']} failed: {e}", exc_info=True)
+            return str(e)
+        return None
+
+    async def _lane(self, queue: asyncio.Queue) -> None:
+        while True:
+            row = await queue.get()
+            if row is None:
+                return
+            attempts = row['attempts'] + 1
+            try:
+                error = await self._process(row)
+                # Retried here, not re-queued: the user's later updates must not overtake it
+                while error and attempts < WEBHOOK_QUEUE_MAX_ATTEMPTS:
+                    await asyncio.sleep(RETRY_DELAY * attempts)
+                    attempts += 1
+                    error = await self._process(row)
+            finally:
+                self._in_flight -= 1
+            if error:
+                self.failed += 1
+            else:
+                self.processed += 1
+            try:
+                await run_orm(self._finish, row['id'], attempts, error)
+            except Exception as e:
+                logger.error(f"Could not mark queued update {row['id']} as finished: {e}")
@@ -1,8 +1,196 @@
-"""Minimal webhook Application instance for processing Telegram updates inside Django."""
+"""Webhook Application for processing Telegram updates inside Django.
+
+In 'persistent' mode a single initialized Application lives on a dedicated
+event loop thread for the whole life of the worker process; the Django view
+only decodes the payload and hands the update over. In 'queue' mode the
+view just stores the update (see bot/update_queue.py).
+"""
+import asyncio
+import atexit
+import concurrent.futures
+import logging
+import threading
+
+from telegram import Update
+
 from bot.bot import create_application
+from bot.config import WEBHOOK_MODE, WEBHOOK_PROCESS_TIMEOUT
+from bot.update_queue import enqueue_update
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateStillRunning(TimeoutError):
+    """Update vaqt chegarasida tugamadi, lekin loop'da hali bajarilmoqda"""
+
+    def __init__(self, future):
+        super().__init__("Update processing timed out")
+        self.future = future
+
+
+class WebhookRunner:
+    """Bitta Application va event loop'ni worker jarayoni davomida saqlaydi"""
+
+    def __init__(self, application_factory=create_application):
+        self._application_factory = application_factory
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self.application = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Event loop thread'ini ishga tushirish va Application'ni bir marta initialize qilish"""
+        with self._lock:
+            if self.is_running:
+                return
+
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=self._run_loop, args=(loop,),
+                name='telegram-webhook-loop', daemon=True
+            )
+            thread.start()
+
+            application = self._application_factory()
+            try:
+                asyncio.run_coroutine_threadsafe(self._startup(application), loop).result()
+            except Exception:
+                loop.call_soon_threadsafe(loop.stop)
+                thread.join()
+                loop.close()
+                raise
+
+            self._loop = loop
+            self._thread = thread
+            self.application = application
+            logger.info("Webhook Application started on a dedicated event loop")
+
+    def stop(self) -> None:
+        """Application'ni to'xtatish (persistence shu yerda saqlanadi)"""
+        with self._lock:
+            if not self.is_running:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(
+                    self._teardown(self.application), self._loop
+                ).result(timeout=WEBHOOK_PROCESS_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Webhook Application shutdown error: {e}", exc_info=True)
+            finally:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+                self._loop.close()
+                self._loop = None
+                self._thread = None
+                self.application = None
+
+    def process(self, payload: dict, timeout: float = WEBHOOK_PROCESS_TIMEOUT) -> None:
+        """Update'ni loop thread'ida qayta ishlash va natijasini kutish"""
+        if not self.is_running:
+            self.start()
+        update = Update.de_json(payload, self.application.bot)
+        future = asyncio.run_coroutine_threadsafe(
+            self.application.process_update(update), self._loop
+        )
+        try:
+            future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            # The coroutine is not cancelled, it keeps running on the loop
+            raise UpdateStillRunning(future) from None
+
+    @staticmethod
+    def _run_loop(loop) -> None:
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    @staticmethod
+    async def _startup(application) -> None:
+        await application.initialize()
+        # Starts the periodic persistence updater; updates are fed via process_update()
+        await application.start()
+
+    @staticmethod
+    async def _teardown(application) -> None:
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_webhook_runner() -> WebhookRunner:
+    """Jarayon uchun yagona WebhookRunner (birinchi so'rovda yaratiladi)"""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                runner = WebhookRunner()
+                runner.start()
+                atexit.register(runner.stop)
+                _runner = runner
+    return _runner
+
+
+def process_update_per_request(payload: dict) -> None:
+    """Eski usul: har bir update uchun yangi Application va yangi event loop"""
+
+    async def process_update_async(app, update):
+        try:
+            await app.initialize()
+            await app.process_update(update)
+            # Explicitly save persistence state after processing
+            if app.persistence:
+                await app.update_persistence()
+            await app.shutdown()
+        except Exception as e:
+            logger.error(f"Async processing error: {e}", exc_info=True)
+
+    # A fresh application is required because asyncio.run() creates a new event loop;
+    # a global application would stay bound to the loop closed by the previous request.
+    app = create_application()
+    update = Update.de_json(payload, app.bot)
+    asyncio.run(process_update_async(app, update))
+
+
+def _release_if_failed(key: str, future) -> None:
+    """Vaqt chegarasidan keyin xato bilan tugagan update kalitini bo'shatish"""
+    if future.cancelled() or future.exception() is not None:
+        from api.idempotency import release
+        # Done callbacks run on the event loop thread: keep the ORM off it
+        threading.Thread(target=release, args=(key,), daemon=True).start()
+
+
+def process_payload(payload: dict) -> None:
+    """Webhook payload'ini WEBHOOK_MODE bo'yicha qayta ishlash (yoki navbatga qo'yish)"""
+    if WEBHOOK_MODE == 'queue':
+        # The queue table is unique on update_id, redeliveries are dropped there
+        enqueue_update(payload)
+        return
 
-# Create a single application instance for webhook usage
-application = create_application()
+    from api.idempotency import claim, release
 
-# Expose bot for convenience
-bot = application.bot
+    key = f"update:{payload['update_id']}" if 'update_id' in payload else None
+    if key and not claim(key):
+        logger.info(f"Duplicate update {payload['update_id']} ignored")
+        return
+    try:
+        if WEBHOOK_MODE == 'per_request':
+            process_update_per_request(payload)
+        else:
+            get_webhook_runner().process(payload)
+    except UpdateStillRunning as e:
+        # Keep the key while the update still runs, else a redelivery is handled twice
+        if key:
+            e.future.add_done_callback(lambda future: _release_if_failed(key, future))
+        raise
+    except Exception:
+        # Let Telegram's redelivery try again
+        if key:
+            release(key)
+        raise
@@ -159,6 +159,57 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Kanal a'zoligi indeksi: chat_member update'lari kelmagan bo'lsa, yozuv shu vaqtdan keyin eskirgan hisoblanadi (sekund)
+MEMBERSHIP_INDEX_TTL = config('MEMBERSHIP_INDEX_TTL', default=86400, cast=int)
+
+# Bot va backend o'rtasidagi umumiy maxfiy kalit (REST rejimi, X-Bot-Secret sarlavhasi); faqat botga ochiq
+# endpoint'lar (a'zolik indeksi, taklif havolalari) shu kalitni talab qiladi. Bo'sh - faqat admin
+BOT_API_SECRET = config('BOT_API_SECRET', default='')
+
+# Nomzod rasmi variantlari (api/photos.py): Telegram uchun va admin uchun eng katta tomon (px)
+PHOTO_TELEGRAM_MAX_SIDE = config('PHOTO_TELEGRAM_MAX_SIDE', default=1280, cast=int)
+PHOTO_THUMB_MAX_SIDE = config('PHOTO_THUMB_MAX_SIDE', default=200, cast=int)
+# Nomzod saqlanganda variantlarni darhol yaratish (aks holda: manage.py build_photo_variants)
+PHOTO_VARIANTS_ON_SAVE = config('PHOTO_VARIANTS_ON_SAVE', default=True, cast=bool)
+
+# So'rovnoma katalogi keshi (api/catalog.py): boshqa jarayonlardagi o'zgarishlar necha sekundda bir tekshiriladi
+CATALOG_VERSION_CHECK_INTERVAL = config('CATALOG_VERSION_CHECK_INTERVAL', default=2, cast=float)
+
+# Ovoz hisoblagichlari bo'laklari soni (api/counters.py). 0/1 - ovoz to'g'ridan-to'g'ri ustunlarga yoziladi;
+# >1 - mashhur nomzod uchun qator qulfi raqobatini kamaytiradi, lekin manage.py compact_vote_counters ishlab turishi kerak
+VOTE_COUNTER_SHARDS = config('VOTE_COUNTER_SHARDS', default=0, cast=int)
+
+# Ovozlarni yig'ib yozish (api/vote_buffer.py): har VOTE_BUFFER_FLUSH_MS millisekundda yoki
+# VOTE_BUFFER_MAX_ROWS ta ovoz yig'ilganda bitta bulk INSERT bilan saqlanadi. Faqat ko'p oqimli (gunicorn --threads)
+# yoki async worker'lar uchun: Procfile'dagi sync worker'da har bir partiyada bitta ovoz bo'ladi va u shunchaki kutadi
+VOTE_BUFFER_ENABLED = config('VOTE_BUFFER_ENABLED', default=False, cast=bool)
+VOTE_BUFFER_FLUSH_MS = config('VOTE_BUFFER_FLUSH_MS', default=50, cast=int)
+VOTE_BUFFER_MAX_ROWS = config('VOTE_BUFFER_MAX_ROWS', default=500, cast=int)
+
+# Idempotentlik kalitlari (api/idempotency.py) qancha saqlanadi (sekund); Telegram update'larni 24 soatgacha qayta yuboradi
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=86400, cast=int)
+
+# So'rovlar cheklovi (api/ratelimit.py): har bir foydalanuvchi uchun "N/sec|min|hour|day", bo'sh - cheklovsiz
+RATE_LIMITS = {
+    'vote': config('RATE_LIMIT_VOTE', default='10/min'),
+    'register': config('RATE_LIMIT_REGISTER', default='20/min'),
+    'check_subscription': config('RATE_LIMIT_CHECK_SUBSCRIPTION', default='60/min'),
+}
+# Har bir IP uchun umumiy cheklov (REST): telegram_id ni almashtirib yuboradigan skriptlarga qarshi.
+# REST rejimidagi bot barcha foydalanuvchilar uchun bitta IP dan so'rov yuboradi - to'g'ri X-Bot-Secret
+# (BOT_API_SECRET) bilan kelgan so'rovlar bu cheklovdan ozod
+RATE_LIMIT_PER_IP = config('RATE_LIMIT_PER_IP', default='120/min')
+# local - jarayon ichida; cache - Django cache orqali barcha jarayonlar uchun umumiy
+RATE_LIMIT_BACKEND = config('RATE_LIMIT_BACKEND', default='local')
+
+# Natijalar nusxasi (api/snapshots.py): so'rovda nusxa shu sekunddan eski bo'lsa yangi ovozlar qo'shiladi
+RESULT_SNAPSHOT_MAX_AGE = config('RESULT_SNAPSHOT_MAX_AGE', default=5, cast=float)
+# Shu sekunddan yangi ovozlar keyingi safar qo'shiladi (hali commit qilinmagan, kichik ID li ovozlar o'tkazib yuborilmasligi uchun)
+RESULT_SNAPSHOT_SETTLE_SECONDS = config('RESULT_SNAPSHOT_SETTLE_SECONDS', default=2, cast=float)
+
+# Umumiy statistika (/api/statistics/) keshda qancha saqlanadi (sekund); 0 - keshsiz
+STATISTICS_CACHE_TTL = config('STATISTICS_CACHE_TTL', default=10, cast=int)
+
 # Security settings for production
 if not DEBUG:
     SECURE_SSL_REDIRECT = True